@@ -280,8 +280,9 @@ class ParkinsonAnalyzer:
         """生成個性化訓練計劃"""
         base_plan = self.training_templates.get(level, self.training_templates[3])
         
-        # 根據症狀分析調整計劃
+        # 根據症狀分析調整計劃 (複製練習列表，避免修改模板)
         adjusted_plan = base_plan.copy()
+        adjusted_plan['exercises'] = list(base_plan['exercises'])
         
         # 根據震顫程度調整
         if 'finger_analysis' in symptom_analysis:
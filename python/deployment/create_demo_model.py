@@ -6,8 +6,12 @@
 import tensorflow as tf
 import numpy as np
 import os
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from machine_learning.synthetic_data import SyntheticSensorGenerator
+
 def create_demo_cnn_lstm_model():
     """創建演示用的CNN-LSTM模型"""
     
@@ -43,48 +47,13 @@ def create_demo_cnn_lstm_model():
     print(f"✅ 模型創建完成，參數數量: {model.count_params()}")
     return model
 
-def generate_synthetic_data(num_samples=1000):
+def generate_synthetic_data(num_samples=1000, seed=None):
     """生成合成的帕金森症數據"""
     
     print("📊 生成合成訓練數據...")
     
-    X_train = []
-    y_train = []
-    
-    for level in range(5):  # 5個帕金森等級 (0-4)
-        for _ in range(num_samples // 5):
-            # 模擬不同等級的症狀特徵
-            if level == 0:  # 輕度
-                base_values = np.random.normal(0.2, 0.1, (50, 9))
-            elif level == 1:  # 輕中度
-                base_values = np.random.normal(0.4, 0.15, (50, 9))
-            elif level == 2:  # 中度
-                base_values = np.random.normal(0.6, 0.2, (50, 9))
-            elif level == 3:  # 中重度
-                base_values = np.random.normal(0.8, 0.25, (50, 9))
-            else:  # 重度
-                base_values = np.random.normal(1.0, 0.3, (50, 9))
-            
-            # 添加震顫模擬（高頻噪音）
-            tremor_intensity = level * 0.1
-            tremor = np.random.normal(0, tremor_intensity, (50, 9))
-            
-            # 添加運動不協調（低頻波動）
-            coordination_loss = level * 0.05
-            coordination = np.sin(np.linspace(0, 4*np.pi, 50)).reshape(-1, 1) * coordination_loss
-            coordination = np.repeat(coordination, 9, axis=1)
-            
-            # 合成最終數據
-            synthetic_data = base_values + tremor + coordination
-            
-            # 限制數值範圍
-            synthetic_data = np.clip(synthetic_data, 0, 1)
-            
-            X_train.append(synthetic_data)
-            y_train.append(level)
-    
-    X_train = np.array(X_train, dtype=np.float32)
-    y_train = np.array(y_train, dtype=np.int32)
+    generator = SyntheticSensorGenerator(profile='demo', seed=seed)
+    X_train, y_train = generator.generate(num_samples)
     
     print(f"✅ 生成數據完成: {X_train.shape}, 標籤: {y_train.shape}")
     return X_train, y_train
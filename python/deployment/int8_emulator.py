@@ -0,0 +1,812 @@
+"""
+TFLite Micro int8 參考模擬器
+不依賴TensorFlow，直接解析 .tflite 文件，以NumPy按 arduino/libraries/TensorFLowLite
+中 TFLite Micro 參考內核的定點語義 (QuantizeMultiplier、雙重舍入的
+MultiplyByQuantizedMultiplier、gemmlowp 定點 exp/tanh/logistic) 批次執行全整數模型，
+用於在主機上重現設備的輸出、逐層比較量化誤差以及量化改動的回歸測試
+"""
+
+import math
+import struct
+import numpy as np
+
+# 模擬器支持的內建算子 (schema 中的 BuiltinOperator 編號)
+BUILTIN_OPS = {
+    0: 'ADD', 3: 'CONV_2D', 6: 'DEQUANTIZE', 9: 'FULLY_CONNECTED', 14: 'LOGISTIC',
+    17: 'MAX_POOL_2D', 18: 'MUL', 22: 'RESHAPE', 25: 'SOFTMAX', 28: 'TANH', 34: 'PAD',
+    40: 'MEAN', 43: 'SQUEEZE', 60: 'PADV2', 70: 'EXPAND_DIMS', 114: 'QUANTIZE'
+}
+# 只用於錯誤信息的其他常見算子
+OTHER_OPS = {
+    1: 'AVERAGE_POOL_2D', 2: 'CONCATENATION', 4: 'DEPTHWISE_CONV_2D', 41: 'SUB',
+    44: 'UNIDIRECTIONAL_SEQUENCE_LSTM', 52: 'UNIDIRECTIONAL_SEQUENCE_RNN', 119: 'WHILE'
+}
+TENSOR_TYPES = {0: np.float32, 2: np.int32, 3: np.uint8, 4: np.int64, 7: np.int16, 9: np.int8}
+
+INT32_MIN = -(1 << 31)
+INT32_MAX = (1 << 31) - 1
+
+
+class _Table:
+    """flatbuffer 表的最小讀取器 (字段按 schema 中的聲明順序編號)"""
+
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+        self.vtable = pos - struct.unpack_from('<i', buf, pos)[0]
+        self.vtable_size = struct.unpack_from('<H', buf, self.vtable)[0]
+
+    def _field(self, index):
+        entry = 4 + 2 * index
+        if entry >= self.vtable_size:
+            return 0
+        offset = struct.unpack_from('<H', self.buf, self.vtable + entry)[0]
+        return self.pos + offset if offset else 0
+
+    def _target(self, index):
+        field = self._field(index)
+        return field + struct.unpack_from('<I', self.buf, field)[0] if field else 0
+
+    def scalar(self, index, fmt, default=0):
+        field = self._field(index)
+        return struct.unpack_from('<' + fmt, self.buf, field)[0] if field else default
+
+    def table(self, index):
+        target = self._target(index)
+        return _Table(self.buf, target) if target else None
+
+    def vector(self, index, dtype):
+        target = self._target(index)
+        if not target:
+            return np.zeros(0, dtype=dtype)
+        length = struct.unpack_from('<I', self.buf, target)[0]
+        return np.frombuffer(self.buf, dtype=np.dtype(dtype).newbyteorder('<'),
+                             count=length, offset=target + 4)
+
+    def tables(self, index):
+        target = self._target(index)
+        if not target:
+            return []
+        length = struct.unpack_from('<I', self.buf, target)[0]
+        positions = [target + 4 + 4 * i for i in range(length)]
+        return [_Table(self.buf, p + struct.unpack_from('<I', self.buf, p)[0]) for p in positions]
+
+    def string(self, index):
+        target = self._target(index)
+        if not target:
+            return ''
+        length = struct.unpack_from('<I', self.buf, target)[0]
+        return bytes(self.buf[target + 4:target + 4 + length]).decode('utf-8', 'replace')
+
+
+def _builtin_options(name, options):
+    """解析模擬器用到的算子選項"""
+    if options is None:
+        return {}
+    if name == 'CONV_2D':
+        return {'padding': options.scalar(0, 'b'), 'stride_w': options.scalar(1, 'i'),
+                'stride_h': options.scalar(2, 'i'), 'activation': options.scalar(3, 'b'),
+                'dilation_w': options.scalar(4, 'i', 1), 'dilation_h': options.scalar(5, 'i', 1)}
+    if name == 'MAX_POOL_2D':
+        return {'padding': options.scalar(0, 'b'), 'stride_w': options.scalar(1, 'i'),
+                'stride_h': options.scalar(2, 'i'), 'filter_w': options.scalar(3, 'i'),
+                'filter_h': options.scalar(4, 'i'), 'activation': options.scalar(5, 'b')}
+    if name == 'FULLY_CONNECTED':
+        return {'activation': options.scalar(0, 'b'), 'weights_format': options.scalar(1, 'b'),
+                'keep_num_dims': bool(options.scalar(2, 'B'))}
+    if name in ('ADD', 'MUL'):
+        return {'activation': options.scalar(0, 'b')}
+    if name == 'SOFTMAX':
+        return {'beta': options.scalar(0, 'f', 0.0)}
+    if name == 'MEAN':
+        return {'keep_dims': bool(options.scalar(0, 'B'))}
+    return {}
+
+
+def read_tflite(path):
+    """
+    讀取 .tflite 模型的主子圖
+
+    Returns:
+        dict: tensors (每個張量的名稱、形狀、類型、常量數據和量化參數)、
+              operators (算子名、輸入輸出張量和選項)、inputs、outputs
+    """
+    with open(path, 'rb') as f:
+        buf = f.read()
+
+    model = _Table(buf, struct.unpack_from('<I', buf, 0)[0])
+    opcodes = []
+    for code in model.tables(1):
+        opcodes.append(max(code.scalar(0, 'b'), code.scalar(3, 'i')))
+    buffers = [b.vector(0, np.uint8) for b in model.tables(4)]
+    subgraph = model.tables(2)[0]
+
+    tensors = []
+    for t in subgraph.tables(0):
+        type_code = t.scalar(1, 'b')
+        if type_code not in TENSOR_TYPES:
+            raise NotImplementedError(f"不支持的張量類型: {type_code}")
+        dtype = TENSOR_TYPES[type_code]
+        shape = tuple(int(d) for d in t.vector(0, np.int32))
+        raw = buffers[t.scalar(2, 'I')] if buffers else np.zeros(0, np.uint8)
+        data = raw.view(np.dtype(dtype).newbyteorder('<')).astype(dtype).reshape(shape) if raw.size else None
+        q = t.table(4)
+        scale = q.vector(2, np.float32).copy() if q else np.zeros(0, np.float32)
+        zero_point = q.vector(3, np.int64).astype(np.int32) if q else np.zeros(0, np.int32)
+        tensors.append({
+            'name': t.string(3), 'shape': shape, 'dtype': dtype, 'data': data,
+            'scale': scale, 'zero_point': zero_point,
+            'quantized_dimension': q.scalar(6, 'i') if q else 0
+        })
+
+    operators = []
+    for op in subgraph.tables(3):
+        code = opcodes[op.scalar(0, 'I')]
+        name = BUILTIN_OPS.get(code) or OTHER_OPS.get(code, f"BUILTIN_{code}")
+        operators.append({
+            'name': name, 'code': code,
+            'inputs': [int(i) for i in op.vector(1, np.int32)],
+            'outputs': [int(i) for i in op.vector(2, np.int32)],
+            'options': _builtin_options(name, op.table(4))
+        })
+
+    return {'tensors': tensors, 'operators': operators,
+            'inputs': [int(i) for i in subgraph.vector(1, np.int32)],
+            'outputs': [int(i) for i in subgraph.vector(2, np.int32)]}
+
+
+# ---------------------------------------------------------------------------
+# 定點運算 (以 int64 數組表示 int32 值，語義與 kernels/internal/common.h 和
+# gemmlowp/fixedpoint.h 相同；設備庫未定義 TFLITE_SINGLE_ROUNDING，使用雙重舍入)
+# ---------------------------------------------------------------------------
+
+def _round_half_away(x):
+    """TfLiteRound (std::round): 四捨五入，0.5 遠離零"""
+    r = np.trunc(x)
+    return r + np.where(np.abs(x - r) >= 0.5, np.sign(x), 0).astype(r.dtype)
+
+
+def quantize_multiplier(real):
+    """QuantizeMultiplier: 實數倍率 -> (Q31 乘數, 指數)"""
+    if real == 0.0:
+        return 0, 0
+    q, shift = math.frexp(real)
+    q_fixed = int(math.copysign(math.floor(abs(q) * (1 << 31) + 0.5), q))
+    if q_fixed == (1 << 31):
+        q_fixed //= 2
+        shift += 1
+    if shift < -31:
+        return 0, 0
+    return q_fixed, shift
+
+
+def _wrap32(x):
+    """按int32環繞"""
+    return ((x - INT32_MIN) & 0xFFFFFFFF) + INT32_MIN
+
+
+def _trunc_div(x, divisor):
+    """C語言的整數除法 (向零取整)"""
+    q = np.abs(x) // divisor
+    return np.where(x < 0, -q, q)
+
+
+def srdhm(a, b):
+    """SaturatingRoundingDoublingHighMul"""
+    a = np.asarray(a, dtype=np.int64)
+    b = np.asarray(b, dtype=np.int64)
+    ab = a * b
+    nudge = np.where(ab >= 0, 1 << 30, 1 - (1 << 30))
+    result = _trunc_div(ab + nudge, 1 << 31)
+    return np.where((a == INT32_MIN) & (b == INT32_MIN), INT32_MAX, result)
+
+
+def rdbpot(x, exponent):
+    """RoundingDivideByPOT: 舍入到最近的算術右移"""
+    x = np.asarray(x, dtype=np.int64)
+    exponent = np.asarray(exponent, dtype=np.int64)
+    mask = (np.int64(1) << exponent) - 1
+    remainder = x & mask
+    threshold = (mask >> 1) + (x < 0)
+    return (x >> exponent) + (remainder > threshold)
+
+
+def multiply_by_quantized_multiplier(x, multiplier, shift):
+    """MultiplyByQuantizedMultiplier (雙重舍入)，multiplier/shift 可為逐通道數組"""
+    shift = np.asarray(shift, dtype=np.int64)
+    left = np.maximum(shift, 0)
+    right = np.maximum(-shift, 0)
+    x = _wrap32(np.asarray(x, dtype=np.int64) << left)
+    return rdbpot(srdhm(x, multiplier), right)
+
+
+def multiply_by_quantized_multiplier_single_rounding(x, multiplier, shift):
+    """MultiplyByQuantizedMultiplier (TFLITE_SINGLE_ROUNDING，主機解釋器的全連接內核)"""
+    shift = np.asarray(shift, dtype=np.int64)
+    total_shift = 31 - shift
+    product = np.asarray(x, dtype=np.int64) * np.asarray(multiplier, dtype=np.int64)
+    return (product + (np.int64(1) << (total_shift - 1))) >> total_shift
+
+
+def _srmbpot(x, exponent):
+    """SaturatingRoundingMultiplyByPOT"""
+    if exponent == 0:
+        return x
+    if exponent < 0:
+        return rdbpot(x, -exponent)
+    threshold = (1 << (31 - exponent)) - 1
+    result = np.clip(x << exponent, INT32_MIN, INT32_MAX)
+    result = np.where(x > threshold, INT32_MAX, result)
+    return np.where(x < -threshold, INT32_MIN, result)
+
+
+def _exp_on_interval(a):
+    """exp(x)，x 在 [-1/4, 0)，Q0.31"""
+    constant_term = 1895147668
+    x = a + (1 << 28)
+    x2 = srdhm(x, x)
+    x3 = srdhm(x2, x)
+    x4 = srdhm(x2, x2)
+    x4_over_4 = rdbpot(x4, 2)
+    poly = rdbpot(srdhm(x4_over_4 + x3, 715827883) + x2, 1)
+    return _wrap32(constant_term + srdhm(constant_term, x + poly))
+
+
+def exp_on_negative_values(a, integer_bits):
+    """gemmlowp exp_on_negative_values: Q(integer_bits) 輸入 -> Q0.31"""
+    a = np.asarray(a, dtype=np.int64)
+    fractional_bits = 31 - integer_bits
+    one_quarter = 1 << (fractional_bits - 2)
+    a_mod = (a & (one_quarter - 1)) - one_quarter
+    result = _exp_on_interval(_srmbpot(a_mod, integer_bits))
+    remainder = a_mod - a
+    for exponent, multiplier in ((-2, 1672461947), (-1, 1302514674), (0, 790015084),
+                                 (1, 290630308), (2, 39332535), (3, 720401), (4, 242)):
+        if integer_bits > exponent:
+            bit = 1 << (fractional_bits + exponent)
+            result = np.where(remainder & bit, srdhm(result, multiplier), result)
+    if integer_bits > 5:
+        result = np.where(a < -(1 << (36 - integer_bits)), 0, result)
+    return np.where(a == 0, INT32_MAX, result)
+
+
+def _newton_reciprocal(a):
+    """Newton-Raphson 求 1/(1+x) 的共同部分，返回 Q2.29 的 x 和半分母"""
+    total = a + INT32_MAX
+    half_denominator = _trunc_div(total + np.where(total >= 0, 1, -1), 2)
+    x = 1515870810 + srdhm(half_denominator, -1010580540)
+    for _ in range(3):
+        one_minus = (1 << 29) - srdhm(half_denominator, x)
+        x = x + _srmbpot(srdhm(x, one_minus), 2)
+    return x
+
+
+def one_over_one_plus_x_for_x_in_0_1(a):
+    """gemmlowp one_over_one_plus_x_for_x_in_0_1 (Q0.31)"""
+    return _srmbpot(_newton_reciprocal(np.asarray(a, dtype=np.int64)), 1)
+
+
+def _one_minus_x_over_one_plus_x(a):
+    return _srmbpot(_newton_reciprocal(a) - (1 << 29), 2)
+
+
+def fixed_tanh(a, integer_bits):
+    """gemmlowp tanh: Q(integer_bits) -> Q0.31"""
+    a = np.asarray(a, dtype=np.int64)
+    negative = a < 0
+    n = np.where(negative, a, -a)
+    t = _one_minus_x_over_one_plus_x(exp_on_negative_values(n, integer_bits + 1))
+    return np.where(a == 0, 0, np.where(negative, -t, t))
+
+
+def fixed_logistic(a, integer_bits):
+    """gemmlowp logistic: Q(integer_bits) -> Q0.31"""
+    a = np.asarray(a, dtype=np.int64)
+    positive = a > 0
+    magnitude = np.where(positive, a, -a)
+    result_if_positive = one_over_one_plus_x_for_x_in_0_1(exp_on_negative_values(-magnitude, integer_bits))
+    return np.where(a == 0, 1 << 30,
+                    np.where(positive, result_if_positive, INT32_MAX - result_if_positive))
+
+
+def _input_radius(integer_bits, left_shift, total_bits=31):
+    """CalculateInputRadius"""
+    return int(math.floor(((1 << integer_bits) - 1) * (1 << (total_bits - integer_bits))
+                          / (1 << left_shift)))
+
+
+def _activation_range(activation, scale, zero_point, qmin=-128, qmax=127):
+    """CalculateActivationRangeQuantized (0: 無, 1: RELU, 2: RELU_N1_TO_1, 3: RELU6)"""
+    def quantize(value):
+        return zero_point + int(_round_half_away(np.float32(value) / np.float32(scale)))
+
+    if activation == 1:
+        return max(qmin, quantize(0.0)), qmax
+    if activation == 2:
+        return max(qmin, quantize(-1.0)), min(qmax, quantize(1.0))
+    if activation == 3:
+        return max(qmin, quantize(0.0)), min(qmax, quantize(6.0))
+    return qmin, qmax
+
+
+def _float_activation(x, activation):
+    if activation == 1:
+        return np.maximum(x, 0)
+    if activation == 2:
+        return np.clip(x, -1, 1)
+    if activation == 3:
+        return np.clip(x, 0, 6)
+    return x
+
+
+def _int_matmul(a, b):
+    """整數矩陣乘法: 以浮點BLAS計算，累加範圍在尾數精度內時結果精確"""
+    bound = float(np.abs(a).max(initial=0)) * float(np.abs(b).max(initial=0)) * a.shape[-1]
+    dtype = np.float32 if bound < (1 << 24) else np.float64
+    if bound >= (1 << 53):
+        return a.astype(np.int64) @ b.astype(np.int64)
+    return np.rint(a.astype(dtype) @ b.astype(dtype)).astype(np.int64)
+
+
+def _same_padding(size, filter_size, stride, dilation):
+    """ComputePaddingHeightWidth (SAME)，返回 (輸出大小, 前側填充, 後側填充)"""
+    effective = (filter_size - 1) * dilation + 1
+    out = (size + stride - 1) // stride
+    total = max((out - 1) * stride + effective - size, 0)
+    return out, total // 2, total - total // 2
+
+
+def _windows(x, filter_h, filter_w, opts, pad_value):
+    """NHWC 輸入的滑動窗口 -> (N, Ho, Wo, C, kh, kw)"""
+    dh, dw = opts.get('dilation_h', 1), opts.get('dilation_w', 1)
+    sh, sw = opts['stride_h'], opts['stride_w']
+    if opts['padding'] == 0:
+        _, top, bottom = _same_padding(x.shape[1], filter_h, sh, dh)
+        _, left, right = _same_padding(x.shape[2], filter_w, sw, dw)
+        if top or bottom or left or right:
+            x = np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=pad_value)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        x, ((filter_h - 1) * dh + 1, (filter_w - 1) * dw + 1), axis=(1, 2))
+    return windows[:, ::sh, ::sw, :, ::dh, ::dw]
+
+
+class Int8Emulator:
+    """
+    全整數 .tflite 模型的 TFLite Micro 參考內核模擬
+
+    所有激活張量以批次維度 N 代替導出時的批次1，每個算子對整批窗口向量化執行。
+    target='micro' 時與設備庫一致: FULLY_CONNECTED 只使用權重的第一個量化尺度
+    (該版本的TFLite Micro不支持逐通道全連接)，MEAN 走浮點重縮放路徑；
+    target='tflite' 時與主機 TFLite 解釋器的參考內核一致 (逐通道單次舍入的全連接、
+    整數乘數的 MEAN)，用於和 tf.lite.Interpreter 逐位比對。LSTM 等不支持的算子在構造時報錯。
+    """
+
+    TARGETS = ('micro', 'tflite')
+
+    def __init__(self, model_path, target='micro', chunk_size=1024, scaler=None):
+        """
+        初始化模擬器
+
+        Args:
+            model_path: 全整數量化的 .tflite 模型
+            target: 'micro' 模擬設備上的 TFLite Micro，'tflite' 模擬主機解釋器
+            chunk_size: 每次執行的窗口數 (限制中間張量的內存)
+            scaler: 可選的 StandardScaler，提供時 predict 接受原始窗口
+        """
+        if target not in self.TARGETS:
+            raise ValueError(f"target 必須是 {self.TARGETS} 之一: {target}")
+
+        self.model_path = model_path
+        self.target = target
+        self.chunk_size = max(1, chunk_size)
+        self.mean = None if scaler is None else scaler.mean_.astype(np.float32)
+        self.scale = None if scaler is None else scaler.scale_.astype(np.float32)
+
+        graph = read_tflite(model_path)
+        self.tensors = graph['tensors']
+        self.operators = graph['operators']
+        self.input_index = graph['inputs'][0]
+        self.output_index = graph['outputs'][0]
+
+        unsupported = sorted({op['name'] for op in self.operators if op['code'] not in BUILTIN_OPS})
+        if unsupported:
+            raise NotImplementedError(f"模擬器不支持的算子: {', '.join(unsupported)}")
+
+        input_tensor = self.tensors[self.input_index]
+        output_tensor = self.tensors[self.output_index]
+        self.input_shape = input_tensor['shape'][1:]
+        self.input_dtype = input_tensor['dtype']
+        self.output_dtype = output_tensor['dtype']
+        self.input_quantization = self._quantization(self.input_index)
+        self.output_quantization = self._quantization(self.output_index)
+        self.num_classes = output_tensor['shape'][-1]
+
+        self.per_channel_fc_layers = [
+            self.tensors[op['outputs'][0]]['name'] for op in self.operators
+            if op['name'] == 'FULLY_CONNECTED' and self.tensors[op['inputs'][1]]['scale'].size > 1
+        ]
+        self._params = [self._prepare(op) for op in self.operators]
+
+    def _quantization(self, index):
+        tensor = self.tensors[index]
+        if tensor['scale'].size == 0:
+            return 0.0, 0
+        return float(tensor['scale'][0]), int(tensor['zero_point'][0])
+
+    def _dequantized_constant(self, index):
+        """常量張量的浮點值 (逐通道量化按 quantized_dimension 展開尺度)"""
+        tensor = self.tensors[index]
+        data = tensor['data']
+        if tensor['scale'].size == 0 or not np.issubdtype(tensor['dtype'], np.integer):
+            return data
+        shape = [1] * data.ndim
+        if tensor['scale'].size > 1:
+            shape[tensor['quantized_dimension']] = -1
+        scale = tensor['scale'].astype(np.float64).reshape(shape) if data.ndim else tensor['scale'][0]
+        zero_point = tensor['zero_point'].reshape(shape) if data.ndim else tensor['zero_point'][0]
+        return ((data.astype(np.float64) - zero_point) * scale).astype(np.float32)
+
+    # -- 準備: 與各內核的 Prepare 相同，預先計算乘數和激活範圍 --
+
+    def _prepare(self, op):
+        name, opts = op['name'], op['options']
+        inputs, output = op['inputs'], self.tensors[op['outputs'][0]]
+        if output['dtype'] != np.int8 or name in ('RESHAPE', 'SQUEEZE', 'EXPAND_DIMS'):
+            return {}
+        out_scale, out_zp = self._quantization(op['outputs'][0])
+        in_scale, in_zp = self._quantization(inputs[0])
+        params = {'out_zp': out_zp}
+
+        if name in ('CONV_2D', 'FULLY_CONNECTED'):
+            filter_scales = self.tensors[inputs[1]]['scale'].astype(np.float64)
+            if name == 'FULLY_CONNECTED' and self.target == 'micro':
+                filter_scales = filter_scales[:1]
+            pairs = [quantize_multiplier(float(np.float64(in_scale) * s / np.float64(out_scale)))
+                     for s in filter_scales]
+            params['multiplier'] = np.array([m for m, _ in pairs], dtype=np.int64)
+            params['shift'] = np.array([s for _, s in pairs], dtype=np.int64)
+            params['in_zp'] = in_zp
+            params['act'] = _activation_range(opts['activation'], out_scale, out_zp)
+            params['single_rounding'] = name == 'FULLY_CONNECTED' and self.target == 'tflite'
+        elif name == 'ADD':
+            s1, zp1 = self._quantization(inputs[0])
+            s2, zp2 = self._quantization(inputs[1])
+            twice_max = 2 * max(np.float64(s1), np.float64(s2))
+            params.update({
+                'zp1': zp1, 'zp2': zp2, 'left_shift': 20,
+                'm1': quantize_multiplier(float(np.float64(s1) / twice_max)),
+                'm2': quantize_multiplier(float(np.float64(s2) / twice_max)),
+                'mo': quantize_multiplier(float(twice_max / ((1 << 20) * np.float64(out_scale)))),
+                'act': _activation_range(opts['activation'], out_scale, out_zp)
+            })
+        elif name == 'MUL':
+            s1, zp1 = self._quantization(inputs[0])
+            s2, zp2 = self._quantization(inputs[1])
+            params.update({
+                'zp1': zp1, 'zp2': zp2,
+                'mo': quantize_multiplier(float(np.float64(s1) * np.float64(s2) / np.float64(out_scale))),
+                'act': _activation_range(opts['activation'], out_scale, out_zp)
+            })
+        elif name == 'MAX_POOL_2D':
+            params['act'] = _activation_range(opts['activation'], out_scale, out_zp)
+        elif name == 'MEAN':
+            params.update({'in_zp': in_zp, 'in_scale': in_scale, 'out_scale': out_scale})
+            if self.target == 'tflite':
+                params['requant'] = quantize_multiplier(float(np.float64(in_scale) / np.float64(out_scale)))
+        elif name in ('LOGISTIC', 'TANH'):
+            q, left_shift = math.frexp(np.float64(in_scale) * (1 << 27))
+            multiplier = int(_round_half_away(q * (1 << 31)))
+            radius = _input_radius(4, left_shift)
+            x = np.arange(-128, 128, dtype=np.int64) - in_zp
+            in_q4 = multiply_by_quantized_multiplier(x, multiplier, left_shift)
+            if name == 'LOGISTIC':
+                table = rdbpot(fixed_logistic(in_q4, 4), 23) - 128
+            else:
+                table = rdbpot(fixed_tanh(in_q4, 4), 24)
+            table = np.where(x <= -radius, -128, np.where(x >= radius, 127, table))
+            params['table'] = np.clip(table, -128, 127).astype(np.int8)
+        elif name == 'SOFTMAX':
+            real = min(np.float64(opts['beta']) * np.float64(in_scale) * (1 << 26), (1 << 31) - 1.0)
+            multiplier, left_shift = quantize_multiplier(real)
+            params.update({'multiplier': multiplier, 'left_shift': left_shift,
+                           'diff_min': -_input_radius(5, left_shift)})
+        elif name == 'QUANTIZE' and self.tensors[inputs[0]]['dtype'] == np.int8:
+            params['requant'] = quantize_multiplier(float(np.float64(in_scale) / np.float64(out_scale)))
+            params['in_zp'] = in_zp
+        elif name == 'QUANTIZE':
+            params['out_scale'] = out_scale
+        return params
+
+    # -- 整數內核 --
+
+    def _batch_shape(self, index, n):
+        return (n,) + self.tensors[index]['shape'][1:]
+
+    def _int_op(self, op, params, values):
+        name, opts = op['name'], op['options']
+        x = values[0]
+        out_index = op['outputs'][0]
+
+        if name in ('RESHAPE', 'SQUEEZE', 'EXPAND_DIMS'):
+            return x.reshape(self._batch_shape(out_index, len(x)))
+
+        if name in ('PAD', 'PADV2'):
+            paddings = [tuple(int(v) for v in p) for p in values[1]]
+            pad_value = int(values[2].reshape(-1)[0]) if name == 'PADV2' else params['out_zp']
+            return np.pad(x, paddings, constant_values=pad_value)
+
+        if name == 'CONV_2D':
+            weights = values[1]     # (O, kh, kw, I)
+            windows = _windows(x, weights.shape[1], weights.shape[2], opts, params['in_zp'])
+            n, ho, wo = windows.shape[:3]
+            patches = windows.reshape(n * ho * wo, -1).astype(np.int32) - params['in_zp']
+            kernel = weights.transpose(0, 3, 1, 2).reshape(weights.shape[0], -1).astype(np.int32)
+            acc = _int_matmul(patches, kernel.T)
+            if len(op['inputs']) > 2 and op['inputs'][2] >= 0:
+                acc += values[2]
+            out = multiply_by_quantized_multiplier(acc, params['multiplier'], params['shift']) + params['out_zp']
+            return np.clip(out, *params['act']).astype(np.int8).reshape(n, ho, wo, -1)
+
+        if name == 'FULLY_CONNECTED':
+            weights = values[1]     # (O, I)
+            rows = x.reshape(-1, weights.shape[1]).astype(np.int32) - params['in_zp']
+            acc = _int_matmul(rows, weights.T.astype(np.int32))
+            if len(op['inputs']) > 2 and op['inputs'][2] >= 0:
+                acc += values[2]
+            requantize = (multiply_by_quantized_multiplier_single_rounding if params['single_rounding']
+                          else multiply_by_quantized_multiplier)
+            out = requantize(acc, params['multiplier'], params['shift']) + params['out_zp']
+            out = np.clip(out, *params['act']).astype(np.int8)
+            return out.reshape(self._batch_shape(out_index, len(x)))
+
+        if name == 'ADD':
+            left_shift = params['left_shift']
+            a = (values[0].astype(np.int64) - params['zp1']) << left_shift
+            b = (values[1].astype(np.int64) - params['zp2']) << left_shift
+            a = multiply_by_quantized_multiplier(a, *params['m1'])
+            b = multiply_by_quantized_multiplier(b, *params['m2'])
+            out = multiply_by_quantized_multiplier(a + b, *params['mo']) + params['out_zp']
+            return np.clip(out, *params['act']).astype(np.int8)
+
+        if name == 'MUL':
+            product = (values[0].astype(np.int64) - params['zp1']) * (values[1].astype(np.int64) - params['zp2'])
+            out = multiply_by_quantized_multiplier(product, *params['mo']) + params['out_zp']
+            return np.clip(out, *params['act']).astype(np.int8)
+
+        if name == 'MAX_POOL_2D':
+            windows = _windows(x, opts['filter_h'], opts['filter_w'], opts, -128)
+            return np.clip(windows.max(axis=(4, 5)), *params['act']).astype(np.int8)
+
+        if name == 'MEAN':
+            axis = tuple(int(a) % x.ndim for a in values[1].reshape(-1))
+            total = x.astype(np.int64).sum(axis=axis, keepdims=op['options']['keep_dims'])
+            count = int(np.prod([x.shape[a] for a in axis]))
+            if params['in_zp'] == params['out_zp'] and params['in_scale'] == params['out_scale']:
+                return _trunc_div(total, count).astype(np.int8)
+            if 'requant' in params:
+                # 主機 QuantizedMeanOrSum: 把 1/count 併入乘數後整數重縮放
+                multiplier, exponent = params['requant']
+                shift = min(count.bit_length() - 1, 32, 31 + exponent)
+                out = multiply_by_quantized_multiplier(total - params['in_zp'] * count,
+                                                       (multiplier << shift) // count,
+                                                       exponent - shift) + params['out_zp']
+                return np.clip(out, -128, 127).astype(np.int8)
+            scale = np.float32(params['in_scale']) / np.float32(params['out_scale'])
+            bias = np.float32(-params['in_zp']) * scale
+            mean = total.astype(np.float32) / np.float32(count)
+            out = _round_half_away(mean * scale + bias) + np.float32(params['out_zp'])
+            return np.clip(out, -128, 127).astype(np.int8)
+
+        if name in ('LOGISTIC', 'TANH'):
+            return params['table'][x.astype(np.int64) + 128]
+
+        if name == 'SOFTMAX':
+            diff = x.astype(np.int64) - x.max(axis=-1, keepdims=True)
+            valid = diff >= params['diff_min']
+            rescaled = srdhm(diff << params['left_shift'], params['multiplier'])
+            exps = exp_on_negative_values(rescaled, 5)
+            total = np.where(valid, rdbpot(exps, 12), 0).sum(axis=-1, keepdims=True)
+            headroom = 32 - np.frexp(total.astype(np.float64))[1].astype(np.int64)
+            bits_over_unit = 12 - headroom
+            shifted_scale = one_over_one_plus_x_for_x_in_0_1((total << headroom) - (1 << 31))
+            out = rdbpot(srdhm(shifted_scale, exps), bits_over_unit + 23) - 128
+            return np.where(valid, np.clip(out, -128, 127), -128).astype(np.int8)
+
+        if name == 'QUANTIZE':
+            if 'requant' in params:
+                out = multiply_by_quantized_multiplier(x.astype(np.int64) - params['in_zp'],
+                                                       *params['requant']) + params['out_zp']
+            else:
+                out = _round_half_away(x.astype(np.float32) / np.float32(params['out_scale'])) + params['out_zp']
+            return np.clip(out, -128, 127).astype(np.int8)
+
+        if name == 'DEQUANTIZE':
+            scale, zero_point = self._quantization(op['inputs'][0])
+            return (np.float64(scale) * (x.astype(np.int64) - zero_point)).astype(np.float32)
+
+        raise NotImplementedError(name)
+
+    # -- 浮點影子圖: 同一算子圖以反量化的常量做浮點計算，作為逐層誤差的參照 --
+
+    def _float_op(self, op, values):
+        name, opts = op['name'], op['options']
+        x = values[0]
+        out_index = op['outputs'][0]
+
+        if name in ('RESHAPE', 'SQUEEZE', 'EXPAND_DIMS'):
+            return x.reshape(self._batch_shape(out_index, len(x)))
+        if name in ('PAD', 'PADV2'):
+            paddings = [tuple(int(v) for v in p) for p in self.tensors[op['inputs'][1]]['data']]
+            return np.pad(x, paddings)
+        if name == 'CONV_2D':
+            weights = values[1]
+            windows = _windows(x, weights.shape[1], weights.shape[2], opts, 0.0)
+            n, ho, wo = windows.shape[:3]
+            kernel = weights.transpose(0, 3, 1, 2).reshape(weights.shape[0], -1)
+            out = windows.reshape(n * ho * wo, -1) @ kernel.T
+            if len(op['inputs']) > 2 and op['inputs'][2] >= 0:
+                out = out + values[2]
+            return _float_activation(out, opts['activation']).reshape(n, ho, wo, -1)
+        if name == 'FULLY_CONNECTED':
+            weights = values[1]
+            out = x.reshape(-1, weights.shape[1]) @ weights.T
+            if len(op['inputs']) > 2 and op['inputs'][2] >= 0:
+                out = out + values[2]
+            return _float_activation(out, opts['activation']).reshape(self._batch_shape(out_index, len(x)))
+        if name == 'ADD':
+            return _float_activation(values[0] + values[1], opts['activation'])
+        if name == 'MUL':
+            return _float_activation(values[0] * values[1], opts['activation'])
+        if name == 'MAX_POOL_2D':
+            windows = _windows(x, opts['filter_h'], opts['filter_w'], opts, -np.inf)
+            return _float_activation(windows.max(axis=(4, 5)), opts['activation'])
+        if name == 'MEAN':
+            axis = tuple(int(a) % x.ndim for a in self.tensors[op['inputs'][1]]['data'].reshape(-1))
+            return x.mean(axis=axis, keepdims=opts['keep_dims'])
+        if name == 'LOGISTIC':
+            return 1.0 / (1.0 + np.exp(-x))
+        if name == 'TANH':
+            return np.tanh(x)
+        if name == 'SOFTMAX':
+            e = np.exp(opts['beta'] * (x - x.max(axis=-1, keepdims=True)))
+            return e / e.sum(axis=-1, keepdims=True)
+        if name in ('QUANTIZE', 'DEQUANTIZE'):
+            return x
+        raise NotImplementedError(name)
+
+    # -- 執行 --
+
+    def invoke(self, inputs, keep_intermediates=False, float_inputs=None):
+        """
+        執行整數模型
+
+        Args:
+            inputs: 已量化的輸入 (N, T, C)，類型與模型輸入相同
+            keep_intermediates: 是否返回所有張量的值
+            float_inputs: 提供時同時執行浮點影子圖 (輸入為量化前的浮點窗口)
+
+        Returns:
+            輸出 (N, 類別數)；keep_intermediates 或 float_inputs 提供時返回
+            (輸出, 整數張量字典, 浮點張量字典或 None)
+        """
+        inputs = np.asarray(inputs)
+        values = {self.input_index: inputs.reshape(self._batch_shape(self.input_index, len(inputs)))}
+        shadow = None
+        if float_inputs is not None:
+            shadow = {self.input_index: np.asarray(float_inputs, dtype=np.float64).reshape(values[self.input_index].shape)}
+
+        for op, params in zip(self.operators, self._params):
+            args = [values[i] if i in values else self.tensors[i]['data'] for i in op['inputs'] if i >= 0]
+            values[op['outputs'][0]] = self._int_op(op, params, args)
+            if shadow is not None:
+                args = [shadow[i] if i in shadow else self._dequantized_constant(i) for i in op['inputs'] if i >= 0]
+                shadow[op['outputs'][0]] = self._float_op(op, args)
+
+        output = values[self.output_index].reshape(len(inputs), -1)
+        if keep_intermediates or shadow is not None:
+            return output, values, shadow
+        return output
+
+    def quantize(self, windows):
+        """把標準化後的浮點窗口轉換為模型的輸入類型 (與 QUANTIZE 算子相同的舍入)"""
+        if not np.issubdtype(self.input_dtype, np.integer):
+            return windows.astype(self.input_dtype, copy=False)
+        scale, zero_point = self.input_quantization
+        info = np.iinfo(self.input_dtype)
+        q = _round_half_away(windows.astype(np.float32) / np.float32(scale)) + zero_point
+        return np.clip(q, info.min, info.max).astype(self.input_dtype)
+
+    def dequantize(self, outputs):
+        """把模型輸出轉換為浮點概率"""
+        if not np.issubdtype(self.output_dtype, np.integer):
+            return outputs.astype(np.float32, copy=False)
+        scale, zero_point = self.output_quantization
+        return ((outputs.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+    def _prepare_windows(self, windows):
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim == 2:
+            windows = windows[None]
+        if windows.shape[1:] != self.input_shape:
+            raise ValueError(f"輸入形狀 {windows.shape[1:]} 與模型 {self.input_shape} 不符")
+        if self.mean is not None:
+            windows = (windows - self.mean) / self.scale
+        return windows
+
+    def predict_quantized(self, windows):
+        """分塊執行並返回設備上的原始整數輸出 (N, 類別數)"""
+        windows = self._prepare_windows(windows)
+        if len(windows) == 0:
+            return np.zeros((0, self.num_classes), dtype=self.output_dtype)
+        return np.concatenate([self.invoke(self.quantize(windows[i:i + self.chunk_size]))
+                               for i in range(0, len(windows), self.chunk_size)])
+
+    def predict(self, windows):
+        """
+        批次推理 (接口與 TFLiteRunner.predict 相同)
+
+        Returns:
+            (N, 類別數) 浮點概率
+        """
+        return self.dequantize(self.predict_quantized(windows))
+
+    def predict_levels(self, windows):
+        """
+        預測帕金森等級
+
+        Returns:
+            (等級 1-5, 置信度, 概率)
+        """
+        probabilities = self.predict(windows)
+        return np.argmax(probabilities, axis=1) + 1, probabilities.max(axis=1), probabilities
+
+    def layer_errors(self, windows):
+        """
+        逐層量化誤差
+
+        每個算子輸出的反量化值與浮點影子圖 (同一算子圖、反量化常量的浮點計算) 比較，
+        誤差從輸入量化開始逐層累積；權重本身的舍入誤差體現在與Keras模型的端到端比較中。
+
+        Returns:
+            每個算子一個字典: index, op, tensor, scale, rmse, max_abs, rmse_lsb (以量化步長計),
+            snr_db (浮點信號與誤差的功率比)
+        """
+        windows = self._prepare_windows(windows)
+        stats = {}
+        for start in range(0, len(windows), self.chunk_size):
+            chunk = windows[start:start + self.chunk_size]
+            _, values, shadow = self.invoke(self.quantize(chunk), float_inputs=chunk)
+            for i, op in enumerate(self.operators):
+                index = op['outputs'][0]
+                if self.tensors[index]['dtype'] != np.int8:
+                    continue
+                scale, zero_point = self._quantization(index)
+                error = (values[index].astype(np.float64) - zero_point) * scale - shadow[index]
+                s = stats.setdefault(i, {'sq': 0.0, 'signal': 0.0, 'max': 0.0, 'count': 0})
+                s['sq'] += float(np.sum(error ** 2))
+                s['signal'] += float(np.sum(shadow[index] ** 2))
+                s['max'] = max(s['max'], float(np.abs(error).max(initial=0)))
+                s['count'] += error.size
+
+        results = []
+        for i, s in stats.items():
+            op = self.operators[i]
+            index = op['outputs'][0]
+            scale = self._quantization(index)[0]
+            rmse = math.sqrt(s['sq'] / max(s['count'], 1))
+            results.append({
+                'index': i, 'op': op['name'], 'tensor': self.tensors[index]['name'], 'scale': scale,
+                'rmse': rmse, 'max_abs': s['max'], 'rmse_lsb': rmse / scale if scale else 0.0,
+                'snr_db': 10 * math.log10(s['signal'] / s['sq']) if s['sq'] > 0 else float('inf')
+            })
+        return results
+
+    def report(self, errors):
+        """打印逐層誤差表"""
+        print(f"{'#':>3} {'算子':<16}{'RMSE':>10}{'最大誤差':>10}{'RMSE(LSB)':>11}{'SNR(dB)':>9}  張量")
+        for e in errors:
+            print(f"{e['index']:>3} {e['op']:<16}{e['rmse']:>10.5f}{e['max_abs']:>10.5f}"
+                  f"{e['rmse_lsb']:>11.3f}{e['snr_db']:>9.1f}  {e['tensor'][:48]}")
+        if self.per_channel_fc_layers and self.target == 'micro':
+            print(f"注意: {len(self.per_channel_fc_layers)} 個全連接層的權重為逐通道量化，"
+                  f"設備的 FULLY_CONNECTED 內核只使用第一個通道的尺度")
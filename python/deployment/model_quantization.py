@@ -7,14 +7,41 @@ import tensorflow as tf
 import numpy as np
 import json
 import os
+import sys
+import shutil
+import tempfile
+import multiprocessing
 from pathlib import Path
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from deployment.tflite_runner import TFLiteRunner
+from deployment.int8_emulator import Int8Emulator
+
+
+def _convert_full_integer(model_path, output_path, calibration_path):
+    """在獨立子進程中做全整數量化 (循環層的校準可能使解釋器崩潰)"""
+    calibration = np.load(calibration_path)
+
+    def representative_data_gen():
+        for window in calibration:
+            yield [window[None]]
+
+    quantizer = ModelQuantizer()
+    if not quantizer.load_keras_model(model_path):
+        sys.exit(1)
+    if not quantizer.convert_to_quantized_tflite(output_path, representative_dataset=representative_data_gen,
+                                                 isolate=False):
+        sys.exit(1)
+
+
 class ModelQuantizer:
     def __init__(self):
         """初始化模型量化器"""
         self.original_model = None
         self.tflite_model = None
         self.quantized_model = None
+        self.quantization_mode = None
         
     def load_keras_model(self, model_path):
         """加載Keras模型"""
@@ -27,14 +54,33 @@ class ModelQuantizer:
             print(f"加載模型失敗: {e}")
             return False
     
-    def create_representative_dataset(self, data_path="data", num_samples=100):
+    def _create_converter(self):
+        """
+        以批次大小為1的SavedModel簽名創建轉換器
+        
+        LSTM 在動態批次維度下無法降級為TFLite內建算子，微控制器上每次只推理一個窗口，
+        因此固定批次大小為1。返回 (轉換器, 臨時導出目錄)，轉換完成後由調用者刪除目錄。
+        """
+        export_dir = tempfile.mkdtemp(prefix="parkinson_export_")
+        input_shape = (1,) + tuple(self.original_model.inputs[0].shape[1:])
+        self.original_model.export(export_dir, format='tf_saved_model', verbose=False,
+                                   input_signature=[tf.TensorSpec(input_shape, tf.float32)])
+        return tf.lite.TFLiteConverter.from_saved_model(export_dir), export_dir
+    
+    def create_representative_dataset(self, data_path="data", num_samples=100, store_dir=None,
+                                      max_bad_fraction=0.0):
         """
         創建代表性數據集用於量化校準
         
         Args:
             data_path: 數據目錄
             num_samples: 樣本數量
+            store_dir: 會話存儲目錄，提供時只從通過質量檢查的窗口中取樣
+            max_bad_fraction: 使用存儲時窗口內異常樣本比例上限
         """
+        if store_dir is not None:
+            return self._store_representative_dataset(store_dir, num_samples, max_bad_fraction)
+        
         def representative_data_gen():
             # 從訓練數據中選擇代表性樣本
             all_data = []
@@ -77,7 +123,29 @@ class ModelQuantizer:
             # 歸一化（簡單的標準化）
             for data in selected_data:
                 data_normalized = (data - np.mean(data, axis=0)) / (np.std(data, axis=0) + 1e-8)
-                yield [data_normalized.astype(np.float32)]
+                # 轉換器的簽名固定為批次大小1
+                yield [data_normalized[None].astype(np.float32)]
+        
+        return representative_data_gen
+    
+    def _store_representative_dataset(self, store_dir, num_samples, max_bad_fraction,
+                                      sequence_length=50):
+        """從會話存儲中選取質量合格的窗口作為校準數據 (削波、尖峰窗口會拉寬量化範圍)"""
+        from machine_learning.session_store import SessionStore
+        
+        def representative_data_gen():
+            store = SessionStore(store_dir).open()
+            windows = store.window_index(sequence_length, quality_ok_only=True,
+                                         max_bad_fraction=max_bad_fraction)
+            starts = windows['starts']
+            if len(starts) > num_samples:
+                starts = np.random.choice(starts, num_samples, replace=False)
+            print(f"量化校準: 從 {len(windows['starts'])} 個合格窗口中選取 {len(starts)} 個")
+            
+            for start in starts:
+                data = np.asarray(store.features[start:start + sequence_length])
+                data_normalized = (data - np.mean(data, axis=0)) / (np.std(data, axis=0) + 1e-8)
+                yield [data_normalized[None].astype(np.float32)]
         
         return representative_data_gen
     
@@ -87,8 +155,9 @@ class ModelQuantizer:
             print("沒有加載的模型")
             return False
         
+        export_dir = None
         try:
-            converter = tf.lite.TFLiteConverter.from_keras_model(self.original_model)
+            converter, export_dir = self._create_converter()
             self.tflite_model = converter.convert()
             
             # 保存模型
@@ -104,29 +173,61 @@ class ModelQuantizer:
         except Exception as e:
             print(f"轉換TFLite失敗: {e}")
             return False
+        finally:
+            if export_dir:
+                shutil.rmtree(export_dir, ignore_errors=True)
     
     def convert_to_quantized_tflite(self, output_path="models/parkinson_model_quantized.tflite", 
-                                   data_path="data"):
-        """轉換為量化的TensorFlow Lite格式"""
+                                   data_path="data", store_dir=None, representative_dataset=None,
+                                   full_integer=True, isolate=True):
+        """
+        轉換為量化的TensorFlow Lite格式
+        
+        全整數量化默認在子進程中執行: LSTM 等循環層的校準可能直接使解釋器崩潰，
+        子進程失敗 (包括崩潰) 時退回動態範圍量化，使用的方式記錄在 quantization_mode。
+        
+        Args:
+            output_path: 輸出路徑
+            data_path: 校準數據目錄
+            store_dir: 會話存儲目錄，提供時只用通過質量檢查的窗口校準
+            representative_dataset: 自定義校準數據生成函數 (提供時忽略 data_path/store_dir)
+            full_integer: 是否全整數量化 (False 時只做權重的動態範圍量化，不需要校準數據，
+                          但TFLite Micro不支持這種混合算子)
+            isolate: 是否在子進程中執行全整數量化
+        """
         if self.original_model is None:
             print("沒有加載的模型")
             return False
         
+        if full_integer and isolate:
+            representative_dataset = (representative_dataset or
+                                      self.create_representative_dataset(data_path, store_dir=store_dir))
+            if self._convert_isolated(output_path, representative_dataset):
+                return True
+            print("退回動態範圍量化 (只量化權重；TFLite Micro 不支持，不能部署到Arduino)")
+            full_integer = False
+        
+        export_dir = None
         try:
-            converter = tf.lite.TFLiteConverter.from_keras_model(self.original_model)
+            converter, export_dir = self._create_converter()
             
             # 啟用優化
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
             
-            # 設定代表性數據集用於校準
-            converter.representative_dataset = self.create_representative_dataset(data_path)
-            
-            # 設定量化為int8
-            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
-            converter.inference_input_type = tf.int8
-            converter.inference_output_type = tf.int8
+            if full_integer:
+                # 設定代表性數據集用於校準
+                converter.representative_dataset = (representative_dataset or
+                                                    self.create_representative_dataset(data_path, store_dir=store_dir))
+                
+                # 設定量化為int8
+                converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+                converter.inference_input_type = tf.int8
+                converter.inference_output_type = tf.int8
+                # 設備庫的 FULLY_CONNECTED 內核只支持逐張量量化的權重 (逐通道時只用第一個尺度)
+                converter._experimental_disable_per_channel_quantization_for_dense_layers = True
             
             self.quantized_model = converter.convert()
+            self.quantization_mode = 'int8' if full_integer else 'dynamic'
             
             # 保存量化模型
             with open(output_path, 'wb') as f:
@@ -141,32 +242,72 @@ class ModelQuantizer:
         except Exception as e:
             print(f"量化轉換失敗: {e}")
             return False
+        finally:
+            if export_dir:
+                shutil.rmtree(export_dir, ignore_errors=True)
     
-    def test_tflite_model(self, model_path, test_data=None):
-        """測試TensorFlow Lite模型"""
+    def _convert_isolated(self, output_path, representative_dataset):
+        """
+        在子進程中執行全整數量化
+        
+        模型和校準窗口先寫入臨時目錄，子進程崩潰只會使本次轉換失敗，不影響調用進程。
+        
+        Returns:
+            是否成功
+        """
+        windows = [np.asarray(inputs[0], dtype=np.float32) for inputs in representative_dataset()]
+        if not windows:
+            print("全整數量化失敗: 沒有校準數據")
+            return False
+        
+        work_dir = tempfile.mkdtemp(prefix="parkinson_quantize_")
         try:
-            # 加載模型
-            interpreter = tf.lite.Interpreter(model_path=model_path)
-            interpreter.allocate_tensors()
+            model_path = os.path.join(work_dir, "model.keras")
+            calibration_path = os.path.join(work_dir, "calibration.npy")
+            self.original_model.save(model_path)
+            # 校準窗口帶有批次維度 (1, T, C)
+            np.save(calibration_path, np.concatenate(windows, axis=0))
             
-            # 獲取輸入輸出詳情
-            input_details = interpreter.get_input_details()
-            output_details = interpreter.get_output_details()
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            context = multiprocessing.get_context('spawn')
+            process = context.Process(target=_convert_full_integer,
+                                      args=(model_path, output_path, calibration_path))
+            process.start()
+            process.join()
+            if process.exitcode != 0 or not os.path.exists(output_path):
+                print(f"全整數量化失敗 (子進程退出碼 {process.exitcode})")
+                return False
             
-            print(f"輸入張量: {input_details}")
-            print(f"輸出張量: {output_details}")
+            with open(output_path, 'rb') as f:
+                self.quantized_model = f.read()
+            self.quantization_mode = 'int8'
+            return True
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def test_tflite_model(self, model_path, test_data=None):
+        """
+        測試TensorFlow Lite模型
+        
+        Args:
+            model_path: .tflite 模型文件
+            test_data: 標準化後的浮點窗口 (N, T, C)，int8 模型的輸入量化由 TFLiteRunner 處理
+        
+        Returns:
+            浮點概率 (N, 類別數)，沒有 test_data 時返回 None
+        """
+        try:
+            runner = TFLiteRunner(model_path)
+            
+            print(f"輸入: 形狀 {runner.input_shape}，類型 {np.dtype(runner.input_dtype).name}，"
+                  f"量化參數 {runner.input_quantization}")
+            print(f"輸出: 類別數 {runner.num_classes}，類型 {np.dtype(runner.output_dtype).name}，"
+                  f"量化參數 {runner.output_quantization}")
             
             if test_data is not None:
-                # 設定輸入
-                interpreter.set_tensor(input_details[0]['index'], test_data)
-                
-                # 執行推理
-                interpreter.invoke()
-                
-                # 獲取輸出
-                output_data = interpreter.get_tensor(output_details[0]['index'])
+                output_data = runner.predict(test_data)
                 print(f"推理結果: {output_data}")
-                
                 return output_data
             
         except Exception as e:
@@ -223,8 +364,13 @@ const unsigned char model_data[] = {{
             print(f"生成Arduino頭文件失敗: {e}")
             return False
     
-    def compare_models(self, original_model_path, tflite_model_path, test_data=None):
-        """比較原始模型和TFLite模型的性能"""
+    def compare_models(self, original_model_path, tflite_model_path, test_data=None, emulate=True):
+        """
+        比較原始模型和TFLite模型的性能
+        
+        emulate=True 且模型為全整數量化時，另以 Int8Emulator 模擬設備上的 TFLite Micro
+        計算，報告其與主機解釋器、原始模型的分類一致率以及逐層量化誤差
+        """
         if test_data is None:
             # 創建測試數據
             test_data = np.random.randn(1, 50, 9).astype(np.float32)
@@ -233,16 +379,9 @@ const unsigned char model_data[] = {{
         original_model = tf.keras.models.load_model(original_model_path)
         original_pred = original_model.predict(test_data, verbose=0)
         
-        # TFLite模型預測
-        interpreter = tf.lite.Interpreter(model_path=tflite_model_path)
-        interpreter.allocate_tensors()
-        
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-        
-        interpreter.set_tensor(input_details[0]['index'], test_data)
-        interpreter.invoke()
-        tflite_pred = interpreter.get_tensor(output_details[0]['index'])
+        # TFLite模型預測 (int8 模型的輸入量化和輸出反量化由 TFLiteRunner 處理)
+        with TFLiteRunner(tflite_model_path) as runner:
+            tflite_pred = runner.predict(test_data)
         
         # 計算差異
         mse = np.mean((original_pred - tflite_pred) ** 2)
@@ -254,6 +393,23 @@ const unsigned char model_data[] = {{
         print(f"原始預測: {original_pred[0]}")
         print(f"TFLite預測: {tflite_pred[0]}")
         
+        if emulate and runner.is_quantized:
+            try:
+                emulator = Int8Emulator(tflite_model_path)
+            except NotImplementedError as e:
+                print(f"無法模擬設備計算: {e}")
+                return mse, max_diff
+            
+            device_pred = emulator.predict(test_data)
+            device_levels = np.argmax(device_pred, axis=1)
+            print(f"設備模擬預測: {device_pred[0]}")
+            print(f"設備與主機解釋器的分類一致率: "
+                  f"{np.mean(device_levels == np.argmax(tflite_pred, axis=1)):.2%}")
+            print(f"設備與原始模型的分類一致率: "
+                  f"{np.mean(device_levels == np.argmax(original_pred, axis=1)):.2%}")
+            print(f"設備與原始模型的最大差異: {np.max(np.abs(original_pred - device_pred)):.6f}")
+            emulator.report(emulator.layer_errors(test_data))
+        
         return mse, max_diff
 
 def main():
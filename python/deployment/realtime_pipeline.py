@@ -0,0 +1,257 @@
+"""
+實時推理管線
+採集線程把Arduino數據包打上到達時間放入隊列，處理線程逐樣本推進流式模型
+(StreamingInference 內部維護滑動窗口)，每 hop 個樣本輸出一次預測並以最近的原始樣本
+計算 ParkinsonAnalyzer 的症狀指標，持續生成評估，同時統計各階段的延遲
+"""
+
+import os
+import sys
+import time
+import queue
+import threading
+import numpy as np
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from machine_learning.streaming_inference import StreamingInference
+
+
+class RealTimePipeline:
+    """
+    採集 -> 滑動窗口 -> 模型 -> 症狀分析 的實時管線
+
+    每個評估記錄觸發它的樣本 (窗口中最新的樣本) 的延遲:
+    queue 為樣本在隊列中等待處理的時間，inference 為流式模型推進該樣本並輸出預測的時間，
+    analysis 為症狀分析和評估生成的時間，end_to_end 為從樣本讀出串口到評估完成的總時間。
+    """
+
+    STAGES = ('queue', 'inference', 'analysis', 'end_to_end')
+
+    def __init__(self, collector, streamer, analyzer, patient_id="REALTIME", analysis_window=200,
+                 on_assessment=None, target_latency_ms=100.0):
+        """
+        初始化管線
+
+        Args:
+            collector: 已連接的 ArduinoDataCollector
+            streamer: StreamingInference (其 hop 決定評估頻率)
+            analyzer: ParkinsonAnalyzer
+            patient_id: 評估使用的患者ID
+            analysis_window: 症狀分析使用的最近樣本數
+            on_assessment: 每次評估後的回調 fn(assessment, latency)，latency 為各階段毫秒數字典；
+                           默認打印一行摘要
+            target_latency_ms: 端到端延遲目標
+        """
+        self.collector = collector
+        self.streamer = streamer
+        self.analyzer = analyzer
+        self.patient_id = patient_id
+        self.analysis_window = max(streamer.sequence_length, analysis_window)
+        self.on_assessment = on_assessment or self._print_assessment
+        self.target_latency_ms = target_latency_ms
+
+        self.samples = deque(maxlen=self.analysis_window)
+        self.latencies = {stage: [] for stage in self.STAGES}
+        self.sample_latencies = []
+        self.num_samples = 0
+        self.num_assessments = 0
+        self.last_assessment = None
+        self.errors = []
+
+        self._running = threading.Event()
+        self._threads = []
+
+    # -- 採集線程 --
+
+    def _read_loop(self):
+        """讀取串口數據包；設備每次採集結束 (END) 後重新發送START保持數據流"""
+        self.collector.send_command("START")
+        while self._running.is_set():
+            line = self.collector.read_data_line()
+            arrival = time.perf_counter()
+            if not line:
+                continue
+            if line == "END":
+                if self._running.is_set():
+                    self.collector.send_command("START")
+                continue
+            if line.startswith("DATA"):
+                data = self.collector.parse_data_packet(line)
+                if data:
+                    data['arrival'] = arrival
+                    self.collector.data_queue.put(data)
+
+    # -- 處理線程 --
+
+    def _process_loop(self):
+        while self._running.is_set() or not self.collector.data_queue.empty():
+            try:
+                data = self.collector.data_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self.process_sample(data)
+            except Exception as e:
+                # 單個樣本的錯誤不中斷數據流
+                self.errors.append(str(e))
+                print(f"實時處理錯誤: {e}")
+
+    def process_sample(self, data):
+        """
+        處理一個數據包 (parse_data_packet 的格式，可帶 'arrival' 到達時間)
+
+        Returns:
+            生成評估時返回 (assessment, latency)，否則返回 None
+        """
+        dequeued = time.perf_counter()
+        arrival = data.get('arrival', dequeued)
+        self.samples.append(data)
+        self.num_samples += 1
+
+        sample = np.array(data['fingers'] + [data['emg']] + data['imu'], dtype=np.float32)
+        result = self.streamer.update(sample)
+        predicted = time.perf_counter()
+        self.sample_latencies.append((predicted - dequeued) * 1000)
+        if result is None:
+            return None
+
+        sensor_data = {
+            'fingers': [p['fingers'] for p in self.samples],
+            'emg': [p['emg'] for p in self.samples],
+            'imu': [p['imu'] for p in self.samples]
+        }
+        assessment = self.analyzer.generate_assessment(
+            patient_id=self.patient_id,
+            predicted_level=result['predicted_level'],
+            confidence=result['confidence'],
+            sensor_data=sensor_data
+        )
+        done = time.perf_counter()
+
+        latency = {
+            'queue': (dequeued - arrival) * 1000,
+            'inference': (predicted - dequeued) * 1000,
+            'analysis': (done - predicted) * 1000,
+            'end_to_end': (done - arrival) * 1000
+        }
+        for stage, value in latency.items():
+            self.latencies[stage].append(value)
+        self.num_assessments += 1
+        self.last_assessment = assessment
+        self.on_assessment(assessment, latency)
+        return assessment, latency
+
+    def _print_assessment(self, assessment, latency):
+        print(f"[{self.num_assessments}] 等級 {assessment.predicted_level}，"
+              f"置信度 {assessment.confidence:.3f}，端到端延遲 {latency['end_to_end']:.1f} ms")
+
+    # -- 運行控制 --
+
+    def start(self):
+        """啟動採集和處理線程"""
+        if self._running.is_set():
+            return
+        self.streamer.reset()
+        self.samples.clear()
+        self.collector.is_collecting = True
+        self._running.set()
+        self._threads = [
+            threading.Thread(target=self._read_loop, name="realtime_reader", daemon=True),
+            threading.Thread(target=self._process_loop, name="realtime_processor", daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """停止採集，處理完隊列中剩餘的樣本後返回"""
+        if not self._running.is_set():
+            return
+        self._running.clear()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.collector.is_collecting = False
+        self.collector.send_command("STOP")
+
+    def run(self, duration=None):
+        """
+        運行管線
+
+        Args:
+            duration: 運行秒數 (None 時運行到 Ctrl+C)
+
+        Returns:
+            latency_summary() 的結果
+        """
+        self.start()
+        try:
+            if duration is None:
+                while True:
+                    time.sleep(0.5)
+            else:
+                time.sleep(duration)
+        except KeyboardInterrupt:
+            print("\n停止實時分析")
+        finally:
+            self.stop()
+        return self.latency_summary()
+
+    def latency_summary(self):
+        """
+        各階段延遲統計 (毫秒)
+
+        Returns:
+            dict: 每個階段的 mean、p50、p95、max，以及 per_sample (每個樣本的模型推進時間)、
+                  num_samples、num_assessments、within_target (端到端 p95 是否低於目標)
+        """
+        def stats(values):
+            if not values:
+                return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+            values = np.asarray(values)
+            return {'mean': float(values.mean()), 'p50': float(np.percentile(values, 50)),
+                    'p95': float(np.percentile(values, 95)), 'max': float(values.max())}
+
+        summary = {stage: stats(values) for stage, values in self.latencies.items()}
+        summary['per_sample'] = stats(self.sample_latencies)
+        summary['num_samples'] = self.num_samples
+        summary['num_assessments'] = self.num_assessments
+        summary['within_target'] = (self.num_assessments > 0
+                                    and summary['end_to_end']['p95'] <= self.target_latency_ms)
+        return summary
+
+    def print_latency_summary(self, summary=None):
+        """打印延遲統計"""
+        summary = summary or self.latency_summary()
+        print(f"樣本數 {summary['num_samples']}，評估數 {summary['num_assessments']}")
+        print(f"{'階段':<12}{'平均':>9}{'P50':>9}{'P95':>9}{'最大':>9}  (ms)")
+        for stage in ('per_sample',) + self.STAGES:
+            s = summary[stage]
+            print(f"{stage:<12}{s['mean']:>9.2f}{s['p50']:>9.2f}{s['p95']:>9.2f}{s['max']:>9.2f}")
+        status = "達到" if summary['within_target'] else "未達到"
+        print(f"端到端延遲目標 {self.target_latency_ms:.0f} ms: {status}")
+
+
+def load_streaming_model(model, hop, model_path="models/parkinson_cnn_lstm.h5",
+                         numpy_path="models/parkinson_cnn_lstm_numpy.npz"):
+    """
+    加載流式推理模型: 優先使用已導出的NumPy模型，Keras模型更新時重新導出
+
+    Args:
+        model: ParkinsonCNNLSTMModel (Keras模型需要重新導出時使用)
+        hop: 每隔多少個樣本輸出一次預測
+
+    Returns:
+        StreamingInference，沒有可用模型時返回 None
+    """
+    keras_exists = os.path.exists(model_path)
+    if os.path.exists(numpy_path) and (not keras_exists or
+                                       os.path.getmtime(numpy_path) >= os.path.getmtime(model_path)):
+        return StreamingInference(numpy_path, hop=hop)
+    if not keras_exists:
+        print("模型文件不存在，請先訓練模型")
+        return None
+    if model.model is None:
+        model.load_model(model_path)
+    return model.create_streaming(hop=hop, path=numpy_path)
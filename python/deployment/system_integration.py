@@ -6,7 +6,6 @@
 import os
 import sys
 import json
-import numpy as np
 from datetime import datetime
 import argparse
 
@@ -15,7 +14,9 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from data_collection.arduino_collector import ArduinoDataCollector
 from machine_learning.cnn_lstm_model import ParkinsonCNNLSTMModel
+from machine_learning.hyperparameter_sweep import HyperparameterSweep
 from deployment.model_quantization import ModelQuantizer
+from deployment.realtime_pipeline import RealTimePipeline, load_streaming_model
 from analysis.parkinson_analyzer import ParkinsonAnalyzer
 
 class ParkinsonSystemIntegration:
@@ -110,10 +111,21 @@ class ParkinsonSystemIntegration:
         
         return False
     
-    def train_model(self):
-        """訓練模型"""
+    def train_model(self, epochs=100, batch_size=None, sweep=False, sweep_params=None):
+        """
+        訓練模型
+        
+        Args:
+            epochs: 訓練輪數
+            batch_size: 批次大小 (None使用模型配置的批次大小)
+            sweep: 是否先執行並行超參數搜索並導出最佳模型
+            sweep_params: 傳給 HyperparameterSweep 的參數字典
+        """
         print("\n=== 訓練CNN-LSTM模型 ===")
         
+        if sweep:
+            return self.sweep_model(**(sweep_params or {}))
+        
         if not self.model:
             self.model = ParkinsonCNNLSTMModel()
         
@@ -122,10 +134,6 @@ class ParkinsonSystemIntegration:
             df = self.model.load_and_preprocess_data("data")
             print(f"加載數據: {len(df)} 個數據點")
             
-            # 配置訓練參數
-            epochs = int(input("訓練輪數 (建議50-100): "))
-            batch_size = int(input("批次大小 (建議16-32): "))
-            
             # 訓練模型
             history = self.model.train_model(df, epochs=epochs, batch_size=batch_size)
             
@@ -140,8 +148,37 @@ class ParkinsonSystemIntegration:
             print(f"模型訓練失敗: {e}")
             return False
     
-    def quantize_and_deploy(self):
-        """量化並部署模型"""
+    def sweep_model(self, **sweep_params):
+        """
+        並行超參數搜索 (逐次減半提前淘汰差的試驗)，導出最佳模型和標準化器
+        
+        Args:
+            sweep_params: 傳給 HyperparameterSweep 的參數 (num_trials, max_epochs, num_workers 等)
+        """
+        try:
+            sweep = HyperparameterSweep(**sweep_params)
+            best = sweep.run("data")
+            sweep.export_best("models/parkinson_cnn_lstm.h5", "models/scaler.joblib")
+            
+            # 以最佳序列長度重建模型對象，供後續實時分析使用
+            self.model = ParkinsonCNNLSTMModel(sequence_length=best['config'].get('sequence_length', 50))
+            self.model.load_model("models/parkinson_cnn_lstm.h5")
+            
+            print("超參數搜索完成，最佳模型已保存")
+            return True
+            
+        except Exception as e:
+            print(f"超參數搜索失敗: {e}")
+            return False
+    
+    def quantize_and_deploy(self, prune=False, prune_params=None):
+        """
+        量化並部署模型
+        
+        Args:
+            prune: 是否先結構化剪枝並物理縮小模型，再量化剪枝後的模型
+            prune_params: 傳給 ParkinsonCNNLSTMModel.prune 的參數字典
+        """
         print("\n=== 量化並部署模型 ===")
         
         if not self.quantizer:
@@ -153,6 +190,15 @@ class ParkinsonSystemIntegration:
             return False
         
         try:
+            if prune:
+                print("剪枝模型...")
+                if not self.model:
+                    self.model = ParkinsonCNNLSTMModel()
+                pruned_path = "models/parkinson_cnn_lstm_pruned.h5"
+                self.model.prune("data", model_path=model_path, output_path=pruned_path,
+                                 **(prune_params or {}))
+                model_path = pruned_path
+            
             # 加載模型
             if not self.quantizer.load_keras_model(model_path):
                 return False
@@ -163,7 +209,11 @@ class ParkinsonSystemIntegration:
             
             # 量化模型
             print("量化模型...")
-            self.quantizer.convert_to_quantized_tflite()
+            if not self.quantizer.convert_to_quantized_tflite():
+                return False
+            if self.quantizer.quantization_mode != 'int8':
+                print("模型無法全整數量化，不生成Arduino頭文件 (動態範圍量化模型只能在主機上運行)")
+                return False
             
             # 生成Arduino頭文件
             print("生成Arduino頭文件...")
@@ -207,10 +257,24 @@ class ParkinsonSystemIntegration:
         print("2. 進行實時帕金森分析")
         print("3. 使用個性化訓練功能")
     
-    def real_time_analysis(self):
-        """實時分析測試"""
+    def real_time_analysis(self, duration=10, hop=10, analysis_window=200):
+        """
+        實時分析: 採集的樣本逐個送入流式模型，每 hop 個樣本生成一次評估
+        
+        Args:
+            duration: 運行秒數 (None 時運行到 Ctrl+C)
+            hop: 每隔多少個樣本輸出一次預測和評估
+            analysis_window: 症狀分析使用的最近樣本數
+        """
         print("\n=== 實時分析測試 ===")
         
+        if not self.model:
+            self.model = ParkinsonCNNLSTMModel()
+        
+        streamer = load_streaming_model(self.model, hop)
+        if streamer is None:
+            return None
+        
         if not self.collector:
             self.collector = ArduinoDataCollector(port=self.arduino_port)
         
@@ -219,51 +283,24 @@ class ParkinsonSystemIntegration:
         
         if not self.collector.connect():
             print("無法連接Arduino")
-            return
+            return None
         
         try:
-            print("開始收集實時數據進行分析...")
+            print(f"開始實時分析 (每 {hop} 個樣本評估一次)...")
+            pipeline = RealTimePipeline(self.collector, streamer, self.analyzer,
+                                        patient_id="REALTIME_TEST", analysis_window=analysis_window)
+            summary = pipeline.run(duration)
+            pipeline.print_latency_summary(summary)
             
-            # 模擬實時分析
-            session_data = self.collector.collect_data_session(
-                duration=10,
-                patient_id="REALTIME_TEST",
-                parkinson_level=None
-            )
+            if pipeline.last_assessment:
+                # 打印並保存最後一次評估報告
+                self.analyzer.print_assessment_report(pipeline.last_assessment)
+                self.analyzer.save_assessment(pipeline.last_assessment)
+            else:
+                print("未收到足夠的數據生成評估")
+            
+            return summary
             
-            if session_data:
-                # 準備傳感器數據
-                sensor_data = {
-                    'fingers': [],
-                    'emg': [],
-                    'imu': []
-                }
-                
-                for point in session_data['data']:
-                    sensor_data['fingers'].append(point['fingers'])
-                    sensor_data['emg'].append(point['emg'])
-                    sensor_data['imu'].append(point['imu'])
-                
-                # 模擬AI預測（實際應使用訓練好的模型）
-                predicted_level = np.random.randint(1, 6)
-                confidence = np.random.uniform(0.7, 0.95)
-                
-                print(f"模擬AI預測結果: 等級 {predicted_level}, 置信度 {confidence:.3f}")
-                
-                # 生成分析報告
-                assessment = self.analyzer.generate_assessment(
-                    patient_id="REALTIME_TEST",
-                    predicted_level=predicted_level,
-                    confidence=confidence,
-                    sensor_data=sensor_data
-                )
-                
-                # 打印報告
-                self.analyzer.print_assessment_report(assessment)
-                
-                # 保存報告
-                self.analyzer.save_assessment(assessment)
-                
         finally:
             self.collector.disconnect()
     
@@ -319,6 +356,16 @@ def main():
     parser.add_argument('--port', default='COM3', help='Arduino端口')
     parser.add_argument('--mode', choices=['collect', 'train', 'deploy', 'full', 'test'], 
                        default='full', help='運行模式')
+    parser.add_argument('--epochs', type=int, default=100, help='訓練輪數')
+    parser.add_argument('--batch-size', type=int, default=None, help='批次大小 (默認按模型配置)')
+    parser.add_argument('--sweep', action='store_true', help='訓練前執行並行超參數搜索')
+    parser.add_argument('--trials', type=int, default=12, help='超參數搜索的試驗數量')
+    parser.add_argument('--workers', type=int, default=None, help='超參數搜索的並行進程數')
+    parser.add_argument('--prune', action='store_true', help='量化前剪枝並縮小模型')
+    parser.add_argument('--prune-fraction', type=float, default=0.5, help='每層剪掉的濾波器/單元比例')
+    parser.add_argument('--sparsity', type=float, default=0.5, help='幅度剪枝的最終稀疏度')
+    parser.add_argument('--duration', type=float, default=10, help='實時分析的運行秒數 (0 表示運行到 Ctrl+C)')
+    parser.add_argument('--hop', type=int, default=10, help='實時分析每隔多少個樣本評估一次')
     
     args = parser.parse_args()
     
@@ -329,11 +376,14 @@ def main():
     if args.mode == 'collect':
         system.collect_training_data()
     elif args.mode == 'train':
-        system.train_model()
+        system.train_model(epochs=args.epochs, batch_size=args.batch_size, sweep=args.sweep,
+                           sweep_params={'num_trials': args.trials, 'num_workers': args.workers})
     elif args.mode == 'deploy':
-        system.quantize_and_deploy()
+        system.quantize_and_deploy(prune=args.prune,
+                                   prune_params={'structured_fraction': args.prune_fraction,
+                                                 'sparsity': args.sparsity})
     elif args.mode == 'test':
-        system.real_time_analysis()
+        system.real_time_analysis(duration=args.duration or None, hop=args.hop)
     else:
         system.full_pipeline_setup()
     
@@ -0,0 +1,177 @@
+"""
+主機端TFLite推理
+以與設備相同的 .tflite 模型在網關上提供預測: 模型文件由TFLite內存映射，
+每個工作線程一個預先分配好張量的解釋器，自動處理int8輸入量化和輸出反量化
+"""
+
+import os
+import threading
+import numpy as np
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TFLiteRunner:
+    """
+    可重用的TFLite推理器
+
+    解釋器按線程緩存 (TFLite 解釋器不是線程安全的)，invoke 期間釋放GIL，
+    因此多個線程可以並行推理。模型的批次維度為動態時按批次推理，
+    否則 (如 ModelQuantizer 導出的批次1模型) 在預先分配的張量上逐窗口推理。
+    """
+
+    def __init__(self, model_path, num_threads=1, pool_size=1, batch_size=64, scaler=None):
+        """
+        初始化推理器
+
+        Args:
+            model_path: .tflite 模型文件 (TFLite 以內存映射方式加載，多個解釋器共享頁緩存)
+            num_threads: 每個解釋器的算子內線程數
+            pool_size: 並行推理的工作線程數 (每個線程一個解釋器)
+            batch_size: 動態批次模型每次推理的窗口數，也是分配給工作線程的塊大小
+            scaler: 可選的 StandardScaler，提供時 predict 接受原始 (未標準化) 窗口
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"模型文件不存在: {model_path}")
+
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.pool_size = max(1, pool_size)
+        self.batch_size = max(1, batch_size)
+        self.mean = None if scaler is None else scaler.mean_.astype(np.float32)
+        self.scale = None if scaler is None else scaler.scale_.astype(np.float32)
+
+        self._local = threading.local()
+        self._interpreters = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+        # 在當前線程創建第一個解釋器並讀取輸入輸出信息
+        interpreter = self._interpreter()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in input_details['shape_signature'][1:])
+        self.input_dtype = input_details['dtype']
+        self.output_dtype = output_details['dtype']
+        self.input_quantization = input_details['quantization']
+        self.output_quantization = output_details['quantization']
+        self.num_classes = int(output_details['shape'][-1])
+        self.dynamic_batch = int(input_details['shape_signature'][0]) == -1
+
+    @property
+    def is_quantized(self):
+        """輸入是否為整數量化張量"""
+        return np.issubdtype(self.input_dtype, np.integer)
+
+    def _interpreter(self):
+        """當前線程的解釋器 (首次使用時創建並分配張量)"""
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = tf.lite.Interpreter(model_path=self.model_path, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.batch = int(interpreter.get_input_details()[0]['shape'][0])
+            with self._lock:
+                self._interpreters.append(interpreter)
+        return interpreter
+
+    def _resize(self, interpreter, batch):
+        """動態批次模型按需調整輸入批次並重新分配張量"""
+        if self._local.batch != batch:
+            index = interpreter.get_input_details()[0]['index']
+            interpreter.resize_tensor_input(index, (batch,) + self.input_shape, strict=True)
+            interpreter.allocate_tensors()
+            self._local.batch = batch
+
+    def quantize(self, windows):
+        """把標準化後的浮點窗口轉換為模型的輸入類型"""
+        if not self.is_quantized:
+            return windows.astype(self.input_dtype, copy=False)
+        scale, zero_point = self.input_quantization
+        info = np.iinfo(self.input_dtype)
+        return np.clip(np.round(windows / scale + zero_point), info.min, info.max).astype(self.input_dtype)
+
+    def dequantize(self, outputs):
+        """把模型輸出轉換為浮點概率"""
+        if not np.issubdtype(self.output_dtype, np.integer):
+            return outputs.astype(np.float32, copy=False)
+        scale, zero_point = self.output_quantization
+        return ((outputs.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+    def _run_chunk(self, chunk):
+        """在當前線程的解釋器上推理一塊已量化的窗口"""
+        interpreter = self._interpreter()
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+
+        if self.dynamic_batch:
+            self._resize(interpreter, len(chunk))
+            interpreter.set_tensor(input_index, chunk)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index).copy()
+
+        outputs = np.empty((len(chunk), self.num_classes), dtype=self.output_dtype)
+        for i in range(len(chunk)):
+            interpreter.set_tensor(input_index, chunk[i:i + 1])
+            interpreter.invoke()
+            outputs[i] = interpreter.get_tensor(output_index)[0]
+        return outputs
+
+    def predict(self, windows):
+        """
+        批次推理
+
+        Args:
+            windows: (N, T, C) 或單個 (T, C) 窗口；構造時提供了 scaler 則為原始窗口，
+                     否則為已標準化的窗口
+
+        Returns:
+            (N, 類別數) 浮點概率
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim == 2:
+            windows = windows[None]
+        if windows.shape[1:] != self.input_shape:
+            raise ValueError(f"輸入形狀 {windows.shape[1:]} 與模型 {self.input_shape} 不符")
+        if self.mean is not None:
+            windows = (windows - self.mean) / self.scale
+
+        quantized = self.quantize(windows)
+        chunks = [quantized[i:i + self.batch_size] for i in range(0, len(quantized), self.batch_size)]
+        if not chunks:
+            return np.zeros((0, self.num_classes), dtype=np.float32)
+
+        if self.pool_size == 1 or len(chunks) == 1:
+            outputs = [self._run_chunk(chunk) for chunk in chunks]
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size,
+                                                    thread_name_prefix="tflite_runner")
+            outputs = list(self._executor.map(self._run_chunk, chunks))
+
+        return self.dequantize(np.concatenate(outputs))
+
+    def predict_levels(self, windows):
+        """
+        預測帕金森等級
+
+        Returns:
+            (等級 1-5, 置信度, 概率)
+        """
+        probabilities = self.predict(windows)
+        return np.argmax(probabilities, axis=1) + 1, probabilities.max(axis=1), probabilities
+
+    def close(self):
+        """關閉工作線程並釋放解釋器"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            self._interpreters.clear()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,395 @@
+"""
+延遲感知的傳感器模型結構搜索
+枚舉 create_model 的結構變體 (CNN-LSTM、CNN-GRU、純卷積TCN、較少的濾波器、較短的窗口)，
+在進程池中並行地短時訓練每個候選，經 ModelQuantizer 量化為TFLite，
+估計微控制器上的乘加運算量 (MACs)、Flash 和張量區大小，測量主機上的TFLite推理延遲，
+最後輸出準確率與各項成本的 Pareto 前沿
+"""
+
+import os
+import sys
+import time
+import multiprocessing
+import numpy as np
+
+try:
+    from .hyperparameter_sweep import HyperparameterSweep, config_hash, _load_windows, _trial_dir
+except ImportError:
+    from hyperparameter_sweep import HyperparameterSweep, config_hash, _load_windows, _trial_dir
+
+# 候選結構: architecture 為 'lstm'、'gru' 或 'tcn' (純卷積)，TCN 只使用 lstm_units 的最後一項
+DEFAULT_CANDIDATES = [
+    {'name': 'cnn_lstm', 'architecture': 'lstm', 'filters': [64, 128, 256],
+     'lstm_units': [128, 64], 'kernel_size': 3, 'sequence_length': 50},
+    {'name': 'cnn_lstm_small', 'architecture': 'lstm', 'filters': [16, 32, 64],
+     'lstm_units': [32, 16], 'kernel_size': 3, 'sequence_length': 50},
+    {'name': 'cnn_gru', 'architecture': 'gru', 'filters': [32, 64, 128],
+     'lstm_units': [64, 32], 'kernel_size': 3, 'sequence_length': 50},
+    {'name': 'cnn_gru_small', 'architecture': 'gru', 'filters': [16, 32, 64],
+     'lstm_units': [32, 16], 'kernel_size': 3, 'sequence_length': 50},
+    {'name': 'tcn', 'architecture': 'tcn', 'filters': [32, 64, 128],
+     'lstm_units': [64], 'kernel_size': 3, 'sequence_length': 50},
+    {'name': 'tcn_small_k5', 'architecture': 'tcn', 'filters': [16, 32, 32],
+     'lstm_units': [32], 'kernel_size': 5, 'sequence_length': 50},
+    {'name': 'cnn_lstm_small_t30', 'architecture': 'lstm', 'filters': [16, 32, 64],
+     'lstm_units': [32, 16], 'kernel_size': 3, 'sequence_length': 30},
+    {'name': 'tcn_small_t30', 'architecture': 'tcn', 'filters': [16, 32, 32],
+     'lstm_units': [32], 'kernel_size': 5, 'sequence_length': 30},
+]
+
+# Pareto 前沿的成本維度 (越小越好)
+COST_KEYS = ('macs', 'flash_kb', 'arena_kb', 'latency_ms')
+
+
+def estimate_macs(model):
+    """
+    估計單個窗口推理的乘加運算量
+
+    計入 Conv1D、Dense、LSTM 和 GRU；BatchNormalization 在轉換時折疊進卷積，
+    池化和逐元素運算的開銷相對很小，不計入。
+    """
+    from tensorflow.keras import layers
+
+    macs = 0
+    for layer in model.layers:
+        input_shape = layer.input.shape if not isinstance(layer.input, (list, tuple)) else None
+        if input_shape is None:
+            continue
+        if isinstance(layer, layers.Conv1D):
+            length, out_channels = layer.output.shape[1], layer.output.shape[2]
+            macs += length * out_channels * layer.kernel_size[0] * input_shape[-1]
+        elif isinstance(layer, layers.Dense):
+            positions = int(np.prod(input_shape[1:-1])) if len(input_shape) > 2 else 1
+            macs += positions * input_shape[-1] * layer.units
+        elif isinstance(layer, (layers.LSTM, layers.GRU)):
+            gates = 4 if isinstance(layer, layers.LSTM) else 3
+            macs += input_shape[1] * gates * layer.units * (input_shape[-1] + layer.units)
+    return int(macs)
+
+
+def tflite_arena_estimate(interpreter):
+    """
+    按張量生命週期估計 TFLite Micro 張量區的大小 (字節)
+
+    非常量張量 (模型輸入和各算子的輸出) 從產生到最後一次被使用期間佔用內存，
+    返回執行過程中同時存活的張量大小之和的峰值。實際張量區還包括算子的臨時緩衝區
+    和對齊填充，因此這是下限估計。
+    """
+    sizes = {d['index']: int(np.prod(d['shape'])) * np.dtype(d['dtype']).itemsize
+             for d in interpreter.get_tensor_details()}
+    ops = interpreter._get_ops_details()
+
+    first_use, last_use = {}, {}
+    for index in (d['index'] for d in interpreter.get_input_details()):
+        first_use[index] = 0
+    for position, op in enumerate(ops):
+        for index in op['outputs']:
+            first_use.setdefault(int(index), position)
+    for position, op in enumerate(ops):
+        for index in list(op['inputs']) + list(op['outputs']):
+            if int(index) in first_use:
+                last_use[int(index)] = position
+    for index in (d['index'] for d in interpreter.get_output_details()):
+        last_use[index] = len(ops)
+
+    peak = 0
+    for position in range(len(ops)):
+        live = sum(sizes.get(index, 0) for index, start in first_use.items()
+                   if start <= position <= last_use.get(index, start))
+        peak = max(peak, live)
+    return peak
+
+
+def measure_tflite(tflite_path, X, y, num_runs=200, max_eval=1000):
+    """
+    在主機上測量TFLite模型的單窗口推理延遲和準確率
+
+    Args:
+        tflite_path: TFLite模型文件
+        X: 標準化後的評估窗口 (N, T, C)
+        y: 標籤
+        num_runs: 延遲測量的推理次數 (單線程，取中位數)
+        max_eval: 評估準確率的最大窗口數
+
+    Returns:
+        dict: latency_ms, latency_p95_ms, tflite_accuracy, arena_kb
+    """
+    import tensorflow as tf
+
+    interpreter = tf.lite.Interpreter(model_path=tflite_path, num_threads=1)
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()[0]
+    output_details = interpreter.get_output_details()[0]
+
+    def quantize(window):
+        scale, zero_point = input_details['quantization']
+        if input_details['dtype'] == np.float32 or scale == 0:
+            return window[None].astype(np.float32)
+        return np.clip(np.round(window / scale + zero_point), -128, 127)[None].astype(input_details['dtype'])
+
+    def predict(window):
+        interpreter.set_tensor(input_details['index'], quantize(window))
+        interpreter.invoke()
+        return int(np.argmax(interpreter.get_tensor(output_details['index'])[0]))
+
+    for window in X[:10]:
+        predict(window)
+    times = []
+    for i in range(num_runs):
+        start = time.perf_counter()
+        predict(X[i % len(X)])
+        times.append((time.perf_counter() - start) * 1000)
+
+    count = min(max_eval, len(y))
+    predictions = np.array([predict(window) for window in X[:count]])
+
+    return {
+        'latency_ms': float(np.median(times)),
+        'latency_p95_ms': float(np.percentile(times, 95)),
+        'tflite_accuracy': float(np.mean(predictions == y[:count])),
+        'arena_kb': tflite_arena_estimate(interpreter) / 1024
+    }
+
+
+def pareto_front(records, cost_keys=COST_KEYS):
+    """
+    準確率越高、各項成本越低越好，返回不被任何其他候選支配的記錄
+
+    候選 a 支配 b: a 的準確率不低於 b 且每項成本不高於 b，並至少一項嚴格更好
+    """
+    def dominates(a, b):
+        no_worse = a['accuracy'] >= b['accuracy'] and all(a[k] <= b[k] for k in cost_keys)
+        better = a['accuracy'] > b['accuracy'] or any(a[k] < b[k] for k in cost_keys)
+        return no_worse and better
+
+    return [r for r in records if not any(dominates(other, r) for other in records if other is not r)]
+
+
+def _convert_candidate(model_path, tflite_path, calibration_path, full_integer):
+    """在獨立子進程中量化候選模型 (個別算子的校準崩潰不會中止整個搜索)"""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from deployment.model_quantization import ModelQuantizer
+
+    calibration = np.load(calibration_path)
+
+    def representative_data_gen():
+        for window in calibration:
+            yield [window[None]]
+
+    quantizer = ModelQuantizer()
+    if not quantizer.load_keras_model(model_path):
+        sys.exit(1)
+    if not quantizer.convert_to_quantized_tflite(tflite_path, representative_dataset=representative_data_gen,
+                                                 full_integer=full_integer, isolate=False):
+        sys.exit(1)
+
+
+def _quantize_in_subprocess(model_path, tflite_path, calibration_path):
+    """
+    先嘗試全整數量化，失敗 (包括進程崩潰) 時退回動態範圍量化
+
+    Returns:
+        使用的量化方式 'int8'、'dynamic'，兩者都失敗時為 None
+    """
+    context = multiprocessing.get_context('spawn')
+    for mode, full_integer in (('int8', True), ('dynamic', False)):
+        if os.path.exists(tflite_path):
+            os.remove(tflite_path)
+        process = context.Process(target=_convert_candidate,
+                                  args=(model_path, tflite_path, calibration_path, full_integer))
+        process.start()
+        process.join()
+        if process.exitcode == 0 and os.path.exists(tflite_path):
+            return mode
+        print(f"{os.path.basename(model_path)}: {mode} 量化失敗 (退出碼 {process.exitcode})")
+    return None
+
+
+def _run_candidate(task):
+    """在工作進程中訓練一個候選結構，量化並測量其成本"""
+    search_dir, trial_id, config, rung, epochs, initial_epoch, params, num_threads = task
+
+    import tensorflow as tf
+    from tensorflow import keras
+    try:
+        from .cnn_lstm_model import ParkinsonCNNLSTMModel
+        from .distillation import keras_footprint
+    except ImportError:
+        from cnn_lstm_model import ParkinsonCNNLSTMModel
+        from distillation import keras_footprint
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass  # 運行時已初始化 (當前進程內執行)
+
+    data_dir = os.path.join(search_dir, "data")
+    sequence_length = config['sequence_length']
+    X_train, y_train = _load_windows(data_dir, sequence_length, params['hop'], True)
+    X_val, y_val = _load_windows(data_dir, sequence_length, params['hop'], False)
+
+    trial_dir = _trial_dir(search_dir, trial_id)
+    os.makedirs(trial_dir, exist_ok=True)
+    model_path = os.path.join(trial_dir, "model.h5")
+    tflite_path = os.path.join(trial_dir, "model_quantized.tflite")
+    calibration_path = os.path.join(trial_dir, "calibration.npy")
+
+    keras.utils.set_random_seed(params['seed'] + trial_id)
+    model = ParkinsonCNNLSTMModel(sequence_length, X_train.shape[2], profile=params['profile'])
+    batch_size = config.get('batch_size') or model.profile['batch_size']
+    architecture = config.get('architecture', 'lstm')
+    model.create_model(num_classes=params['num_classes'], batch_size=batch_size,
+                       filters=tuple(config['filters']),
+                       lstm_units=tuple(config['lstm_units']),
+                       dropout=config.get('dropout', 0.2), learning_rate=config.get('learning_rate'),
+                       kernel_size=config.get('kernel_size', 3),
+                       recurrent=None if architecture == 'tcn' else architecture)
+
+    start_time = time.perf_counter()
+    model.model.fit(X_train, y_train, batch_size=batch_size, epochs=epochs, shuffle=True, verbose=0)
+    train_time = time.perf_counter() - start_time
+    val_loss, val_accuracy = model.model.evaluate(X_val, y_val, batch_size=batch_size, verbose=0)
+    model.model.save(model_path)
+
+    rng = np.random.default_rng(params['seed'])
+    calibration = X_train[rng.choice(len(X_train), min(params['calibration_windows'], len(X_train)),
+                                     replace=False)]
+    np.save(calibration_path, calibration)
+
+    result = {
+        'trial_id': trial_id,
+        'rung': rung,
+        'epochs': epochs,
+        'config': config,
+        'val_loss': float(val_loss),
+        'val_accuracy': float(val_accuracy),
+        'params': int(model.model.count_params()),
+        'macs': estimate_macs(model.model),
+        'train_time': train_time
+    }
+
+    quantization = _quantize_in_subprocess(model_path, tflite_path, calibration_path)
+    result['quantization'] = quantization
+    if quantization is None:
+        # 無法轉換時按參數數和激活大小估計 (int8)
+        footprint = keras_footprint(model.model)
+        result.update({'flash_kb': footprint['flash_int8_kb'], 'arena_kb': footprint['ram_int8_kb'],
+                       'latency_ms': float('nan'), 'latency_p95_ms': float('nan'),
+                       'tflite_accuracy': float('nan')})
+    else:
+        result['flash_kb'] = os.path.getsize(tflite_path) / 1024
+        result.update(measure_tflite(tflite_path, X_val, y_val, num_runs=params['latency_runs']))
+
+    return result
+
+
+class ArchitectureSearch(HyperparameterSweep):
+    """
+    延遲感知的結構搜索
+
+    與超參數搜索共用按患者劃分的數據準備、結果存儲和進程池，但每個候選只訓練一輪
+    固定的輪數 (短時訓練用於排序，不是最終模型)，並在同一工作進程中完成量化和測量。
+    準確率採用量化後TFLite模型的準確率 (量化失敗時退回Keras模型的驗證準確率)。
+    """
+
+    def __init__(self, search_dir="models/architecture_search", candidates=None, epochs=5,
+                 num_workers=None, threads_per_worker=None, profile='default', hop=1,
+                 val_fraction=0.2, calibration_windows=100, latency_runs=200, seed=42):
+        """
+        初始化結構搜索
+
+        Args:
+            search_dir: 候選模型和結果存儲目錄
+            candidates: 候選配置列表 (None使用 DEFAULT_CANDIDATES)
+            epochs: 每個候選的訓練輪數
+            num_workers: 並行進程數，None為 min(候選數, CPU核心數)，1表示在當前進程中依次執行
+            threads_per_worker: 每個進程的線程數，None時平分CPU核心
+            profile: 模型訓練配置 (見 MODEL_PROFILES)
+            hop: 窗口步長
+            val_fraction: 驗證患者比例
+            calibration_windows: 量化校準的窗口數
+            latency_runs: 延遲測量的推理次數
+            seed: 劃分和訓練的隨機種子
+        """
+        self.candidates = candidates or DEFAULT_CANDIDATES
+        super().__init__(search_dir, num_trials=len(self.candidates), min_epochs=epochs,
+                         max_epochs=epochs, num_workers=num_workers,
+                         threads_per_worker=threads_per_worker, profile=profile, hop=hop,
+                         val_fraction=val_fraction, seed=seed)
+        self.epochs = epochs
+        self.calibration_windows = calibration_windows
+        self.latency_runs = latency_runs
+
+    def run(self, data_dir="data", num_classes=5):
+        """
+        執行搜索
+
+        Returns:
+            (全部候選的記錄, Pareto 前沿的記錄)
+        """
+        num_train, num_val = self.prepare_data(data_dir)
+        params = {'hop': self.hop, 'seed': self.seed, 'profile': self.profile,
+                  'num_classes': num_classes, 'calibration_windows': self.calibration_windows,
+                  'latency_runs': self.latency_runs}
+        # 只複用候選配置、訓練輪數、搜索參數和數據都一致的記錄
+        search_hash = config_hash(self.epochs, self.val_fraction, params, self.data_hash)
+        self.fingerprints = {trial_id: config_hash(search_hash, trial_id, config)
+                             for trial_id, config in enumerate(self.candidates)}
+        completed = self.store.completed(self.fingerprints)
+
+        print(f"結構搜索: {len(self.candidates)} 個候選，每個訓練 {self.epochs} 輪，"
+              f"{self.num_workers} 個進程 × {self.threads_per_worker} 線程 "
+              f"(訓練會話 {num_train}，驗證會話 {num_val})")
+
+        tasks = [(self.sweep_dir, trial_id, config, 0, self.epochs, 0, params, self.threads_per_worker)
+                 for trial_id, config in enumerate(self.candidates) if (trial_id, 0) not in completed]
+        records = [completed[(trial_id, 0)] for trial_id in range(len(self.candidates))
+                   if (trial_id, 0) in completed]
+
+        start_time = time.perf_counter()
+        for result in self._execute(tasks, _run_candidate):
+            result['fingerprint'] = self.fingerprints[result['trial_id']]
+            self.store.record(result)
+            records.append(result)
+
+        for record in records:
+            tflite_accuracy = record.get('tflite_accuracy')
+            record['accuracy'] = (tflite_accuracy if tflite_accuracy == tflite_accuracy
+                                  else record['val_accuracy'])
+        front = pareto_front(records)
+
+        print(f"\n搜索完成，耗時 {time.perf_counter() - start_time:.1f} 秒")
+        self.report(records, front)
+        return records, front
+
+    @staticmethod
+    def report(records, front):
+        """打印候選結構的準確率與成本 (* 標記 Pareto 前沿)"""
+        front_ids = {r['trial_id'] for r in front}
+        print(f"\n{'':2}{'候選':<22}{'量化':>8}{'Keras準確率':>12}{'TFLite準確率':>13}{'參數':>9}"
+              f"{'MACs':>11}{'Flash(KB)':>11}{'張量區(KB)':>11}{'延遲(ms)':>10}")
+        for r in sorted(records, key=lambda r: r['macs']):
+            mark = '*' if r['trial_id'] in front_ids else ''
+            print(f"{mark:2}{r['config'].get('name', r['trial_id']):<22}{str(r['quantization']):>8}"
+                  f"{r['val_accuracy']:>12.4f}{r['tflite_accuracy']:>13.4f}{r['params']:>9}"
+                  f"{r['macs']:>11}{r['flash_kb']:>11.1f}{r['arena_kb']:>11.1f}{r['latency_ms']:>10.3f}")
+
+
+def main():
+    """在合成會話上比較候選結構"""
+    try:
+        from .synthetic_data import SyntheticSensorGenerator
+    except ImportError:
+        from synthetic_data import SyntheticSensorGenerator
+
+    data_dir = "data/synthetic_sweep"
+    SyntheticSensorGenerator(seed=42).write_shards(data_dir, 1000, file_format='json',
+                                                   windows_per_session=10, num_workers=1)
+
+    search = ArchitectureSearch("models/architecture_search", epochs=5, hop=10)
+    search.run(data_dir)
+
+
+if __name__ == "__main__":
+    main()
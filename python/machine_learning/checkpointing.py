@@ -0,0 +1,428 @@
+"""
+異步檢查點和可續訓訓練
+在主線程中快照模型變量、優化器狀態、隨機數狀態和數據迭代位置，
+由後台線程寫入磁盤，中斷後可從最後一個檢查點準確續訓
+"""
+
+import json
+import os
+import random
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from tensorflow import keras
+
+LATEST_FILE = "latest.json"
+
+# 需要跨續訓保存的回調狀態 (EarlyStopping / ReduceLROnPlateau)
+CALLBACK_STATE_ATTRS = ('wait', 'best', 'best_epoch', 'stopped_epoch', 'cooldown_counter')
+
+
+def _write_npz(path, arrays):
+    """先寫臨時文件再原子替換，寫入中途被中斷不會留下損壞的文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, obj):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _scalar(value):
+    """回調狀態中的數值轉為可寫入JSON的Python類型"""
+    if value is None:
+        return None
+    return float(value) if isinstance(value, (float, np.floating)) else int(value)
+
+
+def save_weights_npz(path, weights):
+    """以 get_weights 的順序保存權重"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    _write_npz(path, {f"w{i}": w for i, w in enumerate(weights)})
+
+
+def load_weights_npz(model, path):
+    """加載 save_weights_npz 保存的權重"""
+    with np.load(path) as f:
+        model.set_weights([f[f"w{i}"] for i in range(len(f.files))])
+
+
+class ResumableBatchSequence(keras.utils.PyDataset):
+    """
+    順序只由 (種子, 輪次) 決定的批次序列
+
+    每輪的樣本排列為 default_rng([seed, epoch]).permutation(N)，因此知道輪次和
+    輪內已完成的步數就能從任意位置準確恢復數據迭代。
+    """
+
+    def __init__(self, num_samples, fetch_fn, batch_size, seed=42, epoch=0, start_step=0, shuffle=True):
+        """
+        Args:
+            num_samples: 樣本數
+            fetch_fn: fetch_fn(index, epoch, step) -> (X, y)，index 為本批次的樣本索引
+            batch_size: 批次大小
+            seed: 排列種子
+            epoch: 起始輪次
+            start_step: 起始輪次中跳過的已完成步數
+            shuffle: 是否每輪重新排列
+        """
+        super().__init__()
+        self.num_samples = num_samples
+        self.fetch_fn = fetch_fn
+        self.batch_size = batch_size
+        self.seed = seed
+        self.epoch = epoch
+        self.start_step = start_step
+        self.shuffle = shuffle
+        self.steps_per_epoch = int(np.ceil(num_samples / batch_size))
+        self._order_epoch = None
+        self._order = None
+
+    def __len__(self):
+        return self.steps_per_epoch - self.start_step
+
+    def order(self, epoch):
+        """第 epoch 輪的樣本順序"""
+        if self._order_epoch != epoch:
+            if self.shuffle:
+                self._order = np.random.default_rng([self.seed, epoch]).permutation(self.num_samples)
+            else:
+                self._order = np.arange(self.num_samples)
+            self._order_epoch = epoch
+        return self._order
+
+    def __getitem__(self, index):
+        step = index + self.start_step
+        batch_index = self.order(self.epoch)[step * self.batch_size:(step + 1) * self.batch_size]
+        return self.fetch_fn(batch_index, self.epoch, step)
+
+
+
+class EpochSyncCallback(keras.callbacks.Callback):
+    """每輪開始時把輪次同步到批次序列 (Keras 在訓練前會預讀批次並調用序列的 on_epoch_end，不能依賴它計數)"""
+
+    def __init__(self, sequence):
+        super().__init__()
+        self.sequence = sequence
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.sequence.epoch = epoch
+
+
+class AsyncCheckpointCallback(keras.callbacks.Callback):
+    """
+    異步檢查點回調
+
+    每輪結束 (以及可選的每 save_every_steps 步) 在主線程中把模型變量 (含BatchNorm
+    統計量和dropout的種子生成器)、優化器變量、NumPy/Python隨機數狀態、數據位置
+    (輪次, 輪內步數) 和 EarlyStopping/ReduceLROnPlateau 的內部狀態複製到內存，
+    由單個後台線程寫入；同時最多只有一個寫入在進行，訓練只在上一個寫入未完成時等待。
+    監控指標改善時另存最佳權重 (取代訓練中阻塞的 ModelCheckpoint HDF5 寫入)，
+    可選在訓練結束時由最佳權重生成一次可直接加載的Keras模型文件。
+    應放在回調列表的第一位。
+    """
+
+    def __init__(self, checkpoint_dir=None, save_every_steps=None, keep=2, best_path=None,
+                 monitor='val_accuracy', mode='max', tracked_callbacks=(), seed=42,
+                 best_model_path=None):
+        """
+        Args:
+            checkpoint_dir: 續訓檢查點目錄 (None表示只保存最佳權重)
+            save_every_steps: 輪內每隔多少步保存一次 (None表示只在輪末保存)
+            keep: 保留最近的檢查點數量
+            best_path: 最佳權重的 .npz 路徑 (None表示不保存)
+            monitor: 最佳權重的監控指標
+            mode: 'max' 或 'min'
+            tracked_callbacks: 需要隨檢查點保存和恢復狀態的回調
+            seed: 數據排列種子 (記錄在檢查點中用於校驗)
+            best_model_path: 訓練結束時以最佳權重保存的完整模型路徑 (如 .h5，None表示不保存；
+                             需要同時設定 best_path)
+        """
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.save_every_steps = save_every_steps
+        self.keep = keep
+        self.best_path = best_path
+        self.best_model_path = best_model_path
+        self.monitor = monitor
+        self.mode = mode
+        self.tracked_callbacks = list(tracked_callbacks)
+        self.seed = seed
+        self.step_offset = 0
+        self.end_weights = None
+        self.best = None
+        self._pending_state = None
+        self._pending_arrays = None
+        self._executor = None
+        self._future = None
+        self._epoch = 0
+        self.write_time = 0.0
+        self.snapshot_time = 0.0
+
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 回調狀態
+    # ------------------------------------------------------------------
+
+    def _capture_callback_state(self):
+        state, arrays = [], {}
+        for i, callback in enumerate(self.tracked_callbacks):
+            state.append({attr: _scalar(getattr(callback, attr)) for attr in CALLBACK_STATE_ATTRS
+                          if hasattr(callback, attr)})
+            best_weights = getattr(callback, 'best_weights', None)
+            if best_weights is not None:
+                for j, w in enumerate(best_weights):
+                    arrays[f"cb{i}_best_{j}"] = np.array(w)
+        return state, arrays
+
+    def _apply_callback_state(self):
+        for i, (callback, state) in enumerate(zip(self.tracked_callbacks, self._pending_state)):
+            for attr, value in state.items():
+                setattr(callback, attr, value)
+            keys = sorted((k for k in (self._pending_arrays or {}) if k.startswith(f"cb{i}_best_")),
+                          key=lambda k: int(k.rsplit('_', 1)[1]))
+            if keys and hasattr(callback, 'best_weights'):
+                callback.best_weights = [self._pending_arrays[k] for k in keys]
+        self._pending_state = None
+        self._pending_arrays = None
+
+    # ------------------------------------------------------------------
+    # 快照和寫入
+    # ------------------------------------------------------------------
+
+    def resume_from(self, meta):
+        """續訓時在下一輪開始前恢復最佳指標和被跟踪回調的狀態"""
+        self.best = meta.get('best')
+        self._pending_state = meta['callback_state']
+        self._pending_arrays = meta['callback_arrays']
+
+    def _submit(self, fn, *args):
+        """等待上一個寫入完成 (並拋出其錯誤) 後提交新的寫入"""
+        if self._future is not None:
+            self._future.result()
+        self._future = self._executor.submit(fn, *args)
+
+    def _snapshot(self, epoch, step):
+        """在主線程中複製全部可續訓狀態"""
+        start_time = time.perf_counter()
+        arrays = {f"var_{i}": v.numpy() for i, v in enumerate(self.model.variables)}
+        arrays.update({f"opt_{i}": v.numpy() for i, v in enumerate(self.model.optimizer.variables)})
+
+        callback_state, callback_arrays = self._capture_callback_state()
+        arrays.update(callback_arrays)
+
+        np_state = np.random.get_state()
+        arrays['np_rng_keys'] = np_state[1].copy()
+
+        meta = {
+            'epoch': epoch,
+            'step': step,
+            'seed': self.seed,
+            'best': _scalar(self.best),
+            'callback_state': callback_state,
+            'np_rng': [np_state[0], int(np_state[2]), int(np_state[3]), float(np_state[4])],
+            'py_rng': random.getstate(),
+            'time': time.time()
+        }
+        self.snapshot_time += time.perf_counter() - start_time
+        return arrays, meta
+
+    def _write_checkpoint(self, arrays, meta):
+        start_time = time.perf_counter()
+        name = f"ckpt_{meta['epoch']:05d}_{meta['step']:07d}.npz"
+        arrays['meta'] = np.array(json.dumps(meta))
+        _write_npz(os.path.join(self.checkpoint_dir, name), arrays)
+        _write_json(os.path.join(self.checkpoint_dir, LATEST_FILE), {'checkpoint': name, **meta})
+
+        # 刪除較舊的檢查點
+        checkpoints = sorted(f for f in os.listdir(self.checkpoint_dir)
+                             if f.startswith("ckpt_") and f.endswith(".npz"))
+        for old in checkpoints[:-self.keep]:
+            os.remove(os.path.join(self.checkpoint_dir, old))
+        self.write_time += time.perf_counter() - start_time
+
+    def _save(self, epoch, step):
+        if self.checkpoint_dir:
+            self._submit(self._write_checkpoint, *self._snapshot(epoch, step))
+
+    def wait(self):
+        """等待所有寫入完成"""
+        if self._future is not None:
+            self._future.result()
+            self._future = None
+
+    # ------------------------------------------------------------------
+    # Keras回調
+    # ------------------------------------------------------------------
+
+    def on_train_begin(self, logs=None):
+        # 每次 fit 使用自己的寫入線程 (fit_resumable 可能對同一回調調用兩次 fit)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch = epoch
+        # 在其他回調的 on_train_begin 重置之後再恢復它們的狀態
+        if self._pending_state is not None:
+            self._apply_callback_state()
+
+    def on_train_batch_end(self, batch, logs=None):
+        step = batch + 1 + self.step_offset
+        if self.save_every_steps and step % self.save_every_steps == 0:
+            self._save(self._epoch, step)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.step_offset = 0
+        current = (logs or {}).get(self.monitor)
+        if self.best_path and current is not None:
+            improved = self.best is None or (current > self.best if self.mode == 'max' else current < self.best)
+            if improved:
+                self.best = current
+                self._submit(save_weights_npz, self.best_path, [np.array(w) for w in self.model.get_weights()])
+
+        # 位置記為下一輪的開始
+        self._save(epoch + 1, 0)
+
+    def on_train_end(self, logs=None):
+        # 記錄其他回調 (如 EarlyStopping 恢復最佳權重) 修改之前的權重和狀態
+        self.end_weights = self.model.get_weights()
+        self._pending_state, self._pending_arrays = self._capture_callback_state()
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._save_best_model()
+
+    def _save_best_model(self):
+        """以最佳權重保存完整模型 (主線程，只在訓練結束時寫一次)，之後恢復當前權重"""
+        if not self.best_model_path or not self.best_path or not os.path.exists(self.best_path):
+            return
+        current = self.model.get_weights()
+        load_weights_npz(self.model, self.best_path)
+        os.makedirs(os.path.dirname(self.best_model_path) or '.', exist_ok=True)
+        self.model.save(self.best_model_path)
+        self.model.set_weights(current)
+
+
+def latest_checkpoint(checkpoint_dir):
+    """最新檢查點的元數據，不存在時返回None"""
+    path = os.path.join(checkpoint_dir, LATEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def restore_checkpoint(model, checkpoint_dir):
+    """
+    從最新檢查點恢復模型變量、優化器狀態和隨機數狀態
+
+    Args:
+        model: 已編譯且結構相同的模型
+        checkpoint_dir: 檢查點目錄
+
+    Returns:
+        元數據字典 (epoch, step, callback_state, callback_arrays ...)，沒有檢查點時返回None
+    """
+    latest = latest_checkpoint(checkpoint_dir)
+    if latest is None:
+        return None
+
+    with np.load(os.path.join(checkpoint_dir, latest['checkpoint'])) as f:
+        meta = json.loads(str(f['meta']))
+        variables = model.variables
+        num_vars = sum(1 for k in f.files if k.startswith("var_"))
+        if num_vars != len(variables):
+            raise ValueError(f"檢查點的變量數 ({num_vars}) 與模型 ({len(variables)}) 不一致")
+        for i, v in enumerate(variables):
+            v.assign(f[f"var_{i}"])
+
+        if not model.optimizer.built:
+            model.optimizer.build(model.trainable_variables)
+        for i, v in enumerate(model.optimizer.variables):
+            v.assign(f[f"opt_{i}"])
+
+        meta['callback_arrays'] = {k: f[k] for k in f.files if k.startswith("cb")}
+        np_rng = meta['np_rng']
+        np.random.set_state((np_rng[0], f['np_rng_keys'], np_rng[1], np_rng[2], np_rng[3]))
+
+    py_rng = meta['py_rng']
+    random.setstate((py_rng[0], tuple(py_rng[1]), py_rng[2]))
+
+    print(f"已從檢查點恢復: {latest['checkpoint']} (第 {meta['epoch'] + 1} 輪，第 {meta['step']} 步)")
+    return meta
+
+
+def fit_resumable(model, num_samples, fetch_fn, batch_size, epochs, callbacks, checkpoint,
+                  validation_data=None, resume=False, seed=42, verbose=1):
+    """
+    以可續訓的批次序列訓練
+
+    resume=True 且存在檢查點時，恢復狀態並先補完被中斷的那一輪剩餘的步，
+    再從下一輪繼續，數據順序與未中斷的運行一致。
+
+    Args:
+        model: 已編譯的模型
+        num_samples: 訓練樣本數
+        fetch_fn: ResumableBatchSequence 的批次讀取函數
+        batch_size: 批次大小
+        epochs: 總輪數
+        callbacks: 回調列表 (checkpoint 應在第一位)
+        checkpoint: 其中的 AsyncCheckpointCallback
+        validation_data: 驗證數據
+        resume: 是否從檢查點續訓
+        seed: 數據排列種子
+        verbose: 訓練輸出級別
+
+    Returns:
+        合併後的 keras History
+    """
+    epoch, step = 0, 0
+    if resume and checkpoint.checkpoint_dir:
+        meta = restore_checkpoint(model, checkpoint.checkpoint_dir)
+        if meta is not None:
+            if meta['seed'] != seed:
+                raise ValueError(f"檢查點的數據種子 ({meta['seed']}) 與本次訓練 ({seed}) 不一致")
+            epoch, step = meta['epoch'], meta['step']
+            checkpoint.resume_from(meta)
+
+    if epoch >= epochs:
+        print("檢查點已完成全部訓練輪數")
+        return None
+
+    histories = []
+    if step > 0:
+        # 先補完被中斷的一輪
+        partial = ResumableBatchSequence(num_samples, fetch_fn, batch_size, seed, epoch, step)
+        checkpoint.step_offset = step
+        histories.append(model.fit(partial, validation_data=validation_data, initial_epoch=epoch,
+                                   epochs=epoch + 1, callbacks=list(callbacks) + [EpochSyncCallback(partial)],
+                                   shuffle=False, verbose=verbose))
+        epoch += 1
+        # 撤銷 EarlyStopping 在 on_train_end 中恢復的最佳權重，保持連續訓練的狀態
+        if not model.stop_training and epoch < epochs:
+            model.set_weights(checkpoint.end_weights)
+
+    if epoch < epochs and not model.stop_training:
+        sequence = ResumableBatchSequence(num_samples, fetch_fn, batch_size, seed, epoch)
+        # 批次順序由序列自身決定，不能讓Keras再打亂批次索引
+        histories.append(model.fit(sequence, validation_data=validation_data, initial_epoch=epoch,
+                                   epochs=epochs, callbacks=list(callbacks) + [EpochSyncCallback(sequence)],
+                                   shuffle=False, verbose=verbose))
+
+    history = histories[-1]
+    if len(histories) > 1:
+        for key, values in histories[0].history.items():
+            history.history[key] = list(values) + list(history.history.get(key, []))
+        history.epoch = histories[0].epoch + history.epoch
+
+    print(f"檢查點: 主線程快照 {checkpoint.snapshot_time:.2f} 秒，後台寫入 {checkpoint.write_time:.2f} 秒")
+    return history
@@ -15,52 +15,279 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import json
 import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+try:
+    from .data_pipeline import (FEATURE_COLUMNS, build_windows_from_frame, load_sessions,
+                                concatenate_sessions, create_window_dataset,
+                                sample_windows, subset_windows)
+    from .session_store import SessionStore
+    from .data_quality import DataQualityChecker, describe_flags
+    from .cross_validation import GroupKFoldRunner, group_kfold_indices
+    from .rehearsal_buffer import RehearsalBuffer
+    from .checkpointing import AsyncCheckpointCallback, fit_resumable
+    from .numpy_engine import export_numpy_model
+    from .streaming_inference import StreamingInference
+    from .pruning import (MagnitudePruningCallback, StructuredPruningCallback, strip_pruned,
+                          sparsity_summary)
+except ImportError:
+    from data_pipeline import (FEATURE_COLUMNS, build_windows_from_frame, load_sessions,
+                               concatenate_sessions, create_window_dataset,
+                               sample_windows, subset_windows)
+    from session_store import SessionStore
+    from data_quality import DataQualityChecker, describe_flags
+    from cross_validation import GroupKFoldRunner, group_kfold_indices
+    from rehearsal_buffer import RehearsalBuffer
+    from checkpointing import AsyncCheckpointCallback, fit_resumable
+    from numpy_engine import export_numpy_model
+    from streaming_inference import StreamingInference
+    from pruning import (MagnitudePruningCallback, StructuredPruningCallback, strip_pruned,
+                         sparsity_summary)
+
+# 訓練配置
+# default: 原有設定 (recurrent_dropout 使LSTM只能使用逐步展開的通用實現，學習率固定為0.001)
+# cpu_performance: 去掉 recurrent_dropout 以使用融合的LSTM實現，開啟XLA，
+#                  調整線程池，並以更大批次訓練 (學習率按批次大小縮放)
+MODEL_PROFILES = {
+    'default': {
+        'recurrent_dropout': 0.2,
+        'jit_compile': 'auto',
+        'batch_size': 32,
+        'base_learning_rate': 0.001,
+        'scale_learning_rate': False,
+        'intra_op_threads': None,
+        'inter_op_threads': None
+    },
+    'cpu_performance': {
+        'recurrent_dropout': 0.0,
+        'jit_compile': True,
+        'batch_size': 128,
+        'base_learning_rate': 0.001,
+        'scale_learning_rate': True,
+        'intra_op_threads': 0,      # 0 表示使用全部物理核心
+        'inter_op_threads': 2
+    }
+}
+
+BASE_BATCH_SIZE = 32
+
+
+def scaled_learning_rate(batch_size, base_learning_rate=0.001, base_batch_size=BASE_BATCH_SIZE):
+    """按批次大小縮放Adam學習率 (平方根規則，線性規則對Adam過於激進)"""
+    return base_learning_rate * np.sqrt(batch_size / base_batch_size)
+
+
+def configure_cpu_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    設定TensorFlow線程池 (必須在第一次執行TensorFlow運算之前調用)
+    
+    Args:
+        intra_op_threads: 單個運算內的並行線程數，0 表示物理核心數
+        inter_op_threads: 運算間的並行線程數
+    
+    Returns:
+        是否設定成功
+    """
+    try:
+        if intra_op_threads is not None:
+            if intra_op_threads == 0:
+                intra_op_threads = max(1, (os.cpu_count() or 2) // 2)
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads is not None:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        return True
+    except RuntimeError as e:
+        print(f"線程池設定未生效 (TensorFlow已初始化): {e}")
+        return False
+
+
+class StepTimeCallback(keras.callbacks.Callback):
+    """記錄每個訓練步的耗時並報告吞吐量"""
+    
+    def __init__(self, batch_size):
+        super().__init__()
+        self.batch_size = batch_size
+        self.step_times = []
+        self.epoch_step_times = []
+        self.epoch_times = []
+        self._step_start = None
+        self._epoch_start = None
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self.step_times = []
+        self._epoch_start = time.perf_counter()
+    
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.step_times.append(time.perf_counter() - self._step_start)
+    
+    def on_epoch_end(self, epoch, logs=None):
+        self.epoch_step_times.append(np.array(self.step_times))
+        self.epoch_times.append(time.perf_counter() - self._epoch_start)
+    
+    def summary(self, skip_first_epoch=True):
+        """
+        步時統計 (默認跳過第一輪的編譯和預熱)
+        
+        Returns:
+            dict: mean_ms, p50_ms, p95_ms, samples_per_second, epoch_time
+        """
+        skip = 1 if skip_first_epoch and len(self.epoch_step_times) > 1 else 0
+        epochs = self.epoch_step_times[skip:]
+        if not epochs:
+            return None
+        
+        times = np.concatenate(epochs)
+        return {
+            'epoch_time': float(np.mean(self.epoch_times[skip:])),
+            'mean_ms': float(times.mean() * 1000),
+            'p50_ms': float(np.percentile(times, 50) * 1000),
+            'p95_ms': float(np.percentile(times, 95) * 1000),
+            'samples_per_second': float(self.batch_size / times.mean())
+        }
+    
+    def on_train_end(self, logs=None):
+        stats = self.summary()
+        if stats is not None:
+            print(f"訓練步時: 平均 {stats['mean_ms']:.1f} ms, P50 {stats['p50_ms']:.1f} ms, "
+                  f"P95 {stats['p95_ms']:.1f} ms, 吞吐 {stats['samples_per_second']:.0f} 樣本/秒")
+
+
+def _train_profile(task):
+    """
+    在獨立進程中按一個配置訓練並計時 (compare_performance_profiles 的工作函數)
+
+    模型在任何TensorFlow運算之前創建，配置的線程池設定因此總能生效。
+    """
+    (sequence_length, feature_dim, name, data, train_windows, test_windows,
+     mean, scale, epochs, seed) = task
+    candidate = ParkinsonCNNLSTMModel(sequence_length, feature_dim, profile=name)
+    batch_size = candidate.profile['batch_size']
+
+    train_ds = create_window_dataset(
+        data, train_windows['starts'], train_windows['labels'], sequence_length,
+        mean, scale, batch_size=batch_size, seed=seed
+    )
+    test_ds = create_window_dataset(
+        data, test_windows['starts'], test_windows['labels'], sequence_length,
+        mean, scale, batch_size=batch_size, shuffle=False, deterministic=True
+    )
+
+    keras.utils.set_random_seed(seed)
+    candidate.create_model(num_classes=5, batch_size=batch_size)
+    timer = StepTimeCallback(batch_size)
+    history = candidate.model.fit(train_ds, validation_data=test_ds, epochs=epochs,
+                                  callbacks=[timer], verbose=0)
+    stats = timer.summary()
+
+    return {
+        'profile': name,
+        'batch_size': batch_size,
+        'learning_rate': float(candidate.model.optimizer.learning_rate.numpy()),
+        'intra_op_threads': tf.config.threading.get_intra_op_parallelism_threads(),
+        'inter_op_threads': tf.config.threading.get_inter_op_parallelism_threads(),
+        'epoch_time': stats['epoch_time'],
+        'step_ms': stats['mean_ms'],
+        'samples_per_second': stats['samples_per_second'],
+        'val_accuracy': max(history.history['val_accuracy'])
+    }
+
+
 class ParkinsonCNNLSTMModel:
-    def __init__(self, sequence_length=50, feature_dim=9):
+    def __init__(self, sequence_length=50, feature_dim=9, profile='default'):
         """
         初始化CNN-LSTM模型
         
         Args:
             sequence_length: 時間序列長度
             feature_dim: 特徵維度 (5個手指 + 1個EMG + 3個IMU = 9)
+            profile: 訓練配置名稱 (見 MODEL_PROFILES)
         """
+        if profile not in MODEL_PROFILES:
+            raise ValueError(f"未知的訓練配置: {profile}")
+        
         self.sequence_length = sequence_length
         self.feature_dim = feature_dim
+        self.profile_name = profile
+        self.profile = dict(MODEL_PROFILES[profile])
         self.model = None
         self.scaler = StandardScaler()
         self.label_encoder = LabelEncoder()
         self.history = None
+        self.step_timer = None
+        self.checkpoint = None
+        self.quality_checker = DataQualityChecker()
+        self._predict_fn = None
+        self._predict_model = None
         
-    def create_model(self, num_classes=5):
+        if self.profile['intra_op_threads'] is not None or self.profile['inter_op_threads'] is not None:
+            configure_cpu_threads(self.profile['intra_op_threads'], self.profile['inter_op_threads'])
+        
+    def create_model(self, num_classes=5, batch_size=None, filters=(64, 128, 256),
+                     lstm_units=(128, 64), dropout=0.2, learning_rate=None, kernel_size=3,
+                     recurrent='lstm', scale_learning_rate=None):
         """
         創建CNN-LSTM混合模型架構
         
         Args:
             num_classes: 分類數量 (帕金森等級1-5)
+            batch_size: 訓練批次大小，啟用學習率縮放時使用 (None使用配置的批次大小)
+            filters: 三個卷積層的濾波器數
+            lstm_units: 兩個LSTM層的單元數
+            dropout: 卷積層和LSTM層的dropout比例
+            learning_rate: Adam學習率 (None時使用配置的基礎學習率，需要時按批次大小縮放)
+            kernel_size: 卷積核大小
+            recurrent: 時序部分 'lstm'、'gru'，或 None 使用純卷積 (TCN: 膨脹因果卷積
+                       + 全局平均池化 + 寬度為 lstm_units[-1] 的全連接層)
+            scale_learning_rate: 是否按批次大小縮放基礎學習率 (None使用配置的設定，
+                                 僅 cpu_performance 默認縮放)
         """
+        if recurrent not in ('lstm', 'gru', None):
+            raise ValueError(f"不支持的時序結構: {recurrent}")
+        
+        # TCN 的卷積層使用因果填充和逐層加倍的膨脹率擴大感受野
+        if recurrent is None:
+            conv_options = [{'padding': 'causal', 'dilation_rate': 2 ** i} for i in range(3)]
+        else:
+            conv_options = [{'padding': 'same'}] * 3
+        
         # 輸入層
         input_layer = keras.Input(shape=(self.sequence_length, self.feature_dim))
         
         # CNN部分 - 提取局部特徵
         # 1D卷積層用於處理時間序列
-        conv1 = layers.Conv1D(filters=64, kernel_size=3, activation='relu', padding='same')(input_layer)
+        conv1 = layers.Conv1D(filters=filters[0], kernel_size=kernel_size, activation='relu',
+                              **conv_options[0])(input_layer)
         conv1 = layers.BatchNormalization()(conv1)
-        conv1 = layers.Dropout(0.2)(conv1)
+        conv1 = layers.Dropout(dropout)(conv1)
         
-        conv2 = layers.Conv1D(filters=128, kernel_size=3, activation='relu', padding='same')(conv1)
+        conv2 = layers.Conv1D(filters=filters[1], kernel_size=kernel_size, activation='relu',
+                              **conv_options[1])(conv1)
         conv2 = layers.BatchNormalization()(conv2)
         conv2 = layers.MaxPooling1D(pool_size=2)(conv2)
-        conv2 = layers.Dropout(0.2)(conv2)
+        conv2 = layers.Dropout(dropout)(conv2)
         
-        conv3 = layers.Conv1D(filters=256, kernel_size=3, activation='relu', padding='same')(conv2)
+        conv3 = layers.Conv1D(filters=filters[2], kernel_size=kernel_size, activation='relu',
+                              **conv_options[2])(conv2)
         conv3 = layers.BatchNormalization()(conv3)
-        conv3 = layers.Dropout(0.2)(conv3)
+        conv3 = layers.Dropout(dropout)(conv3)
         
-        # LSTM部分 - 捕捉時間依賴性
-        lstm1 = layers.LSTM(128, return_sequences=True, dropout=0.2, recurrent_dropout=0.2)(conv3)
-        lstm2 = layers.LSTM(64, return_sequences=False, dropout=0.2, recurrent_dropout=0.2)(lstm1)
+        # LSTM/GRU部分 - 捕捉時間依賴性
+        recurrent_dropout = self.profile['recurrent_dropout']
+        if recurrent is None:
+            lstm2 = layers.GlobalAveragePooling1D()(conv3)
+            lstm2 = layers.Dense(lstm_units[-1], activation='relu')(lstm2)
+        else:
+            rnn = layers.LSTM if recurrent == 'lstm' else layers.GRU
+            lstm1 = rnn(lstm_units[0], return_sequences=True, dropout=dropout,
+                        recurrent_dropout=recurrent_dropout)(conv3)
+            lstm2 = rnn(lstm_units[1], return_sequences=False, dropout=dropout,
+                        recurrent_dropout=recurrent_dropout)(lstm1)
         
         # 注意力機制 (可選)
         attention = layers.Dense(64, activation='tanh')(lstm2)
@@ -82,10 +309,18 @@ class ParkinsonCNNLSTMModel:
         self.model = keras.Model(inputs=input_layer, outputs=output)
         
         # 編譯模型
+        if scale_learning_rate is None:
+            scale_learning_rate = self.profile['scale_learning_rate']
+        if learning_rate is None:
+            learning_rate = self.profile['base_learning_rate']
+            if scale_learning_rate:
+                learning_rate = scaled_learning_rate(batch_size or self.profile['batch_size'],
+                                                     learning_rate)
         self.model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=0.001),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
             loss='sparse_categorical_crossentropy',
-            metrics=['accuracy']
+            metrics=['accuracy'],
+            jit_compile=self.profile['jit_compile']
         )
         
         return self.model
@@ -94,33 +329,12 @@ class ParkinsonCNNLSTMModel:
         """
         準備時間序列數據
         
+        按 (患者, 會話) 單次分組構建滑動窗口，窗口不會跨越會話邊界
+        
         Args:
             df: 包含傳感器數據的DataFrame
         """
-        # 特徵列
-        feature_cols = ['finger_pinky', 'finger_ring', 'finger_middle', 
-                       'finger_index', 'finger_thumb', 'emg', 
-                       'imu_x', 'imu_y', 'imu_z']
-        
-        sequences = []
-        labels = []
-        
-        # 按患者分組處理
-        for patient_id in df['patient_id'].unique():
-            patient_data = df[df['patient_id'] == patient_id].sort_values('timestamp')
-            
-            if len(patient_data) < self.sequence_length:
-                continue
-            
-            features = patient_data[feature_cols].values
-            patient_label = patient_data['parkinson_level'].iloc[0] - 1  # 轉換為0-4
-            
-            # 創建滑動窗口序列
-            for i in range(len(features) - self.sequence_length + 1):
-                sequences.append(features[i:i + self.sequence_length])
-                labels.append(patient_label)
-        
-        return np.array(sequences), np.array(labels)
+        return build_windows_from_frame(df, self.sequence_length, FEATURE_COLUMNS)
     
     def load_and_preprocess_data(self, data_dir="data"):
         """
@@ -154,6 +368,7 @@ class ParkinsonCNNLSTMModel:
                             'imu_y': point['imu'][1],
                             'imu_z': point['imu'][2],
                             'patient_id': session_data.get('patient_id'),
+                            'session_id': os.path.splitext(filename)[0],
                             'parkinson_level': session_data.get('parkinson_level')
                         }
                         all_data.append(row)
@@ -169,7 +384,8 @@ class ParkinsonCNNLSTMModel:
         
         return df
     
-    def train_model(self, df, test_size=0.2, epochs=100, batch_size=32):
+    def train_model(self, df, test_size=0.2, epochs=100, batch_size=None, checkpoint_dir=None,
+                    resume=False, save_every_steps=None):
         """
         訓練模型
         
@@ -177,8 +393,13 @@ class ParkinsonCNNLSTMModel:
             df: 數據DataFrame
             test_size: 測試集比例
             epochs: 訓練輪數
-            batch_size: 批次大小
+            batch_size: 批次大小 (None使用配置的批次大小)
+            checkpoint_dir: 異步檢查點目錄，設定後可在中斷後續訓
+            resume: 是否從 checkpoint_dir 的最新檢查點續訓
+            save_every_steps: 輪內每隔多少步保存檢查點 (None表示只在輪末保存)
         """
+        batch_size = batch_size or self.profile['batch_size']
+        
         # 準備序列數據
         X, y = self.prepare_sequences(df)
         print(f"序列數據準備完成: {X.shape}, 標籤: {y.shape}")
@@ -196,33 +417,26 @@ class ParkinsonCNNLSTMModel:
         print(f"訓練集: {X_train.shape}, 測試集: {X_test.shape}")
         
         # 創建模型
-        self.create_model(num_classes=5)
+        self.create_model(num_classes=5, batch_size=batch_size)
         self.model.summary()
         
-        # 回調函數
-        callbacks = [
-            keras.callbacks.EarlyStopping(
-                monitor='val_loss', patience=15, restore_best_weights=True
-            ),
-            keras.callbacks.ReduceLROnPlateau(
-                monitor='val_loss', factor=0.5, patience=10, min_lr=0.00001
-            ),
-            keras.callbacks.ModelCheckpoint(
-                'models/best_parkinson_model.h5', 
-                monitor='val_accuracy', 
-                save_best_only=True
-            )
-        ]
-        
         # 訓練模型
-        self.history = self.model.fit(
-            X_train, y_train,
-            validation_data=(X_test, y_test),
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=callbacks,
-            verbose=1
-        )
+        callbacks = self._create_callbacks(batch_size, checkpoint_dir, save_every_steps)
+        if checkpoint_dir:
+            self.history = fit_resumable(
+                self.model, len(y_train), lambda index, epoch, step: (X_train[index], y_train[index]),
+                batch_size, epochs, callbacks, self.checkpoint,
+                validation_data=(X_test, y_test), resume=resume
+            )
+        else:
+            self.history = self.model.fit(
+                X_train, y_train,
+                validation_data=(X_test, y_test),
+                epochs=epochs,
+                batch_size=batch_size,
+                callbacks=callbacks,
+                verbose=1
+            )
         
         # 評估模型
         test_loss, test_accuracy = self.model.evaluate(X_test, y_test, verbose=0)
@@ -230,13 +444,559 @@ class ParkinsonCNNLSTMModel:
         
         # 詳細評估
         y_pred = np.argmax(self.model.predict(X_test), axis=1)
+        self._print_classification_report(y_test, y_pred)
         
-        print("\n分類報告:")
-        print(classification_report(y_test, y_pred, 
-                                  target_names=[f"等級{i+1}" for i in range(5)]))
+        return self.history
+    
+    def train_model_from_sessions(self, data_dir="data", test_size=0.2, epochs=100, batch_size=None,
+                                  shuffle_buffer=None, deterministic=False, seed=42, noise_std=0.0,
+                                  sampling=None, augmenter=None, checkpoint_dir=None, resume=False,
+                                  save_every_steps=None):
+        """
+        以tf.data管道訓練模型 (串流窗口，不預先物化序列數組)
+        
+        Args:
+            data_dir: 會話數據目錄
+            test_size: 測試患者比例 (按患者劃分)
+            epochs: 訓練輪數
+            batch_size: 批次大小 (None使用配置的批次大小)
+            shuffle_buffer: 打亂緩衝大小 (None表示全部窗口)
+            deterministic: 確定性模式，固定隨機種子和數據順序以便重現
+            seed: 隨機種子
+            noise_std: 訓練時高斯抖動強度 (標準化後單位)
+            sampling: 訓練窗口抽樣策略，sample_windows 的參數字典 (驗證集保留全部窗口)
+            augmenter: 可選的 TimeSeriesAugmenter，在tf.data的map中增強訓練批次
+            checkpoint_dir: 異步檢查點目錄，設定後以可續訓的批次序列訓練
+            resume: 是否從 checkpoint_dir 的最新檢查點續訓
+            save_every_steps: 輪內每隔多少步保存檢查點 (None表示只在輪末保存)
+        """
+        if deterministic:
+            keras.utils.set_random_seed(seed)
+            tf.config.experimental.enable_op_determinism()
+        
+        # 加載會話並建立窗口索引
+        sessions = load_sessions(data_dir)
+        windows = concatenate_sessions(sessions, self.sequence_length)
+        print(f"會話: {len(sessions)}，窗口: {len(windows['starts'])}，樣本: {len(windows['data'])}")
+        
+        # 在原始樣本上擬合標準化器，無需展開窗口副本
+        self.scaler.fit(windows['data'])
+        
+        return self._train_on_windows(
+            windows['data'], windows, test_size, epochs, batch_size,
+            shuffle_buffer, deterministic, seed, noise_std, sampling, augmenter,
+            checkpoint_dir, resume, save_every_steps
+        )
+    
+    def train_model_out_of_core(self, store_dir="data/store", data_dir="data", test_size=0.2,
+                                epochs=100, batch_size=None, shuffle_buffer=None,
+                                deterministic=False, seed=42, noise_std=0.0, rebuild=False,
+                                sampling=None, augmenter=None, quality_filter=None,
+                                checkpoint_dir=None, resume=False, save_every_steps=None):
+        """
+        超出內存訓練模式
+        
+        會話特徵保存在內存映射文件中，標準化器以單次串流 partial_fit 擬合，
+        窗口在每個批次按需讀取，訓練/驗證分割只使用索引。
+        
+        Args:
+            store_dir: 內存映射存儲目錄
+            data_dir: 建立存儲時使用的會話JSON目錄
+            rebuild: 是否強制從JSON重建存儲
+            quality_filter: 質量篩選條件，SessionStore.window_index 的參數字典
+                            (如 {'quality_ok_only': True, 'max_bad_fraction': 0.1})
+            其他參數同 train_model_from_sessions
+        """
+        if deterministic:
+            keras.utils.set_random_seed(seed)
+            tf.config.experimental.enable_op_determinism()
+        
+        store = SessionStore(store_dir, feature_dim=self.feature_dim)
+        if rebuild or not store.exists():
+            store.build_from_json(data_dir)
+        else:
+            store.open()
+        
+        quality_filter = quality_filter or {}
+        windows = store.window_index(self.sequence_length, **quality_filter)
+        print(f"存儲樣本: {len(store.features)}，窗口: {len(windows['starts'])}")
+        
+        # 單次串流擬合標準化器
+        self.scaler = StandardScaler()
+        store.fit_scaler(self.scaler, quality_ok_only=quality_filter.get('quality_ok_only', False))
+        
+        return self._train_on_windows(
+            store.features, windows, test_size, epochs, batch_size,
+            shuffle_buffer, deterministic, seed, noise_std, sampling, augmenter,
+            checkpoint_dir, resume, save_every_steps
+        )
+    
+    def _train_on_windows(self, data, windows, test_size, epochs, batch_size,
+                          shuffle_buffer, deterministic, seed, noise_std, sampling=None,
+                          augmenter=None, checkpoint_dir=None, resume=False, save_every_steps=None):
+        """
+        在窗口索引上分割數據並訓練 (標準化器需已擬合)
+        
+        訓練/測試按患者劃分 (同一會話的重疊窗口不會同時出現在兩側)，
+        默認以tf.data串流；設定 checkpoint_dir 時改用順序只由 (種子, 輪次) 決定的
+        批次序列，噪音和增強按 (種子, 輪次, 步) 播種，以便從檢查點準確續訓。
+        """
+        batch_size = batch_size or self.profile['batch_size']
+        
+        # 按患者在窗口索引上分割數據
+        is_test = group_kfold_indices(windows['patient_ids'], max(2, int(round(1 / test_size))), seed) == 0
+        train_windows = subset_windows(windows, ~is_test)
+        test_windows = subset_windows(windows, is_test)
+        
+        if sampling:
+            train_windows = sample_windows(train_windows, seed=seed, **sampling)
+        
+        print(f"訓練窗口: {len(train_windows['starts'])}, 測試窗口: {len(test_windows['starts'])} "
+              f"(測試患者 {len(np.unique(test_windows['patient_ids']))})")
+        
+        train_ds = create_window_dataset(
+            data, train_windows['starts'], train_windows['labels'], self.sequence_length,
+            self.scaler.mean_, self.scaler.scale_, batch_size=batch_size,
+            shuffle=True, shuffle_buffer=shuffle_buffer,
+            deterministic=deterministic, seed=seed, noise_std=noise_std,
+            augment_fn=augmenter.augment_tf if augmenter is not None else None
+        )
+        test_ds = create_window_dataset(
+            data, test_windows['starts'], test_windows['labels'], self.sequence_length,
+            self.scaler.mean_, self.scaler.scale_, batch_size=batch_size,
+            shuffle=False, deterministic=True
+        )
+        
+        # 創建模型
+        self.create_model(num_classes=5, batch_size=batch_size)
+        self.model.summary()
+        
+        callbacks = self._create_callbacks(batch_size, checkpoint_dir, save_every_steps, seed)
+        if checkpoint_dir:
+            offsets = np.arange(self.sequence_length)
+            train_starts, train_labels = train_windows['starts'], train_windows['labels']
+            
+            def fetch(index, epoch, step):
+                # 排序後讀取，內存映射時順序訪問磁盤
+                index = np.sort(index)
+                X = self._scale_windows(np.asarray(data[train_starts[index][:, None] + offsets]))
+                rng = np.random.default_rng([seed, epoch, step])
+                if noise_std > 0:
+                    X = X + rng.normal(0, noise_std, X.shape).astype(np.float32)
+                if augmenter is not None:
+                    augmenter.rng = rng
+                    X = augmenter.augment_numpy(X)
+                return X, train_labels[index]
+            
+            self.history = fit_resumable(
+                self.model, len(train_labels), fetch, batch_size, epochs, callbacks, self.checkpoint,
+                validation_data=test_ds, resume=resume, seed=seed
+            )
+        else:
+            self.history = self.model.fit(
+                train_ds,
+                validation_data=test_ds,
+                epochs=epochs,
+                callbacks=callbacks,
+                verbose=1
+            )
+        
+        # 評估模型
+        test_loss, test_accuracy = self.model.evaluate(test_ds, verbose=0)
+        print(f"\n測試準確率: {test_accuracy:.4f}")
+        
+        y_pred = np.argmax(self.model.predict(test_ds, verbose=0), axis=1)
+        self._print_classification_report(test_windows['labels'], y_pred)
         
         return self.history
     
+    def compare_window_sampling(self, data_dir="data", strategies=None, epochs=5, batch_size=32,
+                                test_size=0.2, seed=42):
+        """
+        比較不同窗口抽樣策略的訓練成本和驗證準確率
+        
+        所有策略使用同一個按患者劃分的驗證集 (驗證患者的全部步長1窗口)，只對訓練窗口抽樣；
+        驗證患者的窗口不會與訓練窗口重疊。
+        
+        Args:
+            data_dir: 會話數據目錄
+            strategies: {名稱: sample_windows 參數字典}，None使用默認策略
+            epochs: 每個策略的訓練輪數
+            batch_size: 批次大小
+            test_size: 驗證患者比例
+            seed: 隨機種子
+        
+        Returns:
+            每個策略的結果列表 (窗口數, 每輪時間, 最佳驗證準確率)
+        """
+        if strategies is None:
+            strategies = {
+                '步長1 (當前)': {},
+                '固定步長10': {'hop': 10},
+                '隨機偏移步長10': {'hop': 10, 'random_offset': True},
+                '步長10+患者上限+類別平衡': {'hop': 10, 'random_offset': True,
+                                       'max_per_patient': 200, 'class_balanced': True}
+            }
+        
+        windows = concatenate_sessions(load_sessions(data_dir), self.sequence_length)
+        self.scaler.fit(windows['data'])
+        
+        is_val = group_kfold_indices(windows['patient_ids'], max(2, int(round(1 / test_size))), seed) == 0
+        train_windows = subset_windows(windows, ~is_val)
+        test_windows = subset_windows(windows, is_val)
+        print(f"驗證患者: {len(np.unique(test_windows['patient_ids']))}，"
+              f"驗證窗口: {len(test_windows['starts'])}")
+        
+        test_ds = create_window_dataset(
+            windows['data'], test_windows['starts'], test_windows['labels'], self.sequence_length,
+            self.scaler.mean_, self.scaler.scale_, batch_size=batch_size,
+            shuffle=False, deterministic=True
+        )
+        
+        results = []
+        for name, params in strategies.items():
+            sampled = sample_windows(train_windows, seed=seed, **params)
+            train_ds = create_window_dataset(
+                windows['data'], sampled['starts'], sampled['labels'], self.sequence_length,
+                self.scaler.mean_, self.scaler.scale_, batch_size=batch_size, seed=seed
+            )
+            
+            keras.utils.set_random_seed(seed)
+            self.create_model(num_classes=5, batch_size=batch_size)
+            
+            start_time = time.perf_counter()
+            history = self.model.fit(train_ds, validation_data=test_ds, epochs=epochs, verbose=0)
+            epoch_time = (time.perf_counter() - start_time) / epochs
+            
+            results.append({
+                'strategy': name,
+                'train_windows': len(sampled['starts']),
+                'epoch_time': epoch_time,
+                'val_accuracy': max(history.history['val_accuracy'])
+            })
+        
+        print("\n窗口抽樣策略比較:")
+        print(f"{'策略':<28}{'訓練窗口':>10}{'每輪時間(s)':>14}{'驗證準確率':>12}")
+        for r in results:
+            print(f"{r['strategy']:<28}{r['train_windows']:>10}{r['epoch_time']:>14.2f}{r['val_accuracy']:>12.4f}")
+        
+        return results
+    
+    def compare_performance_profiles(self, data_dir="data", profiles=('default', 'cpu_performance'),
+                                     epochs=5, test_size=0.2, seed=42):
+        """
+        比較訓練配置的吞吐量和驗證準確率
+        
+        所有配置使用相同的數據劃分；每輪時間和步時不計第一輪 (圖編譯和預熱)。
+        TensorFlow的線程池在進程內只能在第一次運算前設定，因此每個配置在各自新啟動的
+        (spawn) 進程中訓練，報告中的線程數為該進程實際使用的設定 (0 表示由TensorFlow決定)。
+        
+        Args:
+            data_dir: 會話數據目錄
+            profiles: 要比較的配置名稱
+            epochs: 每個配置的訓練輪數
+            test_size: 驗證集比例
+            seed: 隨機種子
+        
+        Returns:
+            每個配置的結果列表
+        """
+        windows = concatenate_sessions(load_sessions(data_dir), self.sequence_length)
+        self.scaler.fit(windows['data'])
+        
+        labels = windows['labels']
+        train_idx, test_idx = train_test_split(
+            np.arange(len(labels)), test_size=test_size, random_state=seed, stratify=labels
+        )
+        train_windows = subset_windows(windows, train_idx)
+        test_windows = subset_windows(windows, test_idx)
+        
+        # 特徵數據只傳遞一次，窗口字典只保留索引
+        train_windows = {key: value for key, value in train_windows.items() if key != 'data'}
+        test_windows = {key: value for key, value in test_windows.items() if key != 'data'}
+        
+        results = []
+        context = multiprocessing.get_context('spawn')
+        for name in profiles:
+            task = (self.sequence_length, self.feature_dim, name, windows['data'], train_windows,
+                    test_windows, self.scaler.mean_, self.scaler.scale_, epochs, seed)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(_train_profile, task).result())
+        
+        print("\n訓練配置比較 (每個配置在獨立進程中運行):")
+        print(f"{'配置':<18}{'批次':>6}{'學習率':>10}{'線程(內/間)':>12}{'每輪時間(s)':>13}{'步時(ms)':>10}"
+              f"{'樣本/秒':>10}{'驗證準確率':>12}")
+        for r in results:
+            threads = f"{r['intra_op_threads']}/{r['inter_op_threads']}"
+            print(f"{r['profile']:<18}{r['batch_size']:>6}{r['learning_rate']:>10.5f}{threads:>12}"
+                  f"{r['epoch_time']:>13.2f}{r['step_ms']:>10.1f}{r['samples_per_second']:>10.0f}"
+                  f"{r['val_accuracy']:>12.4f}")
+        
+        return results
+    
+    def cross_validate(self, data_dir="data", n_splits=5, epochs=20, batch_size=None, hop=1,
+                       num_workers=None, threads_per_worker=None, seed=42):
+        """
+        按患者分組的k折交叉驗證 (避免同一患者的窗口同時出現在訓練和測試集)
+        
+        Args:
+            data_dir: 會話數據目錄
+            n_splits: 折數
+            epochs: 每折的最大訓練輪數
+            batch_size: 批次大小 (None使用配置的批次大小)
+            hop: 窗口步長
+            num_workers: 並行進程數
+            threads_per_worker: 每個進程的線程數
+            seed: 隨機種子
+        
+        Returns:
+            GroupKFoldRunner.run 的結果字典
+        """
+        X, y, patient_ids = self._load_windows(data_dir, hop)
+        
+        runner = GroupKFoldRunner('cnn_lstm', n_splits=n_splits, num_workers=num_workers,
+                                  threads_per_worker=threads_per_worker,
+                                  model_params={'epochs': epochs, 'batch_size': batch_size,
+                                                'profile': self.profile_name},
+                                  seed=seed)
+        return runner.run(X, y, patient_ids)
+    
+    def fine_tune(self, new_data_dir, holdout_dir, model_path="models/parkinson_cnn_lstm.h5",
+                  buffer_path="models/rehearsal_buffer.npz", replay_ratio=1.0, freeze_conv=False,
+                  epochs=10, batch_size=None, learning_rate=1e-4, max_regression=0.01, hop=1,
+                  seed=42, seed_buffer_dir=None):
+        """
+        增量微調: 從當前模型和標準化器熱啟動，只在新會話和重放的歷史窗口上訓練
+        
+        訓練成本與新數據量成正比 (重放窗口數為新窗口數的 replay_ratio 倍)。
+        標準化器保持不變，使新舊數據的輸入分佈一致。微調後在固定的保留集上
+        與原模型比較，準確率下降超過 max_regression 時不提升新模型。
+        
+        Args:
+            new_data_dir: 新會話JSON目錄
+            holdout_dir: 固定保留集的會話目錄 (不參與訓練)
+            model_path: 當前模型路徑，提升時覆蓋保存
+            buffer_path: 複習緩衝區文件
+            replay_ratio: 重放窗口數與新窗口數之比
+            freeze_conv: 是否凍結卷積主幹 (Conv1D和BatchNormalization)
+            epochs: 微調輪數
+            batch_size: 批次大小 (None使用配置的批次大小)
+            learning_rate: 微調學習率 (通常比從頭訓練小一個數量級)
+            max_regression: 允許的保留集準確率下降
+            hop: 窗口步長
+            seed: 隨機種子
+            seed_buffer_dir: 緩衝區不存在時用於初始化緩衝區的歷史會話目錄
+        
+        Returns:
+            dict: baseline/candidate 的保留集指標、promoted、新窗口和重放窗口數量、耗時
+        """
+        start_time = time.perf_counter()
+        batch_size = batch_size or self.profile['batch_size']
+        keras.utils.set_random_seed(seed)
+        
+        self.load_model(model_path)
+        
+        X_new, y_new, _ = self._load_windows(new_data_dir, hop)
+        X_holdout, y_holdout, _ = self._load_windows(holdout_dir, hop)
+        X_holdout = self._scale_windows(X_holdout)
+        
+        baseline_loss, baseline_accuracy = self.model.evaluate(X_holdout, y_holdout, verbose=0)
+        
+        # 複習緩衝區: 重放與新數據等比例的歷史窗口
+        if os.path.exists(buffer_path):
+            buffer = RehearsalBuffer.load(buffer_path, seed=seed)
+        else:
+            buffer = RehearsalBuffer(seed=seed)
+            if seed_buffer_dir:
+                X_seed, y_seed, _ = self._load_windows(seed_buffer_dir, hop)
+                buffer.add(X_seed, y_seed)
+        
+        X_replay, y_replay = buffer.sample(int(len(y_new) * replay_ratio))
+        if len(y_replay):
+            X_train = np.concatenate([X_new, X_replay])
+            y_train = np.concatenate([y_new, y_replay])
+        else:
+            print("複習緩衝區為空，只在新數據上微調")
+            X_train, y_train = X_new, y_new
+        print(f"微調窗口: 新數據 {len(y_new)}，重放 {len(y_replay)}，保留集 {len(y_holdout)}")
+        
+        # 凍結第一個LSTM之前的卷積主幹
+        if freeze_conv:
+            for layer in self.model.layers:
+                if isinstance(layer, layers.LSTM):
+                    break
+                if isinstance(layer, (layers.Conv1D, layers.BatchNormalization)):
+                    layer.trainable = False
+        
+        self.model.compile(
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+            loss='sparse_categorical_crossentropy',
+            metrics=['accuracy'],
+            jit_compile=self.profile['jit_compile']
+        )
+        self.step_timer = StepTimeCallback(batch_size)
+        self.history = self.model.fit(
+            self._scale_windows(X_train), y_train,
+            epochs=epochs,
+            batch_size=batch_size,
+            shuffle=True,
+            callbacks=[self.step_timer],
+            verbose=1
+        )
+        
+        candidate_loss, candidate_accuracy = self.model.evaluate(X_holdout, y_holdout, verbose=0)
+        promoted = candidate_accuracy >= baseline_accuracy - max_regression
+        
+        print(f"\n保留集準確率: 原模型 {baseline_accuracy:.4f}，微調後 {candidate_accuracy:.4f}")
+        if promoted:
+            for layer in self.model.layers:
+                layer.trainable = True
+            self.save_model(model_path)
+            # 新數據在模型提升後才進入緩衝區
+            buffer.add(X_new, y_new)
+            buffer.save(buffer_path)
+            print("微調模型已提升")
+        else:
+            print(f"準確率下降超過 {max_regression:.4f}，保留原模型")
+            self.load_model(model_path)
+        
+        elapsed = time.perf_counter() - start_time
+        print(f"增量微調耗時: {elapsed:.1f} 秒")
+        
+        return {
+            'baseline': {'loss': float(baseline_loss), 'accuracy': float(baseline_accuracy)},
+            'candidate': {'loss': float(candidate_loss), 'accuracy': float(candidate_accuracy)},
+            'promoted': bool(promoted),
+            'new_windows': int(len(y_new)),
+            'replay_windows': int(len(y_replay)),
+            'time': elapsed
+        }
+    
+    def prune(self, data_dir="data", model_path="models/parkinson_cnn_lstm.h5",
+              output_path="models/parkinson_cnn_lstm_pruned.h5", structured_fraction=0.5,
+              sparsity=0.5, structured_epochs=10, magnitude_epochs=10, batch_size=None,
+              learning_rate=5e-4, hop=1, val_fraction=0.2, seed=42):
+        """
+        剪枝並微調模型: 先結構化剪枝濾波器/單元並物理縮小各層，再在縮小的模型上漸進式幅度剪枝
+        
+        結構化剪枝直接減少參數數和激活大小，量化後的TFLite文件和張量區隨之變小；
+        幅度剪枝產生的零值在TFLite中仍以稠密張量存儲，只在壓縮存儲時節省空間。
+        每個階段前 70% 的訓練步逐步提高剪枝比例，其餘步數在固定掩碼下微調恢復精度。
+        
+        Args:
+            data_dir: 會話JSON目錄
+            model_path: 待剪枝的模型
+            output_path: 剪枝後模型的保存路徑 (之後交給 ModelQuantizer 轉換)
+            structured_fraction: 每層剪掉的濾波器/單元比例 (0 跳過結構化剪枝)
+            sparsity: 幅度剪枝的最終稀疏度 (0 跳過幅度剪枝)
+            structured_epochs: 結構化剪枝和微調的輪數
+            magnitude_epochs: 幅度剪枝和微調的輪數
+            batch_size: 批次大小 (None使用配置的批次大小)
+            learning_rate: 微調學習率
+            hop: 窗口步長
+            val_fraction: 按患者劃分的評估集比例
+            seed: 隨機種子
+        
+        Returns:
+            dict: 各階段的評估準確率、參數數和稀疏度
+        """
+        batch_size = batch_size or self.profile['batch_size']
+        keras.utils.set_random_seed(seed)
+        
+        self.load_model(model_path)
+        X, y, patient_ids = self._load_windows(data_dir, hop)
+        is_val = group_kfold_indices(patient_ids, max(2, int(round(1 / val_fraction))), seed) == 0
+        X = self._scale_windows(X)
+        X_train, y_train, X_val, y_val = X[~is_val], y[~is_val], X[is_val], y[is_val]
+        print(f"剪枝數據: 訓練 {len(y_train)} 個窗口，評估 {len(y_val)} 個窗口")
+        
+        def compile_model():
+            self.model.compile(
+                optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+                loss='sparse_categorical_crossentropy',
+                metrics=['accuracy'],
+                jit_compile=self.profile['jit_compile']
+            )
+        
+        def evaluate(stage):
+            _, accuracy = self.model.evaluate(X_val, y_val, verbose=0)
+            result = {'accuracy': float(accuracy), 'params': int(self.model.count_params()),
+                      'sparsity': sparsity_summary(self.model)['total']['sparsity']}
+            print(f"{stage}: 準確率 {accuracy:.4f}，參數 {result['params']}，稀疏度 {result['sparsity']:.2%}")
+            return result
+        
+        def fit(pruning_callback, epochs):
+            steps = epochs * int(np.ceil(len(y_train) / batch_size))
+            pruning_callback.end_step = max(1, int(steps * 0.7))
+            pruning_callback.frequency = max(1, pruning_callback.end_step // 10)
+            self.step_timer = StepTimeCallback(batch_size)
+            self.history = self.model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size,
+                                          shuffle=True, callbacks=[pruning_callback, self.step_timer],
+                                          verbose=1)
+        
+        results = {'baseline': evaluate("原模型")}
+        
+        if structured_fraction > 0 and structured_epochs > 0:
+            compile_model()
+            structured = StructuredPruningCallback(target_fraction=structured_fraction)
+            fit(structured, structured_epochs)
+            masked_output = self.model.predict(X_val[:256], verbose=0)
+            
+            self.model = strip_pruned(self.model, structured.keep)
+            compile_model()
+            max_diff = np.max(np.abs(self.model.predict(X_val[:256], verbose=0) - masked_output))
+            print(f"物理縮小後的輸出最大差異: {max_diff:.2e}")
+            for name, index in structured.keep.items():
+                print(f"  {name}: 保留 {len(index)}/{len(structured.alive[name])}")
+            results['structured'] = evaluate("結構化剪枝")
+        
+        if sparsity > 0 and magnitude_epochs > 0:
+            compile_model()
+            fit(MagnitudePruningCallback(target_sparsity=sparsity), magnitude_epochs)
+            results['magnitude'] = evaluate("幅度剪枝")
+        
+        self.save_model(output_path)
+        return results
+    
+    def _load_windows(self, data_dir, hop=1):
+        """讀取會話目錄並物化原始窗口 (X, y, patient_ids)"""
+        windows = concatenate_sessions(load_sessions(data_dir), self.sequence_length, hop)
+        X = windows['data'][windows['starts'][:, None] + np.arange(self.sequence_length)]
+        return X, windows['labels'], windows['patient_ids']
+    
+    def _scale_windows(self, X):
+        """以已擬合的標準化器標準化窗口"""
+        return self.scaler.transform(X.reshape(-1, self.feature_dim)).reshape(X.shape).astype(np.float32)
+    
+    def _create_callbacks(self, batch_size=None, checkpoint_dir=None, save_every_steps=None, seed=42):
+        """
+        創建訓練回調函數
+        
+        最佳權重和續訓檢查點由 AsyncCheckpointCallback 在後台線程寫入，不阻塞訓練循環；
+        訓練結束時最佳權重另存為可直接加載的 models/best_parkinson_model.h5
+        """
+        self.step_timer = StepTimeCallback(batch_size or self.profile['batch_size'])
+        early_stopping = keras.callbacks.EarlyStopping(
+            monitor='val_loss', patience=15, restore_best_weights=True
+        )
+        reduce_lr = keras.callbacks.ReduceLROnPlateau(
+            monitor='val_loss', factor=0.5, patience=10, min_lr=0.00001
+        )
+        self.checkpoint = AsyncCheckpointCallback(
+            checkpoint_dir, save_every_steps=save_every_steps,
+            best_path='models/best_parkinson_model.weights.npz', monitor='val_accuracy',
+            tracked_callbacks=[early_stopping, reduce_lr], seed=seed,
+            best_model_path='models/best_parkinson_model.h5'
+        )
+        return [self.checkpoint, self.step_timer, early_stopping, reduce_lr]
+    
+    def _print_classification_report(self, y_true, y_pred):
+        """打印分類報告"""
+        print("\n分類報告:")
+        print(classification_report(y_true, y_pred, labels=list(range(5)),
+                                  target_names=[f"等級{i+1}" for i in range(5)],
+                                  zero_division=0))
+    
     def plot_training_history(self):
         """繪製訓練歷史"""
         if self.history is None:
@@ -289,30 +1049,162 @@ class ParkinsonCNNLSTMModel:
         
         print(f"模型已加載: {model_path}")
     
-    def predict_parkinson_level(self, sensor_data):
+    def export_numpy(self, path="models/parkinson_cnn_lstm_numpy.npz"):
         """
-        預測帕金森等級
+        導出模型和標準化參數供純NumPy推理 (NumpyInferenceEngine，運行時不需要TensorFlow)
         
         Args:
-            sensor_data: 傳感器數據 (sequence_length, feature_dim)
+            path: 輸出 .npz 路徑
+        """
+        if self.model is None:
+            print("沒有模型可導出")
+            return
+        export_numpy_model(self.model, path, scaler=self.scaler)
+    
+    def create_streaming(self, hop=10, path="models/parkinson_cnn_lstm_numpy.npz"):
+        """
+        導出模型並創建逐樣本的流式推理 (StreamingInference)
+        
+        Args:
+            hop: 每隔多少個樣本輸出一次預測
+            path: 導出的 .npz 路徑
+        """
+        if self.model is None:
+            print("沒有模型可導出")
+            return None
+        export_numpy_model(self.model, path, scaler=self.scaler)
+        return StreamingInference(path, hop=hop)
+    
+    def _compiled_predict(self):
+        """
+        返回當前模型的已編譯推理函數
+        
+        輸入簽名固定為 (None, sequence_length, feature_dim) float32，只追蹤一次；
+        self.model 被替換 (創建、加載、剪枝) 後自動重新編譯
+        """
+        if self._predict_fn is None or self._predict_model is not self.model:
+            model = self.model
+            
+            @tf.function(input_signature=[tf.TensorSpec((None, self.sequence_length, self.feature_dim),
+                                                        tf.float32)])
+            def predict_fn(windows):
+                return model(windows, training=False)
+            
+            self._predict_fn = predict_fn
+            self._predict_model = model
+        return self._predict_fn
+    
+    def predict_batch(self, windows, chunk_size=1024, check_quality=True):
+        """
+        批次預測帕金森等級
+        
+        標準化按塊向量化完成，推理經固定簽名的 tf.function 執行，避免逐窗口調用
+        scaler.transform 和 model.predict 的開銷。windows 可以是滑動窗口視圖等
+        任意可切片的數組，每次只物化 chunk_size 個窗口。
+        
+        Args:
+            windows: 原始窗口 (N, sequence_length, feature_dim)
+            chunk_size: 每次推理的窗口數
+            check_quality: 是否進行輸入質量檢查
+        
+        Returns:
+            dict: predicted_level (N,) 1-5、confidence (N,)、probabilities (N, 類別數)、
+                  quality_flags (N,) 標記位、quality_ok (N,)
         """
         if self.model is None:
             print("模型未加載")
             return None
         
-        # 預處理
-        data_scaled = self.scaler.transform(sensor_data.reshape(-1, self.feature_dim))
-        data_scaled = data_scaled.reshape(1, self.sequence_length, self.feature_dim)
+        if windows.ndim == 2:
+            windows = windows[None]
+        predict_fn = self._compiled_predict()
+        mean = self.scaler.mean_.astype(np.float32)
+        scale = self.scaler.scale_.astype(np.float32)
+        
+        probabilities, flags, quality_ok = [], [], []
+        for start in range(0, len(windows), chunk_size):
+            chunk = np.asarray(windows[start:start + chunk_size], dtype=np.float32)
+            probabilities.append(predict_fn((chunk - mean) / scale).numpy())
+            
+            # 輸入質量檢查 (異常窗口的預測不可靠)
+            if check_quality:
+                bad_fraction, window_flags = self.quality_checker.check_windows(chunk)
+                flags.append(window_flags)
+                quality_ok.append((bad_fraction <= self.quality_checker.max_bad_fraction) & (window_flags == 0))
+        
+        num_classes = self.model.outputs[0].shape[-1]
+        probabilities = (np.concatenate(probabilities) if probabilities
+                         else np.zeros((0, num_classes), dtype=np.float32))
+        if check_quality and flags:
+            flags, quality_ok = np.concatenate(flags), np.concatenate(quality_ok)
+        else:
+            flags = np.zeros(len(probabilities), dtype=np.uint8)
+            quality_ok = np.ones(len(probabilities), dtype=bool)
+        
+        return {
+            'predicted_level': np.argmax(probabilities, axis=1) + 1,
+            'confidence': probabilities.max(axis=1) if len(probabilities) else np.zeros(0, dtype=np.float32),
+            'probabilities': probabilities,
+            'quality_flags': flags,
+            'quality_ok': quality_ok
+        }
+    
+    def score_session(self, sensor_data, hop=1, chunk_size=1024):
+        """
+        為整個會話評分: 以滑動窗口視圖批次預測，並平均質量合格窗口的概率
+        
+        Args:
+            sensor_data: 會話的原始傳感器數據 (樣本數, feature_dim)
+            hop: 窗口步長
+            chunk_size: 每次推理的窗口數
+        
+        Returns:
+            dict: predicted_level、confidence、probabilities (會話級)、
+                  num_windows、num_quality_ok 和 windows (predict_batch 的逐窗口結果)
+        """
+        sensor_data = np.asarray(sensor_data, dtype=np.float32)
+        if len(sensor_data) < self.sequence_length:
+            print(f"會話長度不足 {self.sequence_length} 個樣本")
+            return None
         
-        # 預測
-        prediction = self.model.predict(data_scaled, verbose=0)
-        predicted_level = np.argmax(prediction) + 1
-        confidence = np.max(prediction)
+        # (窗口數, feature_dim, sequence_length) 視圖 -> (窗口數, sequence_length, feature_dim)，不複製數據
+        windows = np.lib.stride_tricks.sliding_window_view(sensor_data, self.sequence_length, axis=0)
+        windows = windows.transpose(0, 2, 1)[::hop]
+        
+        results = self.predict_batch(windows, chunk_size=chunk_size)
+        if results is None:
+            return None
+        
+        # 沒有合格窗口時退回全部窗口的平均
+        usable = results['quality_ok'] if results['quality_ok'].any() else np.ones(len(windows), dtype=bool)
+        probabilities = results['probabilities'][usable].mean(axis=0)
+        
+        return {
+            'predicted_level': int(np.argmax(probabilities)) + 1,
+            'confidence': float(np.max(probabilities)),
+            'probabilities': probabilities.tolist(),
+            'num_windows': int(len(windows)),
+            'num_quality_ok': int(results['quality_ok'].sum()),
+            'windows': results
+        }
+    
+    def predict_parkinson_level(self, sensor_data):
+        """
+        預測帕金森等級
+        
+        Args:
+            sensor_data: 傳感器數據 (sequence_length, feature_dim)
+        """
+        results = self.predict_batch(np.asarray(sensor_data)[None])
+        if results is None:
+            return None
         
         return {
-            'predicted_level': predicted_level,
-            'confidence': confidence,
-            'all_probabilities': prediction[0].tolist()
+            'predicted_level': int(results['predicted_level'][0]),
+            'confidence': float(results['confidence'][0]),
+            'all_probabilities': results['probabilities'][0].tolist(),
+            'quality_flags': describe_flags(results['quality_flags'][0]),
+            'quality_ok': bool(results['quality_ok'][0])
         }
 
 def main():
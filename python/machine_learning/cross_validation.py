@@ -0,0 +1,358 @@
+"""
+按患者分組的交叉驗證
+同一患者的所有窗口只會出現在一個折中，各折在進程池中並行訓練，
+每個進程限制BLAS/TensorFlow線程數以避免超額訂閱，最後匯總指標和置信區間
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+MODEL_TYPES = ('cnn_lstm', 'simple', 'speech', 'optimized_speech')
+
+# 影響每個進程線程數的環境變量
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'NUMEXPR_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS')
+
+
+def group_kfold_indices(groups, n_splits=5, seed=42):
+    """
+    按組劃分折 (最大組優先分配到當前樣本最少的折，使各折大小接近)
+
+    Args:
+        groups: 每個樣本的組標識 (如 patient_id)
+        n_splits: 折數
+        seed: 同樣大小的組之間的隨機順序
+
+    Returns:
+        fold_ids: 每個樣本所屬的折 (0 到 n_splits-1)
+    """
+    unique_groups, group_index, group_sizes = np.unique(np.asarray(groups), return_inverse=True,
+                                                        return_counts=True)
+    if len(unique_groups) < n_splits:
+        raise ValueError(f"組數 ({len(unique_groups)}) 少於折數 ({n_splits})")
+
+    rng = np.random.default_rng(seed)
+    shuffled = rng.permutation(len(unique_groups))
+    order = shuffled[np.argsort(-group_sizes[shuffled], kind='stable')]
+
+    fold_sizes = np.zeros(n_splits, dtype=np.int64)
+    group_fold = np.empty(len(unique_groups), dtype=np.int64)
+    for g in order:
+        fold = int(np.argmin(fold_sizes))
+        group_fold[g] = fold
+        fold_sizes[fold] += group_sizes[g]
+
+    return group_fold[group_index]
+
+
+def classification_metrics(y_true, y_pred, num_classes):
+    """準確率、平衡準確率和宏平均F1"""
+    y_true = np.asarray(y_true, dtype=np.int64)
+    y_pred = np.asarray(y_pred, dtype=np.int64)
+    confusion = np.bincount(y_true * num_classes + y_pred,
+                            minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+    true_positive = np.diag(confusion).astype(np.float64)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    present = support > 0
+
+    recall = np.divide(true_positive, support, out=np.zeros(num_classes), where=support > 0)
+    precision = np.divide(true_positive, predicted, out=np.zeros(num_classes), where=predicted > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall,
+                   out=np.zeros(num_classes), where=(precision + recall) > 0)
+
+    return {
+        'accuracy': float(true_positive.sum() / max(len(y_true), 1)),
+        'balanced_accuracy': float(recall[present].mean()) if present.any() else 0.0,
+        'macro_f1': float(f1[present].mean()) if present.any() else 0.0
+    }
+
+
+def confidence_interval(values, confidence=0.95):
+    """基於t分佈的均值置信區間"""
+    from scipy import stats
+
+    values = np.asarray(values, dtype=np.float64)
+    mean = float(values.mean())
+    if len(values) < 2:
+        return mean, mean, mean
+
+    sem = values.std(ddof=1) / np.sqrt(len(values))
+    half_width = float(stats.t.ppf((1 + confidence) / 2, len(values) - 1) * sem)
+    return mean, mean - half_width, mean + half_width
+
+
+@contextmanager
+def _worker_thread_env(num_threads):
+    """
+    在父進程中臨時設定線程數環境變量 (在其中創建進程池)
+
+    spawn 子進程在執行初始化函數之前就會導入NumPy (反序列化任務和初始化參數時)，
+    BLAS 線程池此時已按環境變量創建，所以限制必須在子進程啟動前就存在於環境中。
+    """
+    values = {name: str(num_threads) for name in THREAD_ENV_VARS}
+    values['TF_NUM_INTEROP_THREADS'] = '1'
+    if 'TF_CPP_MIN_LOG_LEVEL' not in os.environ:
+        values['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+    saved = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _limit_threads(num_threads):
+    """工作進程初始化: 限制已加載的BLAS/OpenMP線程池 (需要 threadpoolctl，環境變量見 _worker_thread_env)"""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(limits=num_threads)
+
+
+def _import_model(name):
+    """按名稱導入模型類 (支援包內和腳本兩種方式)"""
+    if name == 'cnn_lstm':
+        try:
+            from .cnn_lstm_model import ParkinsonCNNLSTMModel
+        except ImportError:
+            from cnn_lstm_model import ParkinsonCNNLSTMModel
+        return ParkinsonCNNLSTMModel
+    if name == 'simple':
+        try:
+            from .simple_parkinson_model import SimpleParkinsonModel
+        except ImportError:
+            from simple_parkinson_model import SimpleParkinsonModel
+        return SimpleParkinsonModel
+    if name == 'speech':
+        from speech_parkinson_classifier import SpeechParkinsonClassifier
+        return SpeechParkinsonClassifier
+    from optimized_speech_classifier import OptimizedSpeechParkinsonClassifier
+    return OptimizedSpeechParkinsonClassifier
+
+
+def _fit_predict_cnn_lstm(X_train, y_train, X_test, params, num_threads):
+    """訓練CNN-LSTM並預測測試折"""
+    import tensorflow as tf
+    from tensorflow import keras
+    from sklearn.preprocessing import StandardScaler
+
+    model = _import_model('cnn_lstm')(X_train.shape[1], X_train.shape[2],
+                                      profile=params.get('profile', 'default'))
+    batch_size = params.get('batch_size') or model.profile['batch_size']
+
+    # 在模型配置之後設定，以進程池的線程上限為準
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass  # 運行時已初始化 (當前進程內執行)
+
+    seed = params.get('seed', 42)
+    keras.utils.set_random_seed(seed)
+
+    model.scaler = StandardScaler().fit(X_train.reshape(-1, X_train.shape[2]))
+
+    def scale(X):
+        return model.scaler.transform(X.reshape(-1, X.shape[2])).reshape(X.shape).astype(np.float32)
+
+    model.create_model(num_classes=params.get('num_classes', 5), batch_size=batch_size)
+    model.model.fit(
+        scale(X_train), y_train,
+        epochs=params.get('epochs', 20),
+        batch_size=batch_size,
+        validation_split=0.1,
+        callbacks=[keras.callbacks.EarlyStopping(monitor='val_loss', patience=5,
+                                                 restore_best_weights=True)],
+        verbose=0
+    )
+    return np.argmax(model.model.predict(scale(X_test), verbose=0), axis=1)
+
+
+def _fit_predict_linear(model_type, X_train, y_train, X_test, params):
+    """訓練線性模型 (SimpleParkinsonModel 或語音分類器) 並預測測試折"""
+    model = _import_model(model_type)()
+    train_params = {key: value for key, value in params.items() if key not in ('seed', 'num_classes')}
+    model.train(X_train, y_train, **train_params)
+
+    if model_type == 'simple':
+        features = model.extract_features(X_test)
+        logits = ((features - model.scaler_mean) / model.scaler_std) @ model.weights + model.bias
+        return np.argmax(logits, axis=1)
+
+    z = ((np.asarray(X_test, dtype=np.float32) - model.scaler_mean) / model.scaler_std) @ model.weights + model.bias
+    return (z > 0).astype(np.int64)
+
+
+def _run_fold(task):
+    """在工作進程中訓練並評估一個折"""
+    model_type, data_dir, fold, params, num_threads = task
+
+    X = np.load(os.path.join(data_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(data_dir, 'y.npy'))
+    fold_ids = np.load(os.path.join(data_dir, 'fold_ids.npy'))
+
+    train_idx = np.flatnonzero(fold_ids != fold)
+    test_idx = np.flatnonzero(fold_ids == fold)
+    X_train, X_test = np.asarray(X[train_idx]), np.asarray(X[test_idx])
+
+    start_time = time.perf_counter()
+    if model_type == 'cnn_lstm':
+        y_pred = _fit_predict_cnn_lstm(X_train, y[train_idx], X_test, params, num_threads)
+    else:
+        y_pred = _fit_predict_linear(model_type, X_train, y[train_idx], X_test, params)
+    elapsed = time.perf_counter() - start_time
+
+    metrics = classification_metrics(y[test_idx], y_pred, params.get('num_classes', 5))
+    metrics.update({'fold': fold, 'train_size': len(train_idx), 'test_size': len(test_idx),
+                    'train_time': elapsed})
+    return metrics, test_idx, y_pred
+
+
+class GroupKFoldRunner:
+    """
+    按患者分組的並行交叉驗證
+
+    支援的模型: 'cnn_lstm' 和 'simple' (輸入 (N, T, C) 窗口，標籤0-4)，
+    'speech' 和 'optimized_speech' (輸入 (N, 8) 語音特徵，標籤0/1)
+    """
+
+    def __init__(self, model_type, n_splits=5, num_workers=None, threads_per_worker=None,
+                 model_params=None, seed=42):
+        """
+        初始化交叉驗證
+
+        Args:
+            model_type: 模型類型 (見 MODEL_TYPES)
+            n_splits: 折數
+            num_workers: 並行進程數，None為 min(折數, CPU核心數)，1表示在當前進程中依次執行
+            threads_per_worker: 每個進程的線程數，None時平分CPU核心
+            model_params: 傳給訓練的參數 (cnn_lstm: epochs/batch_size/profile；線性模型: train 的關鍵字參數)
+            seed: 分折和訓練的隨機種子
+        """
+        if model_type not in MODEL_TYPES:
+            raise ValueError(f"未知的模型類型: {model_type}")
+
+        cpu_count = os.cpu_count() or 1
+        self.model_type = model_type
+        self.n_splits = n_splits
+        self.num_workers = num_workers or min(n_splits, cpu_count)
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // self.num_workers)
+        self.model_params = dict(model_params or {})
+        self.seed = seed
+
+    def run(self, X, y, groups):
+        """
+        執行交叉驗證
+
+        Args:
+            X: 輸入數據
+            y: 標籤
+            groups: 每個樣本的 patient_id
+
+        Returns:
+            dict: folds (每折指標)、summary (均值和置信區間)、pooled (合併所有折預測的指標)、
+            predictions (每個樣本的折外預測)
+        """
+        y = np.asarray(y, dtype=np.int64)
+        default_classes = 5 if self.model_type in ('cnn_lstm', 'simple') else 2
+        params = {'num_classes': default_classes, 'seed': self.seed}
+        params.update(self.model_params)
+
+        fold_ids = group_kfold_indices(groups, self.n_splits, self.seed)
+        print(f"分組交叉驗證: {self.model_type}，{len(np.unique(groups))} 位患者，{self.n_splits} 折，"
+              f"{self.num_workers} 個進程 × {self.threads_per_worker} 線程")
+
+        # 數據寫入臨時文件，工作進程以內存映射方式讀取，避免逐個任務序列化大數組
+        data_dir = tempfile.mkdtemp(prefix='parkinson_cv_')
+        try:
+            np.save(os.path.join(data_dir, 'X.npy'), np.asarray(X, dtype=np.float32))
+            np.save(os.path.join(data_dir, 'y.npy'), y)
+            np.save(os.path.join(data_dir, 'fold_ids.npy'), fold_ids)
+
+            tasks = [(self.model_type, data_dir, fold, params, self.threads_per_worker)
+                     for fold in range(self.n_splits)]
+
+            start_time = time.perf_counter()
+            if self.num_workers == 1:
+                results = [_run_fold(task) for task in tasks]
+            else:
+                # spawn: 子進程從父進程繼承線程限制的環境變量
+                context = multiprocessing.get_context('spawn')
+                with _worker_thread_env(self.threads_per_worker), \
+                        ProcessPoolExecutor(max_workers=self.num_workers, mp_context=context,
+                                            initializer=_limit_threads,
+                                            initargs=(self.threads_per_worker,)) as executor:
+                    results = list(executor.map(_run_fold, tasks))
+            elapsed = time.perf_counter() - start_time
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        folds = [r[0] for r in results]
+        predictions = np.full(len(y), -1, dtype=np.int64)
+        for _, test_idx, y_pred in results:
+            predictions[test_idx] = y_pred
+
+        summary = {}
+        for name in ('accuracy', 'balanced_accuracy', 'macro_f1'):
+            mean, low, high = confidence_interval([f[name] for f in folds])
+            # 指標取值在 [0, 1]，區間截斷到該範圍
+            summary[name] = {'mean': mean, 'ci_low': max(0.0, low), 'ci_high': min(1.0, high),
+                             'std': float(np.std([f[name] for f in folds]))}
+
+        pooled = classification_metrics(y, predictions, params['num_classes'])
+        self._print_report(folds, summary, pooled, elapsed)
+
+        return {
+            'folds': folds,
+            'summary': summary,
+            'pooled': pooled,
+            'predictions': predictions,
+            'fold_ids': fold_ids,
+            'time': elapsed
+        }
+
+    def _print_report(self, folds, summary, pooled, elapsed):
+        """打印每折指標和匯總"""
+        print(f"\n{'折':<4} {'訓練':>8} {'測試':>8} {'準確率':>8} {'平衡準確率':>10} {'宏F1':>8} {'耗時(s)':>8}")
+        for f in folds:
+            print(f"{f['fold']:<4} {f['train_size']:>8} {f['test_size']:>8} {f['accuracy']:>8.4f} "
+                  f"{f['balanced_accuracy']:>10.4f} {f['macro_f1']:>8.4f} {f['train_time']:>8.1f}")
+
+        print("\n匯總 (95% 置信區間):")
+        for name, s in summary.items():
+            print(f"  {name:18s}: {s['mean']:.4f} [{s['ci_low']:.4f}, {s['ci_high']:.4f}]")
+        print(f"  合併折外準確率    : {pooled['accuracy']:.4f}")
+        print(f"總耗時: {elapsed:.1f} 秒")
+
+
+def main():
+    """在合成數據上對 SimpleParkinsonModel 做分組交叉驗證"""
+    try:
+        from .synthetic_data import SyntheticSensorGenerator
+    except ImportError:
+        from synthetic_data import SyntheticSensorGenerator
+
+    X, y = SyntheticSensorGenerator(seed=42).generate(1000)
+    # 每個合成患者20個窗口
+    groups = np.repeat(np.arange(len(X) // 20), 20)
+
+    runner = GroupKFoldRunner('simple', n_splits=5)
+    runner.run(X, y, groups)
+
+
+if __name__ == "__main__":
+    main()
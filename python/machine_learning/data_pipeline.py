@@ -0,0 +1,372 @@
+"""
+CNN-LSTM訓練數據管道
+以tf.data從已存儲的會話中串流滑動窗口，提供打亂緩衝、並行預處理、批次和預取
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+# 特徵列順序與 ParkinsonCNNLSTMModel.prepare_sequences 一致
+FEATURE_COLUMNS = ['finger_pinky', 'finger_ring', 'finger_middle',
+                   'finger_index', 'finger_thumb', 'emg',
+                   'imu_x', 'imu_y', 'imu_z']
+
+
+def load_session_file(filepath):
+    """
+    讀取單個會話JSON文件
+
+    Args:
+        filepath: 會話文件路徑
+
+    Returns:
+        會話字典 (session_id, patient_id, parkinson_level, timestamps (T,),
+        features (T, 9) float32)，沒有數據點時返回None
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        session_data = json.load(f)
+
+    data_points = session_data.get('data')
+    if not data_points:
+        return None
+
+    timestamps = np.array([point['timestamp'] for point in data_points], dtype=np.float64)
+    features = np.array(
+        [point['fingers'] + [point['emg']] + point['imu'] for point in data_points],
+        dtype=np.float32
+    )
+
+    # 與 prepare_sequences 相同，按時間戳排序 (穩定排序)
+    order = np.argsort(timestamps, kind='stable')
+
+    return {
+        'session_id': os.path.splitext(os.path.basename(filepath))[0],
+        'patient_id': session_data.get('patient_id'),
+        'parkinson_level': session_data.get('parkinson_level'),
+        'timestamps': timestamps[order],
+        'features': features[order]
+    }
+
+
+def load_sessions(data_dir="data"):
+    """
+    讀取會話JSON文件，每個會話保留為獨立的特徵數組
+
+    Args:
+        data_dir: 數據目錄
+
+    Returns:
+        load_session_file 返回的會話列表
+    """
+    sessions = []
+
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json'):
+            continue
+
+        try:
+            session = load_session_file(os.path.join(data_dir, filename))
+            if session is not None:
+                sessions.append(session)
+        except Exception as e:
+            print(f"讀取文件 {filename} 失敗: {e}")
+
+    return sessions
+
+
+def build_window_index(session_lengths, sequence_length, hop=1):
+    """
+    計算所有會話中滑動窗口的起始位置 (不跨越會話邊界)
+
+    Args:
+        session_lengths: 每個會話的樣本數
+        sequence_length: 窗口長度
+        hop: 窗口步長
+
+    Returns:
+        (starts, window_session): 窗口在拼接數組中的起始行，以及所屬會話的索引
+    """
+    session_lengths = np.asarray(session_lengths, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(session_lengths)[:-1]]).astype(np.int64)
+
+    # 每個會話可產生的窗口數
+    counts = np.where(session_lengths >= sequence_length,
+                      (session_lengths - sequence_length) // hop + 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    window_session = np.repeat(np.arange(len(session_lengths)), counts)
+
+    # 會話內窗口序號: 全局序號減去該會話第一個窗口的全局序號
+    first_window = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    local_index = np.arange(total) - np.repeat(first_window, counts)
+
+    starts = offsets[window_session] + local_index * hop
+    return starts.astype(np.int64), window_session.astype(np.int64)
+
+
+def window_positions(window_session):
+    """
+    每個窗口在所屬會話中的序號和該會話的窗口總數
+
+    需要在完整的窗口索引上 (任何劃分或抽樣之前) 計算，結果作為逐窗口的欄位
+    隨子集保留，sample_windows 以此確定每個會話的步長相位。
+
+    Args:
+        window_session: build_window_index 返回的所屬會話索引 (非遞減)
+
+    Returns:
+        (local_index, session_windows)
+    """
+    window_session = np.asarray(window_session, dtype=np.int64)
+    if len(window_session) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    counts = np.bincount(window_session)
+    first_window = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    local_index = np.arange(len(window_session)) - first_window[window_session]
+    return local_index.astype(np.int64), counts[window_session].astype(np.int64)
+
+
+def concatenate_sessions(sessions, sequence_length, hop=1):
+    """
+    將會話拼接為單一特徵數組並建立窗口索引
+
+    Args:
+        sessions: load_sessions 返回的會話列表
+        sequence_length: 窗口長度
+        hop: 窗口步長
+
+    Returns:
+        dict: data (N, 9), starts, labels (0-4), window_session, patient_ids,
+              local_index, session_windows (見 window_positions)
+    """
+    # 沒有標籤的會話無法用於訓練
+    labeled = [s for s in sessions if s['parkinson_level'] is not None]
+
+    if not labeled:
+        raise ValueError("沒有找到帶標籤的會話數據")
+
+    data = np.concatenate([s['features'] for s in labeled], axis=0).astype(np.float32)
+    lengths = [len(s['features']) for s in labeled]
+
+    starts, window_session = build_window_index(lengths, sequence_length, hop)
+    session_labels = np.array([int(s['parkinson_level']) - 1 for s in labeled], dtype=np.int64)  # 轉換為0-4
+    patient_ids = np.array([str(s['patient_id']) for s in labeled])
+    local_index, session_windows = window_positions(window_session)
+
+    return {
+        'data': data,
+        'starts': starts,
+        'labels': session_labels[window_session],
+        'window_session': window_session,
+        'patient_ids': patient_ids[window_session],
+        'local_index': local_index,
+        'session_windows': session_windows
+    }
+
+
+def subset_windows(windows, index):
+    """按索引或布爾掩碼選取窗口索引字典的子集 (不涉及特徵數據)"""
+    return {key: (value[index] if key != 'data' else value) for key, value in windows.items()}
+
+
+def _rank_within_groups(groups, rng):
+    """在每個組內給窗口分配隨機名次 (0 開始)"""
+    keys = rng.random(len(groups))
+    order = np.lexsort((keys, groups))
+    sorted_groups = groups[order]
+
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = sorted_groups[1:] != sorted_groups[:-1]
+    first_pos = np.maximum.accumulate(np.where(is_first, np.arange(len(order)), 0))
+
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - first_pos
+    return ranks
+
+
+def sample_windows(windows, hop=1, random_offset=False, max_per_patient=None,
+                   class_balanced=False, max_per_class=None, seed=42):
+    """
+    在步長1的窗口索引上按策略抽樣 (只操作索引，不複製數據)
+
+    Args:
+        windows: 含 starts, labels, window_session, patient_ids 的窗口索引
+                 (可以是劃分後的子集；相位按 local_index/session_windows 在完整會話上確定)
+        hop: 固定步長，每個會話只保留會話內序號間隔hop的窗口
+        random_offset: 每個會話使用 [0, hop) 內的隨機起始偏移 (不超過該會話的完整窗口數)
+        max_per_patient: 每位患者最多保留的窗口數
+        class_balanced: 按 parkinson_level 下採樣到最少類別的窗口數
+        max_per_class: 每個類別最多保留的窗口數
+        seed: 隨機種子
+
+    Returns:
+        抽樣後的窗口索引字典
+    """
+    rng = np.random.default_rng(seed)
+    starts = windows['starts']
+    window_session = windows['window_session']
+    keep = np.ones(len(starts), dtype=bool)
+
+    if len(starts) == 0:
+        return subset_windows(windows, keep)
+
+    if hop > 1:
+        if 'local_index' in windows:
+            local = windows['local_index']
+            session_windows = windows['session_windows']
+        else:
+            # 沒有位置欄位時只能視當前索引為完整會話
+            local, session_windows = window_positions(window_session)
+        if random_offset:
+            # 為每個會話 (按完整索引中的編號) 抽取偏移，與子集中保留了哪些窗口無關；
+            # 偏移不超過會話自身的窗口數，避免短會話被整體丟棄
+            bounds = np.full(int(window_session.max()) + 1, hop, dtype=np.int64)
+            bounds[window_session] = np.minimum(hop, session_windows)
+            offsets = rng.integers(0, bounds)
+        else:
+            offsets = np.zeros(int(window_session.max()) + 1, dtype=np.int64)
+        keep &= (local % hop) == offsets[window_session]
+
+    if max_per_patient is not None:
+        patient_codes = np.unique(windows['patient_ids'], return_inverse=True)[1]
+        ranks = np.full(len(starts), np.iinfo(np.int64).max)
+        ranks[keep] = _rank_within_groups(patient_codes[keep], rng)
+        keep &= ranks < max_per_patient
+
+    if class_balanced or max_per_class is not None:
+        labels = windows['labels']
+        counts = np.bincount(labels[keep])
+        cap = counts[counts > 0].min() if class_balanced and keep.any() else np.iinfo(np.int64).max
+        if max_per_class is not None:
+            cap = min(cap, max_per_class)
+        ranks = np.full(len(starts), np.iinfo(np.int64).max)
+        ranks[keep] = _rank_within_groups(labels[keep], rng)
+        keep &= ranks < cap
+
+    return subset_windows(windows, keep)
+
+
+def build_windows_from_frame(df, sequence_length, feature_cols=FEATURE_COLUMNS, hop=1):
+    """
+    從DataFrame單次構建滑動窗口序列 (不跨越會話邊界)
+
+    以 (patient_id, session_id, timestamp) 做一次穩定排序並按 (患者, 會話) 分組，
+    窗口起始位置以向量化方式計算；沒有 session_id 列時每個患者視為一個會話。
+
+    Args:
+        df: 包含傳感器數據的DataFrame
+        sequence_length: 窗口長度
+        feature_cols: 特徵列
+        hop: 窗口步長
+
+    Returns:
+        (X, y): 序列 (N, sequence_length, C) 和標籤 (0-4)
+    """
+    # 按首次出現順序編碼患者和會話
+    patient_codes = pd.factorize(df['patient_id'])[0]
+    if 'session_id' in df.columns:
+        session_codes = pd.factorize(df['session_id'])[0]
+    else:
+        session_codes = np.zeros(len(df), dtype=np.int64)
+
+    # 一次穩定排序: 患者 -> 會話 -> 時間戳
+    order = np.lexsort((df['timestamp'].to_numpy(), session_codes, patient_codes))
+    patient_sorted = patient_codes[order]
+    session_sorted = session_codes[order]
+
+    # 分組邊界
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = (patient_sorted[1:] != patient_sorted[:-1]) | (session_sorted[1:] != session_sorted[:-1])
+    group_starts = np.flatnonzero(boundary)
+    group_lengths = np.diff(np.append(group_starts, len(order)))
+
+    starts, window_group = build_window_index(group_lengths, sequence_length, hop)
+
+    features = df[feature_cols].to_numpy()[order]
+    group_labels = df['parkinson_level'].to_numpy()[order][group_starts] - 1  # 轉換為0-4
+
+    X = features[starts[:, None] + np.arange(sequence_length)]
+    y = group_labels[window_group]
+
+    return X, y
+
+
+def create_window_dataset(data, starts, labels, sequence_length, scaler_mean, scaler_scale,
+                          batch_size=32, shuffle=True, shuffle_buffer=None,
+                          deterministic=False, seed=42, noise_std=0.0, augment_fn=None):
+    """
+    創建串流滑動窗口的tf.data數據集
+
+    只打亂和批次化窗口起始索引，窗口在並行map中按批次從拼接數組收集，
+    因此不需要預先物化 (N, T, C) 的窗口數組。data 為 np.memmap 時保持在磁盤上，
+    每個批次按需讀取。
+
+    Args:
+        data: 拼接後的特徵數組 (N, C)，可以是內存映射
+        starts: 窗口起始行
+        labels: 窗口標籤
+        sequence_length: 窗口長度
+        scaler_mean: 標準化均值 (C,)
+        scaler_scale: 標準化尺度 (C,)
+        batch_size: 批次大小
+        shuffle: 是否打亂
+        shuffle_buffer: 打亂緩衝大小 (None表示覆蓋全部窗口)
+        deterministic: 確定性模式 (固定順序和種子)
+        seed: 隨機種子
+        noise_std: 訓練時高斯抖動的標準差 (0表示關閉)
+        augment_fn: 可選的批次增強函數，輸入輸出均為 (B, T, C) 張量
+    """
+    out_of_core = isinstance(data, np.memmap)
+    if not out_of_core:
+        data_tensor = tf.constant(data, dtype=tf.float32)
+
+    feature_dim = data.shape[1]
+    mean = tf.constant(np.asarray(scaler_mean, dtype=np.float32))
+    scale = tf.constant(np.asarray(scaler_scale, dtype=np.float32))
+    offsets = tf.range(sequence_length, dtype=tf.int64)
+
+    dataset = tf.data.Dataset.from_tensor_slices((
+        np.asarray(starts, dtype=np.int64),
+        np.asarray(labels, dtype=np.int64)
+    ))
+
+    if shuffle:
+        buffer_size = shuffle_buffer or max(len(starts), 1)
+        dataset = dataset.shuffle(buffer_size, seed=seed, reshuffle_each_iteration=True)
+
+    dataset = dataset.batch(batch_size)
+
+    def gather_and_scale(batch_starts, batch_labels):
+        # (B, T) 行索引 -> (B, T, C) 窗口
+        rows = batch_starts[:, None] + offsets[None, :]
+        if out_of_core:
+            windows = tf.numpy_function(lambda r: np.asarray(data[r], dtype=np.float32),
+                                        [rows], tf.float32)
+            windows.set_shape([None, sequence_length, feature_dim])
+        else:
+            windows = tf.gather(data_tensor, rows)
+        windows = (windows - mean) / scale
+
+        if noise_std > 0:
+            windows = windows + tf.random.normal(tf.shape(windows), stddev=noise_std, seed=seed)
+
+        if augment_fn is not None:
+            windows = augment_fn(windows)
+
+        return windows, batch_labels
+
+    dataset = dataset.map(gather_and_scale,
+                          num_parallel_calls=tf.data.AUTOTUNE,
+                          deterministic=deterministic)
+
+    options = tf.data.Options()
+    options.deterministic = deterministic
+    dataset = dataset.with_options(options)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
@@ -0,0 +1,284 @@
+"""
+傳感器數據質量檢查
+在數據入庫時對會話和窗口做向量化質量評分，檢測平線、削波、尖峰、NaN、
+採樣率不規則和單位漂移
+"""
+
+import numpy as np
+
+# 每個樣本的質量標記 (位掩碼)
+FLAG_NAN = 1         # NaN或無窮值
+FLAG_CLIPPED = 2     # 傳感器飽和 (停留在量程端點)
+FLAG_SPIKE = 4       # 相鄰樣本跳變異常
+FLAG_FLATLINE = 8    # 長時間數值完全不變 (如EMG脫落)
+FLAG_GAP = 16        # 時間戳間隔異常 (丟包、重複或亂序)
+
+FLAG_NAMES = {
+    FLAG_NAN: 'nan',
+    FLAG_CLIPPED: 'clipped',
+    FLAG_SPIKE: 'spike',
+    FLAG_FLATLINE: 'flatline',
+    FLAG_GAP: 'gap'
+}
+
+ALL_FLAGS = FLAG_NAN | FLAG_CLIPPED | FLAG_SPIKE | FLAG_FLATLINE | FLAG_GAP
+
+# EMG 在 FEATURE_COLUMNS 中的位置: 電極脫落時輸出長時間不變，手指和IMU在靜止時本就可能不變
+EMG_CHANNEL = 5
+
+
+class DataQualityChecker:
+    """向量化數據質量檢查器"""
+
+    def __init__(self, flat_seconds=2.0, sample_rate=100.0, flat_channels=(EMG_CHANNEL,),
+                 clip_fraction=0.05, spike_threshold=8.0,
+                 gap_factor=3.0, max_rate_cv=0.5, drift_threshold=3.0,
+                 unit_ratio=10.0, max_bad_fraction=0.1, clip_limits=None):
+        """
+        初始化檢查器
+
+        Args:
+            flat_seconds: 同一數值連續出現多少秒視為平線
+            sample_rate: 採樣率 (Hz)，用於把 flat_seconds 換算為樣本數
+            flat_channels: 做平線檢測的通道 (None表示全部通道)
+            clip_fraction: 通道停留在已知量程端點的樣本比例超過此值視為削波
+            spike_threshold: 一階差分的穩健z分數閾值
+            gap_factor: 時間間隔超過中位數的倍數視為缺口
+            max_rate_cv: 採樣間隔變異係數上限
+            drift_threshold: 會話前後四分之一均值差 (以標準差計) 的漂移閾值
+            unit_ratio: 會話通道尺度與語料中位尺度的比值超過此倍數視為單位錯誤
+            max_bad_fraction: 會話/窗口可接受的異常樣本比例
+            clip_limits: 可選的 (low, high) 數組，每通道的已知量程端點 (None時不檢查削波；
+                         觀測極值不能代表量程，有界或量化的信號會經常取到它)
+        """
+        self.flat_run = max(2, int(round(flat_seconds * sample_rate)))
+        self.flat_channels = None if flat_channels is None else list(flat_channels)
+        self.clip_fraction = clip_fraction
+        self.spike_threshold = spike_threshold
+        self.gap_factor = gap_factor
+        self.max_rate_cv = max_rate_cv
+        self.drift_threshold = drift_threshold
+        self.unit_ratio = unit_ratio
+        self.max_bad_fraction = max_bad_fraction
+        self.clip_limits = clip_limits
+
+    def _flat_channels(self, num_channels):
+        """做平線檢測的通道索引 (超出通道數的忽略)"""
+        if self.flat_channels is None:
+            return list(range(num_channels))
+        return [c for c in self.flat_channels if c < num_channels]
+
+    def sample_flags(self, features, timestamps=None):
+        """
+        計算每個樣本的質量標記
+
+        Args:
+            features: 會話特徵 (T, C)
+            timestamps: 時間戳 (T,)，可選
+
+        Returns:
+            uint8 位掩碼數組 (T,)
+        """
+        x = np.asarray(features, dtype=np.float64)
+        T, C = x.shape
+        flags = np.zeros(T, dtype=np.uint8)
+        if T == 0:
+            return flags
+
+        finite = np.isfinite(x)
+        flags |= np.where(~finite.all(axis=1), FLAG_NAN, 0).astype(np.uint8)
+        x = np.where(finite, x, np.nan)
+
+        # 削波: 停留在已知量程端點的比例過高
+        if self.clip_limits is not None:
+            low, high = (np.asarray(v, dtype=np.float64) for v in self.clip_limits)
+            at_extreme = (x <= low) | (x >= high)
+            channel_clipped = at_extreme.mean(axis=0) > self.clip_fraction
+            flags |= np.where((at_extreme & channel_clipped).any(axis=1), FLAG_CLIPPED, 0).astype(np.uint8)
+
+        if T > 1:
+            # 尖峰: 一階差分的穩健z分數 (中位數/MAD)
+            diff = np.diff(x, axis=0)
+            median = np.nanmedian(diff, axis=0)
+            mad = np.nanmedian(np.abs(diff - median), axis=0) * 1.4826
+            # 量化信號的MAD可能為0，此時以差分標準差代替
+            scale = np.where(mad > 0, mad, np.nan_to_num(np.nanstd(diff, axis=0)))
+            robust_z = np.abs(diff - median) / np.maximum(scale, 1e-6)
+            spikes = np.zeros(T, dtype=bool)
+            spikes[1:] = np.nan_to_num(robust_z, nan=0.0).max(axis=1) > self.spike_threshold
+            flags |= np.where(spikes, FLAG_SPIKE, 0).astype(np.uint8)
+
+            # 平線: 按通道計算相同數值的連續長度
+            flat_diff = diff[:, self._flat_channels(C)]
+            num_flat = flat_diff.shape[1]
+            changed = np.ones((T, num_flat), dtype=bool)
+            changed[1:] = flat_diff != 0
+            run_ids = np.cumsum(changed.T.ravel()) - 1
+            run_lengths = np.bincount(run_ids)[run_ids].reshape(num_flat, T).T
+            flags |= np.where((run_lengths >= self.flat_run).any(axis=1), FLAG_FLATLINE, 0).astype(np.uint8)
+
+        if timestamps is not None and T > 1:
+            dt = np.diff(np.asarray(timestamps, dtype=np.float64))
+            median_dt = np.median(dt)
+            gaps = np.zeros(T, dtype=bool)
+            gaps[1:] = (dt <= 0) | (dt > self.gap_factor * max(median_dt, 1e-9))
+            flags |= np.where(gaps, FLAG_GAP, 0).astype(np.uint8)
+
+        return flags
+
+    def check_session(self, features, timestamps=None):
+        """
+        評估單個會話的質量
+
+        Args:
+            features: 會話特徵 (T, C)
+            timestamps: 時間戳 (T,)，可選
+
+        Returns:
+            (sample_flags, summary): 每個樣本的位掩碼和會話摘要字典
+        """
+        x = np.asarray(features, dtype=np.float64)
+        flags = self.sample_flags(x, timestamps)
+        T = len(flags)
+
+        summary = {'num_samples': int(T)}
+        for flag, name in FLAG_NAMES.items():
+            summary[f'{name}_fraction'] = float(np.mean((flags & flag) != 0)) if T else 0.0
+        summary['bad_fraction'] = float(np.mean(flags != 0)) if T else 0.0
+
+        # 採樣率
+        rate_irregular = False
+        if timestamps is not None and T > 2:
+            dt = np.diff(np.asarray(timestamps, dtype=np.float64))
+            median_dt = float(np.median(dt))
+            rate_cv = float(np.std(dt) / max(abs(np.mean(dt)), 1e-9))
+            summary['sample_rate_hz'] = 1.0 / median_dt if median_dt > 0 else 0.0
+            summary['rate_cv'] = rate_cv
+            rate_irregular = rate_cv > self.max_rate_cv
+        summary['rate_irregular'] = rate_irregular
+
+        # 會話內漂移: 前後四分之一的均值差
+        clean = np.where(np.isfinite(x), x, np.nan)
+        channel_mean = np.nanmean(clean, axis=0) if T else np.zeros(x.shape[1])
+        channel_std = np.nanstd(clean, axis=0) if T else np.zeros(x.shape[1])
+        drift = np.zeros(x.shape[1])
+        if T >= 8:
+            quarter = T // 4
+            drift = np.abs(np.nanmean(clean[-quarter:], axis=0) - np.nanmean(clean[:quarter], axis=0))
+            drift = drift / np.maximum(channel_std, 1e-6)
+        summary['channel_mean'] = np.nan_to_num(channel_mean).tolist()
+        summary['channel_std'] = np.nan_to_num(channel_std).tolist()
+        summary['max_drift'] = float(np.nan_to_num(drift).max()) if drift.size else 0.0
+        summary['drifting'] = summary['max_drift'] > self.drift_threshold
+
+        summary['unit_drift'] = False
+        summary['quality_ok'] = self._session_ok(summary)
+        return flags, summary
+
+    def check_unit_drift(self, summaries):
+        """
+        跨會話檢查單位漂移: 通道尺度與語料中位尺度相差超過 unit_ratio 倍
+
+        Args:
+            summaries: check_session 返回的摘要列表 (原地更新)
+        """
+        if not summaries:
+            return summaries
+
+        stds = np.array([s['channel_std'] for s in summaries], dtype=np.float64)
+        means = np.array([s['channel_mean'] for s in summaries], dtype=np.float64)
+        magnitude = np.maximum(stds, np.abs(means))
+
+        reference = np.median(magnitude, axis=0)
+        ratio = magnitude / np.maximum(reference, 1e-9)
+        drifted = ((ratio > self.unit_ratio) | (ratio < 1.0 / self.unit_ratio)) & (reference > 1e-9)
+
+        for summary, row in zip(summaries, drifted):
+            summary['unit_drift'] = bool(row.any())
+            summary['unit_drift_channels'] = np.flatnonzero(row).tolist()
+            summary['quality_ok'] = self._session_ok(summary)
+
+        return summaries
+
+    def _session_ok(self, summary):
+        """會話是否通過質量門檻"""
+        return (summary['bad_fraction'] <= self.max_bad_fraction
+                and not summary['rate_irregular']
+                and not summary['unit_drift'])
+
+    @staticmethod
+    def window_scores(sample_flags, starts, sequence_length):
+        """
+        由樣本標記計算窗口質量 (前綴和，O(1) 每窗口)
+
+        Args:
+            sample_flags: 拼接後的樣本位掩碼 (N,)
+            starts: 窗口起始行
+            sequence_length: 窗口長度
+
+        Returns:
+            (bad_fraction, window_flags): 每個窗口的異常樣本比例和標記並集
+        """
+        flags = np.asarray(sample_flags)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = starts + sequence_length
+
+        bad_prefix = np.concatenate([[0], np.cumsum(flags != 0, dtype=np.int64)])
+        bad_fraction = (bad_prefix[ends] - bad_prefix[starts]) / sequence_length
+
+        window_flags = np.zeros(len(starts), dtype=np.uint8)
+        for flag in FLAG_NAMES:
+            prefix = np.concatenate([[0], np.cumsum((flags & flag) != 0, dtype=np.int64)])
+            window_flags |= np.where(prefix[ends] > prefix[starts], flag, 0).astype(np.uint8)
+
+        return bad_fraction, window_flags
+
+    def check_windows(self, windows):
+        """
+        直接評估窗口批次 (用於推理前檢查)
+
+        Args:
+            windows: (B, T, C) 窗口
+
+        Returns:
+            (bad_fraction, window_flags)
+        """
+        X = np.asarray(windows, dtype=np.float64)
+        if X.ndim == 2:
+            X = X[None]
+        B, T, C = X.shape
+
+        flags = np.zeros(B, dtype=np.uint8)
+        finite = np.isfinite(X)
+        nan_rows = ~finite.all(axis=2)
+        flags |= np.where(nan_rows.any(axis=1), FLAG_NAN, 0).astype(np.uint8)
+        X = np.where(finite, X, 0.0)
+
+        # 整個窗口某個平線檢測通道完全不變
+        flat_X = X[:, :, self._flat_channels(C)]
+        flat = (flat_X.max(axis=1) - flat_X.min(axis=1) == 0).any(axis=1)
+        flags |= np.where(flat & (T >= self.flat_run), FLAG_FLATLINE, 0).astype(np.uint8)
+
+        bad_rows = nan_rows.copy()
+        if self.clip_limits is not None:
+            low, high = (np.asarray(v, dtype=np.float64) for v in self.clip_limits)
+            clipped = ((X <= low) | (X >= high)) & finite
+            clip_channel = clipped.mean(axis=1) > self.clip_fraction
+            flags |= np.where(clip_channel.any(axis=1), FLAG_CLIPPED, 0).astype(np.uint8)
+            bad_rows |= (clipped & clip_channel[:, None, :]).any(axis=2)
+
+        if T > 2:
+            diff = np.diff(X, axis=1)
+            median = np.median(diff, axis=1, keepdims=True)
+            mad = np.median(np.abs(diff - median), axis=1, keepdims=True) * 1.4826
+            scale = np.where(mad > 0, mad, diff.std(axis=1, keepdims=True))
+            spikes = (np.abs(diff - median) / np.maximum(scale, 1e-6) > self.spike_threshold).any(axis=2)
+            flags |= np.where(spikes.any(axis=1), FLAG_SPIKE, 0).astype(np.uint8)
+            bad_rows[:, 1:] |= spikes
+
+        return bad_rows.mean(axis=1), flags
+
+
+def describe_flags(flags):
+    """將位掩碼轉換為標記名稱列表"""
+    return [name for flag, name in FLAG_NAMES.items() if int(flags) & flag]
@@ -0,0 +1,294 @@
+"""
+知識蒸餾
+以訓練好的 CNN-LSTM 為教師，在會話存儲的全部窗口上批次推理得到軟標籤，
+訓練可部署到微控制器的小型學生模型 (線性特徵模型或微型1D-CNN)，
+並比較各模型的準確率與Flash/RAM佔用
+"""
+
+import time
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras import layers
+
+try:
+    from .session_store import SessionStore
+    from .cross_validation import group_kfold_indices
+    from .simple_parkinson_model import SimpleParkinsonModel
+    from .linear_engine import LinearModelEngine
+    from .checkpointing import ResumableBatchSequence, EpochSyncCallback
+except ImportError:
+    from session_store import SessionStore
+    from cross_validation import group_kfold_indices
+    from simple_parkinson_model import SimpleParkinsonModel
+    from linear_engine import LinearModelEngine
+    from checkpointing import ResumableBatchSequence, EpochSyncCallback
+
+def soften(probabilities, temperature):
+    """以溫度軟化概率分佈 (等價於 softmax(logits / T))"""
+    if temperature == 1:
+        return probabilities
+    logp = np.log(np.clip(probabilities, 1e-12, 1.0)) / temperature
+    logp -= logp.max(axis=1, keepdims=True)
+    p = np.exp(logp)
+    return p / p.sum(axis=1, keepdims=True)
+
+
+def keras_footprint(model):
+    """
+    估計Keras模型在微控制器上的佔用 (近似)
+
+    Flash 按參數數計算 (float32 每個4字節，int8 每個1字節)；
+    RAM 按相鄰兩層激活張量之和的峰值計算 (TFLM 的張量區按此量級分配)
+
+    Returns:
+        dict: params, flash_float32_kb, flash_int8_kb, ram_float32_kb, ram_int8_kb
+    """
+    params = model.count_params()
+    sizes = [int(np.prod(model.inputs[0].shape[1:]))]
+    for layer in model.layers:
+        if isinstance(layer, layers.InputLayer):
+            continue
+        outputs = layer.output if not isinstance(layer.output, (list, tuple)) else layer.output[0]
+        sizes.append(int(np.prod(outputs.shape[1:])))
+    peak = max(a + b for a, b in zip(sizes[:-1], sizes[1:])) if len(sizes) > 1 else sizes[0]
+
+    return {
+        'params': int(params),
+        'flash_float32_kb': params * 4 / 1024,
+        'flash_int8_kb': params / 1024,
+        'ram_float32_kb': peak * 4 / 1024,
+        'ram_int8_kb': peak / 1024
+    }
+
+
+def linear_footprint(num_features, num_classes, sequence_length, feature_dim):
+    """
+    線性特徵模型的佔用: 權重、偏置和標準化參數；RAM 為輸入窗口、特徵和輸出
+
+    Returns:
+        與 keras_footprint 相同的字典
+    """
+    params = num_features * num_classes + num_classes + 2 * num_features
+    peak = sequence_length * feature_dim + num_features + num_classes
+    return {
+        'params': int(params),
+        'flash_float32_kb': params * 4 / 1024,
+        'flash_int8_kb': params / 1024,
+        'ram_float32_kb': peak * 4 / 1024,
+        'ram_int8_kb': peak / 1024
+    }
+
+
+class Distiller:
+    """
+    CNN-LSTM 到小型學生模型的蒸餾
+
+    學生的訓練目標為 alpha * 教師溫度軟化後的分佈 + (1 - alpha) * 真實標籤的one-hot。
+    訓練/評估按患者劃分，評估集上同時報告對真實標籤的準確率和與教師預測的一致率。
+    """
+
+    def __init__(self, teacher, temperature=2.0, alpha=0.7, batch_size=1024, seed=42):
+        """
+        初始化蒸餾器
+
+        Args:
+            teacher: 已加載模型和標準化器的 ParkinsonCNNLSTMModel
+            temperature: 軟標籤溫度
+            alpha: 軟標籤的權重 (0 表示只用真實標籤，作為對照)
+            batch_size: 教師批次推理的窗口數
+            seed: 劃分和訓練的隨機種子
+        """
+        if teacher.model is None:
+            raise ValueError("教師模型未加載")
+
+        self.teacher = teacher
+        self.temperature = temperature
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.seed = seed
+        self.sequence_length = teacher.sequence_length
+        self.feature_dim = teacher.feature_dim
+
+        self.data = None
+        self.starts = None
+        self.labels = None
+        self.is_train = None
+        self.teacher_probs = None
+        self.results = []
+
+    def _gather(self, starts):
+        """從特徵數組收集原始窗口 (starts 應已排序以順序讀取)"""
+        return np.asarray(self.data[starts[:, None] + np.arange(self.sequence_length)],
+                          dtype=np.float32)
+
+    def prepare(self, store_dir="data/store", data_dir="data", hop=1, val_fraction=0.2):
+        """
+        讀取會話存儲並以教師批次推理全部窗口
+
+        Args:
+            store_dir: 會話存儲目錄 (不存在時從 data_dir 建立)
+            data_dir: 會話JSON目錄
+            hop: 窗口步長
+            val_fraction: 評估患者比例
+        """
+        store = SessionStore(store_dir, feature_dim=self.feature_dim)
+        if store.exists():
+            store.open()
+        else:
+            store.build_from_json(data_dir)
+
+        windows = store.window_index(self.sequence_length, hop)
+        # 排序起始行使每個批次順序讀取內存映射
+        order = np.argsort(windows['starts'], kind='stable')
+        self.data = store.features
+        self.starts = windows['starts'][order]
+        self.labels = windows['labels'][order]
+        patient_ids = windows['patient_ids'][order]
+
+        n_splits = max(2, int(round(1 / val_fraction)))
+        self.is_train = group_kfold_indices(patient_ids, n_splits, self.seed) != 0
+
+        # 教師批次推理
+        start_time = time.perf_counter()
+        probs = []
+        for start in range(0, len(self.starts), self.batch_size):
+            X = self.teacher._scale_windows(self._gather(self.starts[start:start + self.batch_size]))
+            probs.append(self.teacher.model.predict(X, batch_size=min(256, len(X)), verbose=0))
+        self.teacher_probs = np.concatenate(probs).astype(np.float32)
+        elapsed = time.perf_counter() - start_time
+
+        print(f"教師推理: {len(self.starts)} 個窗口，耗時 {elapsed:.1f} 秒 "
+              f"({len(self.starts) / max(elapsed, 1e-9):.0f} 窗口/秒)")
+        print(f"訓練窗口: {int(self.is_train.sum())}，評估窗口: {int((~self.is_train).sum())}")
+
+        footprint = keras_footprint(self.teacher.model)
+        self._record('teacher (CNN-LSTM)', np.argmax(self.teacher_probs[~self.is_train], axis=1), footprint)
+        return self
+
+    def _targets(self):
+        """訓練窗口的蒸餾目標"""
+        soft = soften(self.teacher_probs[self.is_train], self.temperature)
+        hard = np.eye(soft.shape[1], dtype=np.float32)[self.labels[self.is_train]]
+        return (self.alpha * soft + (1 - self.alpha) * hard).astype(np.float32)
+
+    def _record(self, name, y_pred, footprint):
+        """記錄評估集上的準確率、與教師的一致率和佔用"""
+        y_true = self.labels[~self.is_train]
+        teacher_pred = np.argmax(self.teacher_probs[~self.is_train], axis=1)
+        result = {
+            'model': name,
+            'accuracy': float(np.mean(y_pred == y_true)),
+            'agreement': float(np.mean(y_pred == teacher_pred)),
+            **footprint
+        }
+        self.results.append(result)
+        return result
+
+    def _features(self, starts, chunk_size=8192):
+        """分塊提取 SimpleParkinsonModel 的統計特徵"""
+        extractor = SimpleParkinsonModel()
+        return np.concatenate([extractor.extract_features(self._gather(starts[i:i + chunk_size]))
+                               for i in range(0, len(starts), chunk_size)])
+
+    def train_linear(self, l2=1e-4, optimizer='lbfgs', max_epochs=200):
+        """
+        蒸餾到線性特徵模型 (與 SimpleParkinsonModel 格式相同，可直接由 convert_to_arduino 轉換)
+
+        Returns:
+            SimpleParkinsonModel 學生
+        """
+        features = self._features(self.starts[self.is_train])
+        mean = features.mean(axis=0)
+        std = features.std(axis=0) + 1e-8
+
+        engine = LinearModelEngine(loss='softmax', optimizer=optimizer, l2=l2, max_epochs=max_epochs,
+                                   patience=0, seed=self.seed)
+        engine.fit((features - mean) / std, self._targets())
+
+        student = SimpleParkinsonModel()
+        student.weights, student.bias = engine.weights, engine.bias
+        student.scaler_mean, student.scaler_std = mean, std
+        student.is_trained = True
+
+        val_features = (self._features(self.starts[~self.is_train]) - mean) / std
+        y_pred = np.argmax(val_features @ student.weights + student.bias, axis=1)
+        footprint = linear_footprint(features.shape[1], student.weights.shape[1],
+                                     self.sequence_length, self.feature_dim)
+        self._record(f"linear (alpha={self.alpha})", y_pred, footprint)
+        return student
+
+    def build_tiny_cnn(self, filters=(8, 16), kernel_size=5, num_classes=5):
+        """微型1D-CNN: 步長2的卷積 + 全局平均池化 + 全連接輸出"""
+        inputs = keras.Input(shape=(self.sequence_length, self.feature_dim))
+        x = inputs
+        for f in filters:
+            x = layers.Conv1D(f, kernel_size, strides=2, padding='same', activation='relu')(x)
+        x = layers.GlobalAveragePooling1D()(x)
+        outputs = layers.Dense(num_classes, activation='softmax')(x)
+        return keras.Model(inputs=inputs, outputs=outputs)
+
+    def train_tiny_cnn(self, filters=(8, 16), kernel_size=5, epochs=20, batch_size=64,
+                       learning_rate=3e-3):
+        """
+        蒸餾到微型1D-CNN (輸入使用教師的標準化器)
+
+        Returns:
+            Keras 學生模型
+        """
+        keras.utils.set_random_seed(self.seed)
+        student = self.build_tiny_cnn(filters, kernel_size, self.teacher_probs.shape[1])
+        student.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+                        loss='categorical_crossentropy')
+
+        train_starts, targets = self.starts[self.is_train], self._targets()
+
+        def fetch(index, epoch, step):
+            index = np.sort(index)
+            return self.teacher._scale_windows(self._gather(train_starts[index])), targets[index]
+
+        sequence = ResumableBatchSequence(len(train_starts), fetch, batch_size, seed=self.seed)
+        student.fit(sequence, epochs=epochs, shuffle=False, callbacks=[EpochSyncCallback(sequence)],
+                    verbose=0)
+
+        val_starts = self.starts[~self.is_train]
+        y_pred = np.concatenate([
+            np.argmax(student.predict(self.teacher._scale_windows(self._gather(val_starts[i:i + self.batch_size])),
+                                      verbose=0), axis=1)
+            for i in range(0, len(val_starts), self.batch_size)
+        ])
+        self._record(f"tiny_cnn {tuple(filters)} (alpha={self.alpha})", y_pred, keras_footprint(student))
+        return student
+
+    def report(self):
+        """打印準確率與Flash/RAM佔用的比較表"""
+        print("\n蒸餾結果 (評估集):")
+        print(f"{'模型':<32}{'準確率':>8}{'教師一致率':>10}{'參數':>10}"
+              f"{'Flash f32(KB)':>15}{'Flash int8(KB)':>16}{'RAM f32(KB)':>13}")
+        for r in self.results:
+            print(f"{r['model']:<32}{r['accuracy']:>8.4f}{r['agreement']:>10.4f}{r['params']:>10}"
+                  f"{r['flash_float32_kb']:>15.1f}{r['flash_int8_kb']:>16.1f}{r['ram_float32_kb']:>13.1f}")
+        return self.results
+
+
+def main():
+    """以已保存的 CNN-LSTM 為教師蒸餾兩種學生模型"""
+    try:
+        from .cnn_lstm_model import ParkinsonCNNLSTMModel
+    except ImportError:
+        from cnn_lstm_model import ParkinsonCNNLSTMModel
+
+    teacher = ParkinsonCNNLSTMModel()
+    teacher.load_model("models/parkinson_cnn_lstm.h5")
+
+    distiller = Distiller(teacher).prepare("data/store", "data", hop=5)
+    linear_student = distiller.train_linear()
+    cnn_student = distiller.train_tiny_cnn()
+    distiller.report()
+
+    # 線性學生與 SimpleParkinsonModel 格式相同，convert_to_arduino.py 可直接轉換
+    linear_student.save_model("models/simple_parkinson_model.json")
+    cnn_student.save("models/parkinson_student_cnn.h5")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+CNN-LSTM超參數搜索
+在 create_model 的結構參數 (濾波器、LSTM單元、dropout、序列長度、學習率) 上
+抽樣試驗，以逐次減半 (successive halving) 在進程池中並行訓練並提前淘汰差的試驗，
+結果記錄在本地的 JSON Lines 存儲中，最後導出最佳模型和標準化器
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from .data_pipeline import load_sessions, build_window_index
+    from .cross_validation import group_kfold_indices, _limit_threads, _worker_thread_env
+except ImportError:
+    from data_pipeline import load_sessions, build_window_index
+    from cross_validation import group_kfold_indices, _limit_threads, _worker_thread_env
+
+# 默認搜索空間: 列表為離散選擇，('loguniform', 下限, 上限) 為對數均勻分佈
+DEFAULT_SEARCH_SPACE = {
+    'filters': [(32, 64, 128), (64, 128, 256)],
+    'lstm_units': [(64, 32), (128, 64)],
+    'dropout': [0.1, 0.2, 0.3],
+    'sequence_length': [30, 50],
+    'learning_rate': ('loguniform', 3e-4, 3e-3)
+}
+
+RESULTS_FILE = "results.jsonl"
+DATA_DIR = "data"
+
+
+def sample_configs(search_space, num_trials, seed=42):
+    """
+    從搜索空間中抽樣試驗配置
+
+    Args:
+        search_space: 參數名到候選列表或 ('loguniform', low, high) 的字典
+        num_trials: 試驗數量
+        seed: 隨機種子
+
+    Returns:
+        配置字典列表 (元組轉為列表以便寫入JSON)
+    """
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(num_trials):
+        config = {}
+        for name, space in search_space.items():
+            if isinstance(space, tuple) and space and space[0] == 'loguniform':
+                _, low, high = space
+                config[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                value = space[int(rng.integers(len(space)))]
+                config[name] = list(value) if isinstance(value, (tuple, list)) else value
+        configs.append(config)
+    return configs
+
+
+def config_hash(*parts):
+    """配置的短哈希 (JSON序列化後的SHA-256)，用於判斷存儲中的記錄是否屬於當前搜索"""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def rung_schedule(min_epochs, max_epochs, eta):
+    """逐次減半各輪的累計訓練輪數，如 (1, 9, 3) -> [1, 3, 9]"""
+    schedule = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        schedule.append(epochs)
+        epochs *= eta
+    schedule.append(max_epochs)
+    return schedule
+
+
+class SweepStore:
+    """
+    本地試驗結果存儲
+
+    每個試驗在每一輪的結果追加為 results.jsonl 中的一行，並帶有試驗配置、搜索參數和
+    數據的哈希 (fingerprint)。中斷後重新運行時，只有哈希一致的 (試驗, 輪) 會直接從
+    存儲中讀取；搜索空間、種子、輪數或數據改變後舊記錄被忽略。
+    """
+
+    def __init__(self, sweep_dir):
+        self.sweep_dir = sweep_dir
+        self.path = os.path.join(sweep_dir, RESULTS_FILE)
+        os.makedirs(sweep_dir, exist_ok=True)
+
+    def load(self):
+        """讀取全部記錄"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def record(self, result):
+        """追加一條記錄"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    def completed(self, fingerprints):
+        """
+        已完成的 (trial_id, rung) 到記錄的映射
+
+        Args:
+            fingerprints: trial_id -> 當前搜索中該試驗的哈希，只返回哈希一致的記錄
+        """
+        return {(r['trial_id'], r['rung']): r for r in self.load()
+                if r.get('fingerprint') is not None
+                and r['fingerprint'] == fingerprints.get(r['trial_id'])}
+
+    def best(self, fingerprints):
+        """當前搜索 (哈希一致的記錄) 最高一輪中驗證損失最低的記錄"""
+        records = list(self.completed(fingerprints).values())
+        if not records:
+            return None
+        top_rung = max(r['rung'] for r in records)
+        return min((r for r in records if r['rung'] == top_rung), key=lambda r: r['val_loss'])
+
+
+def _trial_dir(sweep_dir, trial_id):
+    return os.path.join(sweep_dir, f"trial_{trial_id:04d}")
+
+
+def _load_windows(data_dir, sequence_length, hop, train):
+    """以內存映射讀取標準化後的會話數據並物化訓練或驗證窗口"""
+    data = np.load(os.path.join(data_dir, 'data.npy'), mmap_mode='r')
+    lengths = np.load(os.path.join(data_dir, 'lengths.npy'))
+    session_labels = np.load(os.path.join(data_dir, 'labels.npy'))
+    is_train = np.load(os.path.join(data_dir, 'is_train.npy'))
+
+    starts, window_session = build_window_index(lengths, sequence_length, hop)
+    keep = is_train[window_session] == train
+    starts, window_session = starts[keep], window_session[keep]
+
+    X = np.asarray(data[starts[:, None] + np.arange(sequence_length)], dtype=np.float32)
+    return X, session_labels[window_session]
+
+
+def _run_trial(task):
+    """在工作進程中把一個試驗訓練到本輪的累計輪數並在驗證集上評估"""
+    sweep_dir, trial_id, config, rung, epochs, initial_epoch, params, num_threads = task
+
+    import tensorflow as tf
+    from tensorflow import keras
+    try:
+        from .cnn_lstm_model import ParkinsonCNNLSTMModel
+    except ImportError:
+        from cnn_lstm_model import ParkinsonCNNLSTMModel
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass  # 運行時已初始化 (當前進程內執行)
+
+    data_dir = os.path.join(sweep_dir, DATA_DIR)
+    sequence_length = config.get('sequence_length', 50)
+    X_train, y_train = _load_windows(data_dir, sequence_length, params['hop'], True)
+    X_val, y_val = _load_windows(data_dir, sequence_length, params['hop'], False)
+
+    trial_dir = _trial_dir(sweep_dir, trial_id)
+    checkpoint_path = os.path.join(trial_dir, "model.keras")
+    os.makedirs(trial_dir, exist_ok=True)
+
+    keras.utils.set_random_seed(params['seed'] + trial_id)
+    model = ParkinsonCNNLSTMModel(sequence_length, X_train.shape[2], profile=params['profile'])
+    batch_size = config.get('batch_size') or model.profile['batch_size']
+
+    # 晉級的試驗從上一輪的檢查點繼續訓練 (包括優化器狀態)
+    if initial_epoch > 0 and os.path.exists(checkpoint_path):
+        model.model = keras.models.load_model(checkpoint_path)
+    else:
+        initial_epoch = 0
+        model.create_model(num_classes=params['num_classes'], batch_size=batch_size,
+                           filters=tuple(config.get('filters', (64, 128, 256))),
+                           lstm_units=tuple(config.get('lstm_units', (128, 64))),
+                           dropout=config.get('dropout', 0.2),
+                           learning_rate=config.get('learning_rate'))
+
+    start_time = time.perf_counter()
+    model.model.fit(X_train, y_train, batch_size=batch_size, epochs=epochs,
+                    initial_epoch=initial_epoch, shuffle=True, verbose=0)
+    elapsed = time.perf_counter() - start_time
+
+    model.model.save(checkpoint_path)
+    val_loss, val_accuracy = model.model.evaluate(X_val, y_val, batch_size=batch_size, verbose=0)
+
+    return {
+        'trial_id': trial_id,
+        'rung': rung,
+        'epochs': epochs,
+        'config': config,
+        'val_loss': float(val_loss),
+        'val_accuracy': float(val_accuracy),
+        'train_windows': int(len(y_train)),
+        'val_windows': int(len(y_val)),
+        'train_time': elapsed
+    }
+
+
+class HyperparameterSweep:
+    """
+    逐次減半的並行超參數搜索
+
+    每一輪中所有存活的試驗並行訓練到該輪的累計輪數，按驗證損失保留前 1/eta，
+    晉級的試驗從檢查點繼續訓練，因此總成本遠低於把每個配置都訓練到最大輪數。
+    訓練/驗證按患者劃分，標準化器只在訓練患者的樣本上擬合。
+    """
+
+    def __init__(self, sweep_dir="models/sweep", search_space=None, num_trials=12,
+                 min_epochs=2, max_epochs=18, eta=3, num_workers=None, threads_per_worker=None,
+                 profile='default', hop=1, val_fraction=0.2, seed=42):
+        """
+        初始化超參數搜索
+
+        Args:
+            sweep_dir: 試驗檢查點和結果存儲目錄
+            search_space: 搜索空間 (None使用 DEFAULT_SEARCH_SPACE)
+            num_trials: 初始試驗數量
+            min_epochs: 第一輪的訓練輪數
+            max_epochs: 最後一輪的累計訓練輪數
+            eta: 每輪保留 1/eta 的試驗
+            num_workers: 並行進程數，None為 min(試驗數, CPU核心數)，1表示在當前進程中依次執行
+            threads_per_worker: 每個進程的線程數，None時平分CPU核心
+            profile: 模型訓練配置 (見 MODEL_PROFILES)
+            hop: 窗口步長
+            val_fraction: 驗證患者比例
+            seed: 抽樣、劃分和訓練的隨機種子
+        """
+        if eta < 2:
+            raise ValueError("eta 必須不小於2")
+
+        cpu_count = os.cpu_count() or 1
+        self.sweep_dir = sweep_dir
+        self.search_space = search_space or DEFAULT_SEARCH_SPACE
+        self.num_trials = num_trials
+        self.rungs = rung_schedule(min_epochs, max_epochs, eta)
+        self.eta = eta
+        self.num_workers = num_workers or min(num_trials, cpu_count)
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // self.num_workers)
+        self.profile = profile
+        self.hop = hop
+        self.val_fraction = val_fraction
+        self.seed = seed
+        self.store = SweepStore(sweep_dir)
+        self.scaler = None
+        self.data_hash = None
+        self.fingerprints = None
+
+    def prepare_data(self, data_dir="data"):
+        """
+        按患者劃分會話，擬合標準化器並把標準化後的數據寫入搜索目錄
+
+        Returns:
+            (訓練會話數, 驗證會話數)
+        """
+        from sklearn.preprocessing import StandardScaler
+
+        sessions = [s for s in load_sessions(data_dir) if s['parkinson_level'] is not None]
+        if not sessions:
+            raise ValueError("沒有找到帶標籤的會話數據")
+
+        patient_ids = np.array([str(s['patient_id']) for s in sessions])
+        n_splits = max(2, int(round(1 / self.val_fraction)))
+        is_train = group_kfold_indices(patient_ids, n_splits, self.seed) != 0
+
+        data = np.concatenate([s['features'] for s in sessions], axis=0).astype(np.float32)
+        lengths = np.array([len(s['features']) for s in sessions], dtype=np.int64)
+        labels = np.array([int(s['parkinson_level']) - 1 for s in sessions], dtype=np.int64)
+        train_rows = np.repeat(is_train, lengths)
+
+        self.scaler = StandardScaler().fit(data[train_rows])
+        data = ((data - self.scaler.mean_) / self.scaler.scale_).astype(np.float32)
+
+        out_dir = os.path.join(self.sweep_dir, DATA_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, 'data.npy'), data)
+        np.save(os.path.join(out_dir, 'lengths.npy'), lengths)
+        np.save(os.path.join(out_dir, 'labels.npy'), labels)
+        np.save(os.path.join(out_dir, 'is_train.npy'), is_train)
+
+        # 數據哈希: 數據或劃分改變後，存儲中的舊結果不再被複用
+        digest = hashlib.sha256()
+        for array in (data, lengths, labels, is_train):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        self.data_hash = digest.hexdigest()[:16]
+
+        import joblib
+        joblib.dump(self.scaler, os.path.join(self.sweep_dir, "scaler.joblib"))
+
+        return int(is_train.sum()), int((~is_train).sum())
+
+    def run(self, data_dir="data", num_classes=5):
+        """
+        執行搜索
+
+        Args:
+            data_dir: 會話數據目錄
+            num_classes: 分類數量
+
+        Returns:
+            最佳試驗的記錄 (config, val_loss, val_accuracy, ...)
+        """
+        num_train, num_val = self.prepare_data(data_dir)
+        configs = sample_configs(self.search_space, self.num_trials, self.seed)
+        params = {'hop': self.hop, 'seed': self.seed, 'profile': self.profile,
+                  'num_classes': num_classes}
+        sweep_hash = config_hash(self.search_space, self.num_trials, self.rungs, self.eta,
+                                 self.val_fraction, params, self.data_hash)
+        self.fingerprints = {trial_id: config_hash(sweep_hash, trial_id, config)
+                             for trial_id, config in enumerate(configs)}
+        completed = self.store.completed(self.fingerprints)
+
+        print(f"超參數搜索: {self.num_trials} 個試驗，各輪累計輪數 {self.rungs}，"
+              f"{self.num_workers} 個進程 × {self.threads_per_worker} 線程 "
+              f"(訓練會話 {num_train}，驗證會話 {num_val})")
+
+        survivors = list(range(len(configs)))
+        previous_epochs = 0
+        start_time = time.perf_counter()
+        for rung, epochs in enumerate(self.rungs):
+            tasks = [(self.sweep_dir, trial_id, configs[trial_id], rung, epochs, previous_epochs,
+                      params, self.threads_per_worker)
+                     for trial_id in survivors if (trial_id, rung) not in completed]
+
+            results = [completed[(trial_id, rung)] for trial_id in survivors
+                       if (trial_id, rung) in completed]
+            for result in self._execute(tasks):
+                result['fingerprint'] = self.fingerprints[result['trial_id']]
+                self.store.record(result)
+                results.append(result)
+
+            results.sort(key=lambda r: r['val_loss'])
+            print(f"\n第 {rung + 1} 輪 ({epochs} 輪訓練):")
+            for r in results:
+                print(f"  試驗 {r['trial_id']:>3}: 驗證損失 {r['val_loss']:.4f}，"
+                      f"驗證準確率 {r['val_accuracy']:.4f}  {r['config']}")
+
+            if rung < len(self.rungs) - 1:
+                keep = max(1, math.ceil(len(results) / self.eta))
+                survivors = [r['trial_id'] for r in results[:keep]]
+                self._prune([r['trial_id'] for r in results[keep:]])
+            previous_epochs = epochs
+
+        best = results[0]
+        print(f"\n搜索完成，耗時 {time.perf_counter() - start_time:.1f} 秒")
+        print(f"最佳試驗 {best['trial_id']}: 驗證損失 {best['val_loss']:.4f}，"
+              f"驗證準確率 {best['val_accuracy']:.4f}")
+        print(f"最佳配置: {best['config']}")
+        return best
+
+    def _execute(self, tasks, function=_run_trial):
+        """並行執行一輪的試驗，按完成順序返回結果"""
+        if not tasks:
+            return []
+        if self.num_workers == 1 or len(tasks) == 1:
+            return [function(task) for task in tasks]
+
+        # spawn: 子進程從父進程繼承線程限制的環境變量
+        context = multiprocessing.get_context('spawn')
+        with _worker_thread_env(self.threads_per_worker), \
+                ProcessPoolExecutor(max_workers=min(self.num_workers, len(tasks)), mp_context=context,
+                                    initializer=_limit_threads,
+                                    initargs=(self.threads_per_worker,)) as executor:
+            return list(executor.map(function, tasks))
+
+    def _prune(self, trial_ids):
+        """刪除被淘汰試驗的檢查點 (結果仍保留在存儲中)"""
+        for trial_id in trial_ids:
+            shutil.rmtree(_trial_dir(self.sweep_dir, trial_id), ignore_errors=True)
+
+    def export_best(self, model_path="models/parkinson_cnn_lstm.h5", scaler_path="models/scaler.joblib"):
+        """
+        導出最佳試驗的模型、標準化器和配置
+
+        Args:
+            model_path: 模型輸出路徑
+            scaler_path: 標準化器輸出路徑
+
+        Returns:
+            最佳試驗記錄，沒有結果時返回None
+        """
+        from tensorflow import keras
+
+        best = self.store.best(self.fingerprints or {})
+        if best is None:
+            print("沒有本次搜索的結果可導出 (請先執行 run)")
+            return None
+
+        checkpoint_path = os.path.join(_trial_dir(self.sweep_dir, best['trial_id']), "model.keras")
+        model = keras.models.load_model(checkpoint_path)
+
+        os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+        model.save(model_path)
+        shutil.copyfile(os.path.join(self.sweep_dir, "scaler.joblib"), scaler_path)
+
+        config_path = os.path.splitext(model_path)[0] + "_config.json"
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(best, f, indent=2, ensure_ascii=False)
+
+        print(f"最佳模型已導出: {model_path} (標準化器: {scaler_path}，配置: {config_path})")
+        return best
+
+
+def main():
+    """在合成會話上執行小規模搜索"""
+    try:
+        from .synthetic_data import SyntheticSensorGenerator
+    except ImportError:
+        from synthetic_data import SyntheticSensorGenerator
+
+    data_dir = "data/synthetic_sweep"
+    SyntheticSensorGenerator(seed=42).write_shards(data_dir, 1000, file_format='json',
+                                                   windows_per_session=10, num_workers=1)
+
+    sweep = HyperparameterSweep("models/sweep", num_trials=9, min_epochs=1, max_epochs=9, hop=10)
+    sweep.run(data_dir)
+    sweep.export_best()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,593 @@
+"""
+線性模型訓練引擎
+為 SimpleParkinsonModel 和語音分類器提供共用的線性回歸/邏輯回歸/Softmax 訓練，
+支援小批次Adam、L-BFGS、L2正則化和基於驗證損失的早停，全部以NumPy向量化實現；
+超參數網格可堆疊為一個參數矩陣同時訓練
+"""
+
+import time
+import numpy as np
+
+LOSSES = ('linear', 'logistic', 'softmax')
+OPTIMIZERS = ('lbfgs', 'adam', 'gd')
+
+
+class LinearModelEngine:
+    """
+    向量化線性模型訓練器
+
+    參數以 (特徵數 + 1, 輸出數) 的矩陣打包，最後一行為偏置；
+    訓練後 weights/bias 的形狀與各分類器原有格式一致:
+    logistic/linear 為 (特徵數,) 和標量，softmax 為 (特徵數, 類別數) 和 (類別數,)。
+    """
+
+    def __init__(self, loss='softmax', optimizer='lbfgs', l2=1e-4, learning_rate=0.01,
+                 batch_size=64, max_epochs=200, tol=1e-6, patience=10,
+                 validation_split=0.0, history_size=10, seed=42, verbose=True):
+        """
+        初始化訓練引擎
+
+        Args:
+            loss: 'linear' (均方誤差)、'logistic' (二分類) 或 'softmax' (多分類)
+            optimizer: 'lbfgs' (全批次)、'adam' (小批次) 或 'gd' (全批次固定學習率，原有做法)
+            l2: 權重的L2正則化係數 (不作用於偏置)
+            learning_rate: adam/gd 的學習率
+            batch_size: adam 的小批次大小
+            max_epochs: 最大輪數 (lbfgs 為最大迭代數)
+            tol: 訓練損失相對變化或梯度範數低於此值時停止
+            patience: 驗證損失連續多少輪沒有改善時早停 (0表示不早停；只在有驗證集時生效)
+            validation_split: 未提供驗證集時從訓練數據中劃出的比例 (默認0，使用全部數據訓練；
+                              設為大於0以啟用早停)
+            history_size: L-BFGS 保存的曲率對數量
+            seed: 隨機種子 (驗證劃分和小批次順序)
+            verbose: 是否打印訓練進度
+        """
+        if loss not in LOSSES:
+            raise ValueError(f"未知的損失函數: {loss}")
+        if optimizer not in OPTIMIZERS:
+            raise ValueError(f"未知的優化器: {optimizer}")
+
+        self.loss = loss
+        self.optimizer = optimizer
+        self.l2 = l2
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.max_epochs = max_epochs
+        self.tol = tol
+        self.patience = patience
+        self.validation_split = validation_split
+        self.history_size = history_size
+        self.seed = seed
+        self.verbose = verbose
+
+        self.theta = None
+        self.weights = None
+        self.bias = None
+        self.num_outputs = None
+        self.history = None
+        self.train_time = None
+
+    # ------------------------------------------------------------------
+    # 損失和梯度
+    # ------------------------------------------------------------------
+
+    def _targets(self, y):
+        """將標籤轉換為 (N, 輸出數) 的目標矩陣 (softmax 也接受 (N, 類別數) 的軟標籤)"""
+        y = np.asarray(y)
+        if self.loss == 'softmax' and y.ndim == 2:
+            return y.astype(np.float64)
+        if self.loss == 'softmax':
+            return np.eye(self.num_outputs)[y.astype(np.int64)]
+        return y.astype(np.float64).reshape(-1, 1)
+
+    @staticmethod
+    def _augment(X):
+        """在特徵後附加常數1列 (偏置)"""
+        return np.hstack([X, np.ones((len(X), 1))])
+
+    def _data_loss(self, logits, Y):
+        """未正則化的平均損失和對logits的梯度"""
+        n = len(Y)
+        if self.loss == 'linear':
+            residual = logits - Y
+            return 0.5 * np.mean(np.sum(residual ** 2, axis=1)), residual / n
+
+        if self.loss == 'logistic':
+            # log(1 + e^z) - y·z，數值穩定
+            loss = np.mean(np.logaddexp(0, logits) - Y * logits)
+            return loss, (_sigmoid(logits) - Y) / n
+
+        shifted = logits - logits.max(axis=1, keepdims=True)
+        log_norm = np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+        log_probs = shifted - log_norm
+        loss = -np.mean(np.sum(Y * log_probs, axis=1))
+        return loss, (np.exp(log_probs) - Y) / n
+
+    def loss_and_grad(self, theta, Xa, Y):
+        """
+        正則化損失和梯度
+
+        Args:
+            theta: (特徵數 + 1, 輸出數) 參數
+            Xa: 附加偏置列的特徵 (N, 特徵數 + 1)
+            Y: 目標矩陣 (N, 輸出數)
+        """
+        loss, d_logits = self._data_loss(Xa @ theta, Y)
+        grad = Xa.T @ d_logits
+
+        W = theta[:-1]
+        loss += 0.5 * self.l2 * np.sum(W ** 2)
+        grad[:-1] += self.l2 * W
+        return loss, grad
+
+    # ------------------------------------------------------------------
+    # 訓練
+    # ------------------------------------------------------------------
+
+    def fit(self, X, y, X_val=None, y_val=None, target_loss=None, num_classes=None):
+        """
+        訓練模型
+
+        Args:
+            X: 標準化後的特徵 (N, 特徵數)
+            y: 標籤 (softmax為類別序號或 (N, 類別數) 的軟標籤，logistic為0/1，linear為實數)
+            X_val, y_val: 可選的驗證集，用於早停
+            target_loss: 訓練損失達到此值即停止 (用於比較優化器的收斂速度)
+            num_classes: softmax 的類別數，None 時由標籤推斷
+
+        Returns:
+            self
+        """
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        rng = np.random.default_rng(self.seed)
+
+        if self.loss == 'softmax' and y.ndim == 2:
+            self.num_outputs = y.shape[1]
+        elif self.loss == 'softmax':
+            self.num_outputs = num_classes or int(max(y.max(), y_val.max() if y_val is not None else 0)) + 1
+        else:
+            self.num_outputs = 1
+
+        # 劃出驗證集
+        if X_val is None and self.patience and self.validation_split > 0 and len(X) >= 20:
+            order = rng.permutation(len(X))
+            num_val = max(1, int(len(X) * self.validation_split))
+            val_idx, train_idx = order[:num_val], order[num_val:]
+            X, X_val, y, y_val = X[train_idx], X[val_idx], y[train_idx], y[val_idx]
+
+        Xa, Y = self._augment(X), self._targets(y)
+        validation = None
+        if X_val is not None and len(X_val) > 0:
+            validation = (self._augment(np.asarray(X_val, dtype=np.float64)), self._targets(y_val))
+
+        self.history = {'loss': [], 'val_loss': []}
+        theta = np.zeros((Xa.shape[1], self.num_outputs))
+
+        start_time = time.perf_counter()
+        if self.optimizer == 'lbfgs':
+            theta = self._fit_lbfgs(theta, Xa, Y, validation, target_loss)
+        else:
+            theta = self._fit_first_order(theta, Xa, Y, validation, target_loss, rng)
+        self.train_time = time.perf_counter() - start_time
+
+        self._set_params(theta)
+        if self.verbose:
+            print(f"[{self.optimizer}] {len(self.history['loss'])} 輪，"
+                  f"最終損失 {self.history['loss'][-1]:.4f}，耗時 {self.train_time * 1000:.1f} ms")
+        return self
+
+    def _check_validation(self, state, theta, validation):
+        """記錄驗證損失，返回是否應該早停"""
+        if validation is None:
+            return False
+
+        val_loss, _ = self._data_loss(validation[0] @ theta, validation[1])
+        self.history['val_loss'].append(val_loss)
+
+        if val_loss < state['best_loss'] - 1e-12:
+            state['best_loss'], state['best_theta'], state['wait'] = val_loss, theta.copy(), 0
+            return False
+
+        state['wait'] += 1
+        return bool(self.patience) and state['wait'] >= self.patience
+
+    def _log(self, epoch, loss):
+        """打印訓練進度"""
+        if self.verbose and epoch % max(1, self.max_epochs // 5) == 0:
+            message = f"Epoch {epoch}: Loss={loss:.4f}"
+            if self.history['val_loss']:
+                message += f", Val Loss={self.history['val_loss'][-1]:.4f}"
+            print(message)
+
+    def _fit_first_order(self, theta, Xa, Y, validation, target_loss, rng):
+        """小批次Adam或全批次固定學習率梯度下降"""
+        n = len(Xa)
+        batch_size = n if self.optimizer == 'gd' else min(self.batch_size, n)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        m = np.zeros_like(theta)
+        v = np.zeros_like(theta)
+        step = 0
+        state = {'best_loss': np.inf, 'best_theta': None, 'wait': 0}
+        previous_loss = np.inf
+
+        for epoch in range(self.max_epochs):
+            order = rng.permutation(n) if batch_size < n else np.arange(n)
+            for start in range(0, n, batch_size):
+                idx = order[start:start + batch_size]
+                _, grad = self.loss_and_grad(theta, Xa[idx], Y[idx])
+
+                if self.optimizer == 'gd':
+                    theta -= self.learning_rate * grad
+                    continue
+
+                step += 1
+                m = beta1 * m + (1 - beta1) * grad
+                v = beta2 * v + (1 - beta2) * grad ** 2
+                m_hat = m / (1 - beta1 ** step)
+                v_hat = v / (1 - beta2 ** step)
+                theta -= self.learning_rate * m_hat / (np.sqrt(v_hat) + eps)
+
+            loss, _ = self.loss_and_grad(theta, Xa, Y)
+            self.history['loss'].append(loss)
+            stop = self._check_validation(state, theta, validation)
+            self._log(epoch, loss)
+
+            if stop or (target_loss is not None and loss <= target_loss):
+                break
+            if abs(previous_loss - loss) <= self.tol * max(1.0, abs(loss)):
+                break
+            previous_loss = loss
+
+        return state['best_theta'] if state['best_theta'] is not None else theta
+
+    def _fit_lbfgs(self, theta, Xa, Y, validation, target_loss):
+        """全批次L-BFGS (雙循環遞推 + 回溯Armijo線搜索)"""
+        shape = theta.shape
+        x = theta.ravel()
+        loss, grad = self.loss_and_grad(theta, Xa, Y)
+        grad = grad.ravel()
+        s_list, y_list = [], []
+        state = {'best_loss': np.inf, 'best_theta': None, 'wait': 0}
+
+        for iteration in range(self.max_epochs):
+            # 雙循環計算搜索方向
+            q = grad.copy()
+            alphas = []
+            for s, yk in reversed(list(zip(s_list, y_list))):
+                alpha = s @ q / (yk @ s)
+                alphas.append(alpha)
+                q -= alpha * yk
+            if s_list:
+                q *= (s_list[-1] @ y_list[-1]) / (y_list[-1] @ y_list[-1])
+            for (s, yk), alpha in zip(zip(s_list, y_list), reversed(alphas)):
+                beta = yk @ q / (yk @ s)
+                q += s * (alpha - beta)
+            direction = -q
+
+            slope = grad @ direction
+            if slope >= 0:
+                # 方向不下降時退回最速下降
+                direction, slope = -grad, -(grad @ grad)
+                s_list, y_list = [], []
+
+            # 回溯線搜索
+            step = 1.0 if s_list else min(1.0, 1.0 / max(np.abs(grad).sum(), 1e-12))
+            while True:
+                x_new = x + step * direction
+                new_loss, new_grad = self.loss_and_grad(x_new.reshape(shape), Xa, Y)
+                if new_loss <= loss + 1e-4 * step * slope or step < 1e-10:
+                    break
+                step *= 0.5
+            if new_loss > loss:
+                # 步長已縮到下限仍未下降: 保留原參數並停止
+                break
+
+            new_grad = new_grad.ravel()
+            s, yk = x_new - x, new_grad - grad
+            if s @ yk > 1e-10:
+                s_list.append(s)
+                y_list.append(yk)
+                if len(s_list) > self.history_size:
+                    s_list.pop(0)
+                    y_list.pop(0)
+
+            converged = abs(loss - new_loss) <= self.tol * max(1.0, abs(new_loss))
+            x, loss, grad = x_new, new_loss, new_grad
+            self.history['loss'].append(loss)
+            stop = self._check_validation(state, x.reshape(shape), validation)
+            self._log(iteration, loss)
+
+            if stop or (target_loss is not None and loss <= target_loss):
+                break
+            if converged or np.abs(grad).max() <= self.tol:
+                break
+
+        theta = x.reshape(shape)
+        return state['best_theta'] if state['best_theta'] is not None else theta
+
+    def _set_params(self, theta):
+        """從打包參數恢復 weights/bias"""
+        self.theta = theta
+        if self.loss == 'softmax':
+            self.weights = theta[:-1].copy()
+            self.bias = theta[-1].copy()
+        else:
+            self.weights = theta[:-1, 0].copy()
+            self.bias = float(theta[-1, 0])
+
+    # ------------------------------------------------------------------
+    # 預測
+    # ------------------------------------------------------------------
+
+    def decision_function(self, X):
+        """線性輸出 (logits)"""
+        return np.asarray(X, dtype=np.float64) @ self.weights + self.bias
+
+    def predict_proba(self, X):
+        """logistic 返回正類概率，softmax 返回類別概率"""
+        logits = self.decision_function(X)
+        if self.loss == 'logistic':
+            return _sigmoid(logits)
+        if self.loss == 'softmax':
+            exp_logits = np.exp(logits - logits.max(axis=-1, keepdims=True))
+            return exp_logits / exp_logits.sum(axis=-1, keepdims=True)
+        return logits
+
+    def predict(self, X):
+        """類別或回歸值"""
+        if self.loss == 'logistic':
+            return (self.predict_proba(X) > 0.5).astype(int)
+        if self.loss == 'softmax':
+            return np.argmax(self.decision_function(X), axis=-1)
+        return self.decision_function(X)
+
+    def evaluate_loss(self, X, y):
+        """不含正則項的平均損失"""
+        Xa = self._augment(np.asarray(X, dtype=np.float64))
+        loss, _ = self._data_loss(Xa @ self.theta, self._targets(y))
+        return loss
+
+
+def _sigmoid(z):
+    """數值穩定的sigmoid"""
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+
+def _per_sample_loss(logits, Y, loss):
+    """
+    逐樣本損失
+
+    Args:
+        logits: (N, ..., 輸出數)
+        Y: 與 logits 可廣播的目標
+    """
+    if loss == 'linear':
+        return 0.5 * np.sum((logits - Y) ** 2, axis=-1)
+    if loss == 'logistic':
+        return np.sum(np.logaddexp(0, logits) - Y * logits, axis=-1)
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    log_probs = shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+    return -np.sum(Y * log_probs, axis=-1)
+
+
+def _logit_grad(logits, Y, loss):
+    """逐樣本損失對logits的梯度"""
+    if loss == 'linear':
+        return logits - Y
+    if loss == 'logistic':
+        return _sigmoid(logits) - Y
+    exp_logits = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp_logits / exp_logits.sum(axis=-1, keepdims=True) - Y
+
+
+def train_stacked(Xa, Y, train_mask, learning_rates, l2_values, loss='logistic',
+                  optimizer='adam', epochs=200, batch_size=64, seed=42):
+    """
+    同時訓練 F 個數據劃分 × K 組超參數的線性模型
+
+    所有模型的參數堆疊為 (特徵數 + 1, F·K·輸出數) 的矩陣，每一步只做一次
+    前向和一次反向矩陣乘法；各劃分的訓練樣本由 train_mask 選取。
+
+    Args:
+        Xa: 附加偏置列的特徵 (N, D)
+        Y: 目標矩陣 (N, 輸出數)
+        train_mask: (N, F) 布爾矩陣，樣本是否屬於第 f 個劃分的訓練集
+        learning_rates, l2_values: 長度為 K 的超參數數組
+        loss: 損失類型
+        optimizer: 'adam' (小批次) 或 'gd' (全批次)
+        epochs: 訓練輪數
+        batch_size: adam 的小批次大小
+        seed: 小批次順序的隨機種子
+
+    Returns:
+        theta: (D, F, K, 輸出數)
+    """
+    N, D = Xa.shape
+    C = Y.shape[1]
+    F = train_mask.shape[1]
+    learning_rates = np.asarray(learning_rates, dtype=np.float64)
+    l2_values = np.asarray(l2_values, dtype=np.float64)
+    K = len(learning_rates)
+
+    # 按列展開的超參數 (列順序為 F, K, C)
+    lr_columns = np.broadcast_to(learning_rates[None, :, None], (F, K, C)).ravel()
+    l2_columns = np.broadcast_to(l2_values[None, :, None], (F, K, C)).ravel()
+
+    theta = np.zeros((D, F * K * C))
+    m = np.zeros_like(theta)
+    v = np.zeros_like(theta)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    rng = np.random.default_rng(seed)
+    batch_size = N if optimizer == 'gd' else min(batch_size, N)
+    weights = train_mask.astype(np.float64)
+    step = 0
+
+    for _ in range(epochs):
+        order = rng.permutation(N) if batch_size < N else np.arange(N)
+        for start in range(0, N, batch_size):
+            idx = order[start:start + batch_size]
+            B = len(idx)
+
+            logits = (Xa[idx] @ theta).reshape(B, F, K, C)
+            d_logits = _logit_grad(logits, Y[idx][:, None, None, :], loss)
+
+            # 每個劃分只統計自己的訓練樣本
+            batch_weights = weights[idx]
+            batch_weights = batch_weights / np.maximum(batch_weights.sum(axis=0), 1.0)
+            d_logits *= batch_weights[:, :, None, None]
+
+            grad = Xa[idx].T @ d_logits.reshape(B, -1)
+            grad[:-1] += l2_columns * theta[:-1]
+
+            if optimizer == 'gd':
+                theta -= lr_columns * grad
+                continue
+
+            step += 1
+            m = beta1 * m + (1 - beta1) * grad
+            v = beta2 * v + (1 - beta2) * grad ** 2
+            m_hat = m / (1 - beta1 ** step)
+            v_hat = v / (1 - beta2 ** step)
+            theta -= lr_columns * m_hat / (np.sqrt(v_hat) + eps)
+
+    return theta.reshape(D, F, K, C)
+
+
+def grid_search(X, y, learning_rates, l2_values, loss='logistic', optimizer='adam',
+                epochs=200, batch_size=64, cv_folds=5, num_classes=None, seed=42, verbose=True):
+    """
+    批次超參數網格訓練: 所有網格點和交叉驗證折在一次堆疊訓練中完成，
+    以平均驗證損失選出最佳組合，再在全部數據上重新訓練
+
+    Args:
+        X: 標準化後的特徵 (N, 特徵數)
+        y: 標籤
+        learning_rates: 學習率候選
+        l2_values: L2係數候選 (與學習率組成笛卡爾網格)
+        loss, optimizer, epochs, batch_size: 見 train_stacked
+        cv_folds: 交叉驗證折數
+        num_classes: softmax 的類別數
+        seed: 隨機種子
+
+    Returns:
+        dict: learning_rate, l2, weights, bias, grid, cv_loss, best_index, time
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    rng = np.random.default_rng(seed)
+
+    engine = LinearModelEngine(loss=loss, verbose=False)
+    engine.num_outputs = (num_classes or int(y.max()) + 1) if loss == 'softmax' else 1
+    Xa, Y = engine._augment(X), engine._targets(y)
+
+    grid = [(lr, l2) for lr in learning_rates for l2 in l2_values]
+    grid_lr = np.array([g[0] for g in grid])
+    grid_l2 = np.array([g[1] for g in grid])
+
+    # 隨機分折
+    fold_ids = rng.permutation(len(X)) % cv_folds
+    train_mask = fold_ids[:, None] != np.arange(cv_folds)[None, :]
+
+    start_time = time.perf_counter()
+    theta = train_stacked(Xa, Y, train_mask, grid_lr, grid_l2, loss, optimizer,
+                          epochs, batch_size, seed)
+
+    # 每個 (折, 網格點) 在其驗證樣本上的平均損失
+    logits = np.einsum('nd,dfkc->nfkc', Xa, theta)
+    sample_loss = _per_sample_loss(logits, Y[:, None, None, :], loss)
+    val_mask = (~train_mask).astype(np.float64)[:, :, None]
+    fold_loss = (sample_loss * val_mask).sum(axis=0) / np.maximum(val_mask.sum(axis=0), 1.0)
+    cv_loss = np.nan_to_num(fold_loss.mean(axis=0), nan=np.inf)
+    best_index = int(np.argmin(cv_loss))
+    search_time = time.perf_counter() - start_time
+
+    # 在全部數據上以最佳超參數重新訓練
+    best_lr, best_l2 = grid[best_index]
+    final_theta = train_stacked(Xa, Y, np.ones((len(X), 1), dtype=bool), [best_lr], [best_l2],
+                                loss, optimizer, epochs, batch_size, seed)[:, 0, 0, :]
+    engine._set_params(final_theta)
+
+    if verbose:
+        print(f"網格訓練: {len(grid)} 組超參數 × {cv_folds} 折，耗時 {search_time * 1000:.1f} ms")
+        print(f"最佳: learning_rate={best_lr:g}, l2={best_l2:g}, CV損失={cv_loss[best_index]:.4f}")
+
+    return {
+        'learning_rate': best_lr,
+        'l2': best_l2,
+        'weights': engine.weights,
+        'bias': engine.bias,
+        'grid': grid,
+        'cv_loss': cv_loss,
+        'best_index': best_index,
+        'time': search_time
+    }
+
+
+def compare_optimizers(X, y, loss='softmax', target_loss=None, l2=1e-4):
+    """
+    比較各優化器達到相同訓練損失的耗時
+
+    Args:
+        X: 標準化後的特徵
+        y: 標籤
+        loss: 損失類型
+        target_loss: 目標損失，None 時以 L-BFGS 收斂損失的 1.01 倍為目標
+        l2: L2正則化係數
+
+    Returns:
+        list: 每個優化器的 optimizer, epochs, loss, time
+    """
+    if target_loss is None:
+        reference = LinearModelEngine(loss, 'lbfgs', l2=l2, max_epochs=500, patience=0, verbose=False).fit(X, y)
+        target_loss = reference.history['loss'][-1] * 1.01
+
+    settings = [
+        ('gd', {'learning_rate': 0.01, 'max_epochs': 5000}),
+        ('adam', {'learning_rate': 0.01, 'max_epochs': 500}),
+        ('lbfgs', {'max_epochs': 500})
+    ]
+
+    results = []
+    for optimizer, kwargs in settings:
+        engine = LinearModelEngine(loss, optimizer, l2=l2, patience=0, tol=0, verbose=False, **kwargs)
+        engine.fit(X, y, target_loss=target_loss)
+        results.append({
+            'optimizer': optimizer,
+            'epochs': len(engine.history['loss']),
+            'loss': engine.history['loss'][-1],
+            'time': engine.train_time
+        })
+
+    print(f"\n達到訓練損失 {target_loss:.4f} 的耗時:")
+    print(f"{'優化器':<8} {'輪數':>8} {'損失':>10} {'耗時(ms)':>10}")
+    for r in results:
+        print(f"{r['optimizer']:<8} {r['epochs']:>8} {r['loss']:>10.4f} {r['time'] * 1000:>10.1f}")
+
+    return results
+
+
+def main():
+    """在合成數據上比較優化器"""
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((1500, 54))
+    true_weights = rng.standard_normal((54, 5))
+    y = np.argmax(X @ true_weights + rng.gumbel(size=(1500, 5)), axis=1)
+
+    compare_optimizers(X, y, loss='softmax')
+    compare_optimizers(X[:, :8], (y > 2).astype(int), loss='logistic')
+
+    # 50點網格: 堆疊訓練 vs 逐個訓練
+    X_speech, y_speech = X[:, :8], (y > 2).astype(int)
+    learning_rates = np.logspace(-3, -1, 10)
+    l2_values = np.logspace(-5, -1, 5)
+
+    result = grid_search(X_speech, y_speech, learning_rates, l2_values, epochs=50)
+
+    serial_time = sum(grid_search(X_speech, y_speech, [lr], [l2], epochs=50, verbose=False)['time']
+                      for lr in learning_rates for l2 in l2_values)
+    print(f"逐個訓練50組耗時 {serial_time * 1000:.1f} ms，堆疊訓練加速 {serial_time / result['time']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+純NumPy推理引擎
+把訓練好的Keras模型導出為權重和層圖 (.npz)，在不導入TensorFlow的情況下
+批次執行 Conv1D、BatchNormalization (預先折疊為逐通道仿射變換)、MaxPooling1D、
+LSTM/GRU、sigmoid 注意力門和 Dense 層，供網關上的主機端分析使用
+"""
+
+import json
+import numpy as np
+
+try:
+    from .data_quality import DataQualityChecker, describe_flags
+except ImportError:
+    from data_quality import DataQualityChecker, describe_flags
+
+SUPPORTED_LAYERS = ('InputLayer', 'Conv1D', 'BatchNormalization', 'MaxPooling1D', 'Dropout',
+                    'LSTM', 'GRU', 'Dense', 'Multiply', 'GlobalAveragePooling1D', 'Activation')
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'softmax': _softmax
+}
+
+
+def export_numpy_model(model, path, scaler=None):
+    """
+    導出Keras模型為NumPy引擎的格式
+
+    層圖 (層類型、配置和輸入層) 以JSON存在 'graph' 中，權重以 '<層名>/<序號>' 存儲。
+    BatchNormalization 導出為逐通道的 scale 和 shift；若它直接跟在無激活函數的
+    Conv1D/Dense 之後且是唯一的下游層，則直接折疊進該層的權重。
+
+    Args:
+        model: Keras 函數式模型
+        path: 輸出 .npz 路徑
+        scaler: 可選的 StandardScaler，導出後推理時接受原始窗口
+    """
+    layers_spec, arrays = [], {}
+    consumers = {}
+    for layer in model.layers:
+        if layer.__class__.__name__ == 'InputLayer':
+            continue
+        inputs = layer.input if isinstance(layer.input, (list, tuple)) else [layer.input]
+        for tensor in inputs:
+            consumers.setdefault(tensor._keras_history.operation.name, []).append(layer.name)
+
+    folded = {}     # 被折疊的BN層名 -> 接收折疊的層名
+    specs = {}
+    for layer in model.layers:
+        kind = layer.__class__.__name__
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError(f"NumPy引擎不支持的層: {layer.name} ({kind})")
+
+        config = layer.get_config()
+        if kind == 'InputLayer':
+            spec = {'name': layer.name, 'type': kind, 'inputs': [],
+                    'shape': [int(d) for d in model.inputs[0].shape[1:]]}
+            layers_spec.append(spec)
+            specs[layer.name] = spec
+            continue
+
+        inputs = layer.input if isinstance(layer.input, (list, tuple)) else [layer.input]
+        input_names = [folded.get(t._keras_history.operation.name, t._keras_history.operation.name)
+                       for t in inputs]
+        spec = {'name': layer.name, 'type': kind, 'inputs': input_names}
+        weights = [np.asarray(w, dtype=np.float32) for w in layer.get_weights()]
+
+        if kind == 'Conv1D':
+            spec.update(kernel_size=int(config['kernel_size'][0]), strides=int(config['strides'][0]),
+                        dilation_rate=int(config['dilation_rate'][0]), padding=config['padding'],
+                        activation=config['activation'])
+            if not config['use_bias']:
+                weights.append(np.zeros(weights[0].shape[-1], dtype=np.float32))
+        elif kind == 'Dense':
+            spec.update(activation=config['activation'])
+            if not config['use_bias']:
+                weights.append(np.zeros(weights[0].shape[-1], dtype=np.float32))
+        elif kind == 'BatchNormalization':
+            gamma = weights.pop(0) if config['scale'] else 1.0
+            beta = weights.pop(0) if config['center'] else 0.0
+            moving_mean, moving_variance = weights
+            scale = (gamma / np.sqrt(moving_variance + config['epsilon'])).astype(np.float32)
+            shift = (beta - moving_mean * scale).astype(np.float32)
+
+            producer = specs[input_names[0]]
+            if (producer['type'] in ('Conv1D', 'Dense') and producer['activation'] == 'linear'
+                    and consumers.get(producer['name']) == [layer.name]):
+                # y = (xW + b) * scale + shift
+                kernel_key, bias_key = f"{producer['name']}/0", f"{producer['name']}/1"
+                arrays[kernel_key] = arrays[kernel_key] * scale
+                arrays[bias_key] = arrays[bias_key] * scale + shift
+                folded[layer.name] = producer['name']
+                continue
+            weights = [scale, shift]
+        elif kind == 'MaxPooling1D':
+            spec.update(pool_size=int(config['pool_size'][0]),
+                        strides=int((config['strides'] or config['pool_size'])[0]),
+                        padding=config['padding'])
+        elif kind in ('LSTM', 'GRU'):
+            spec.update(units=int(config['units']), return_sequences=bool(config['return_sequences']),
+                        activation=config['activation'],
+                        recurrent_activation=config['recurrent_activation'],
+                        go_backwards=bool(config['go_backwards']))
+            if kind == 'GRU':
+                spec['reset_after'] = bool(config['reset_after'])
+            if not config['use_bias']:
+                gates = 4 if kind == 'LSTM' else 3
+                bias_shape = (2, gates * config['units']) if spec.get('reset_after') else (gates * config['units'],)
+                weights.append(np.zeros(bias_shape, dtype=np.float32))
+        elif kind == 'Activation':
+            spec.update(activation=config['activation'])
+
+        for i, w in enumerate(weights):
+            arrays[f"{layer.name}/{i}"] = w
+        spec['num_weights'] = len(weights)
+        layers_spec.append(spec)
+        specs[layer.name] = spec
+
+    outputs = [folded.get(t._keras_history.operation.name, t._keras_history.operation.name)
+               for t in model.outputs]
+    graph = {'layers': layers_spec, 'outputs': outputs}
+    if scaler is not None:
+        arrays['scaler/mean'] = scaler.mean_.astype(np.float32)
+        arrays['scaler/scale'] = scaler.scale_.astype(np.float32)
+
+    np.savez(path, graph=np.array(json.dumps(graph)), **arrays)
+    print(f"NumPy模型已導出: {path}")
+
+
+def _conv1d(x, kernel, bias, strides, dilation_rate, padding):
+    """批次一維卷積: 按卷積核的每個位置做一次矩陣乘法，再累加"""
+    kernel_size = kernel.shape[0]
+    length = x.shape[1]
+    span = (kernel_size - 1) * dilation_rate + 1
+
+    if padding == 'valid':
+        out_length = (length - span) // strides + 1
+        left = right = 0
+    elif padding == 'causal':
+        out_length = (length - 1) // strides + 1
+        left, right = span - 1, 0
+    else:
+        out_length = -(-length // strides)
+        total = max((out_length - 1) * strides + span - length, 0)
+        left, right = total // 2, total - total // 2
+    if left or right:
+        x = np.pad(x, ((0, 0), (left, right), (0, 0)))
+
+    end = (out_length - 1) * strides + 1
+    out = np.broadcast_to(bias, (x.shape[0], out_length, kernel.shape[2])).copy()
+    for tap in range(kernel_size):
+        start = tap * dilation_rate
+        out += x[:, start:start + end:strides] @ kernel[tap]
+    return out
+
+
+def _max_pool1d(x, pool_size, strides, padding):
+    """批次一維最大池化"""
+    length = x.shape[1]
+    if padding == 'same':
+        out_length = -(-length // strides)
+        total = max((out_length - 1) * strides + pool_size - length, 0)
+        x = np.pad(x, ((0, 0), (total // 2, total - total // 2), (0, 0)), constant_values=-np.inf)
+    else:
+        out_length = (length - pool_size) // strides + 1
+    end = (out_length - 1) * strides + 1
+    return np.max(np.stack([x[:, i:i + end:strides] for i in range(pool_size)]), axis=0)
+
+
+def _lstm_cell(projected, h, c, recurrent_kernel, spec):
+    """LSTM單個時間步 (門順序 i, f, c, o)，projected 為該步的輸入投影，返回新的 (h, c)"""
+    units = spec['units']
+    activation = ACTIVATIONS[spec['activation']]
+    recurrent_activation = ACTIVATIONS[spec['recurrent_activation']]
+    z = projected + h @ recurrent_kernel
+    i = recurrent_activation(z[:, :units])
+    f = recurrent_activation(z[:, units:2 * units])
+    g = activation(z[:, 2 * units:3 * units])
+    o = recurrent_activation(z[:, 3 * units:])
+    c = f * c + i * g
+    return o * activation(c), c
+
+
+def _lstm(x, kernel, recurrent_kernel, bias, spec):
+    """批次LSTM；輸入投影對所有時間步一次完成"""
+    if spec['go_backwards']:
+        x = x[:, ::-1]
+
+    projected = x @ kernel + bias
+    h = np.zeros((x.shape[0], spec['units']), dtype=np.float32)
+    c = np.zeros_like(h)
+    outputs = []
+    for t in range(x.shape[1]):
+        h, c = _lstm_cell(projected[:, t], h, c, recurrent_kernel, spec)
+        if spec['return_sequences']:
+            outputs.append(h)
+    return np.stack(outputs, axis=1) if spec['return_sequences'] else h
+
+
+def _gru_biases(bias, spec):
+    """GRU的 (輸入偏置, 遞歸偏置)"""
+    if spec['reset_after']:
+        return bias[0], bias[1]
+    return bias, np.zeros_like(bias)
+
+
+def _gru_cell(projected, h, recurrent_kernel, recurrent_bias, spec):
+    """GRU單個時間步 (門順序 z, r, h)，projected 為該步的輸入投影，返回新的 h"""
+    units = spec['units']
+    activation = ACTIVATIONS[spec['activation']]
+    recurrent_activation = ACTIVATIONS[spec['recurrent_activation']]
+    xz, xr, xh = np.split(projected, 3, axis=1)
+    if spec['reset_after']:
+        inner = h @ recurrent_kernel + recurrent_bias
+        rz, rr, rh = np.split(inner, 3, axis=1)
+        z = recurrent_activation(xz + rz)
+        r = recurrent_activation(xr + rr)
+        hh = activation(xh + r * rh)
+    else:
+        z = recurrent_activation(xz + h @ recurrent_kernel[:, :units])
+        r = recurrent_activation(xr + h @ recurrent_kernel[:, units:2 * units])
+        hh = activation(xh + (r * h) @ recurrent_kernel[:, 2 * units:])
+    return z * h + (1 - z) * hh
+
+
+def _gru(x, kernel, recurrent_kernel, bias, spec):
+    """批次GRU"""
+    if spec['go_backwards']:
+        x = x[:, ::-1]
+
+    input_bias, recurrent_bias = _gru_biases(bias, spec)
+    projected = x @ kernel + input_bias
+    h = np.zeros((x.shape[0], spec['units']), dtype=np.float32)
+    outputs = []
+    for t in range(x.shape[1]):
+        h = _gru_cell(projected[:, t], h, recurrent_kernel, recurrent_bias, spec)
+        if spec['return_sequences']:
+            outputs.append(h)
+    return np.stack(outputs, axis=1) if spec['return_sequences'] else h
+
+
+class NumpyInferenceEngine:
+    """
+    導出模型的NumPy執行器
+
+    與帕金森預測接口兼容 (predict_batch、predict_parkinson_level)，
+    啟動時只加載NumPy和權重文件，不依賴TensorFlow、scikit-learn或joblib。
+    """
+
+    def __init__(self, path, chunk_size=64):
+        """
+        加載導出的模型
+
+        Args:
+            path: export_numpy_model 生成的 .npz 文件
+            chunk_size: 每次執行的窗口數 (限制中間激活的內存；默認結構每64個窗口約20 MB)
+        """
+        with np.load(path) as f:
+            graph = json.loads(str(f['graph']))
+            self.arrays = {key: f[key] for key in f.files if key != 'graph'}
+
+        self.layers = graph['layers']
+        self.outputs = graph['outputs']
+        self.chunk_size = chunk_size
+        self.input_shape = tuple(self.layers[0]['shape'])
+        self.sequence_length, self.feature_dim = self.input_shape
+        self.mean = self.arrays.get('scaler/mean')
+        self.scale = self.arrays.get('scaler/scale')
+        self.quality_checker = DataQualityChecker()
+
+        # 每個層的輸出被最後一個下游層使用後即可釋放
+        self._last_use = {}
+        for position, spec in enumerate(self.layers):
+            for name in spec['inputs']:
+                self._last_use[name] = position
+
+    def _weights(self, spec):
+        return [self.arrays[f"{spec['name']}/{i}"] for i in range(spec.get('num_weights', 0))]
+
+    def apply_layer(self, spec, inputs):
+        """對輸入數組執行一個層 (逐時間步的層同樣適用於單個時間步的 (N, C) 輸入)"""
+        kind = spec['type']
+        weights = self._weights(spec)
+        if kind == 'Conv1D':
+            return ACTIVATIONS[spec['activation']](
+                _conv1d(inputs[0], weights[0], weights[1], spec['strides'],
+                        spec['dilation_rate'], spec['padding']))
+        if kind == 'Dense':
+            return ACTIVATIONS[spec['activation']](inputs[0] @ weights[0] + weights[1])
+        if kind == 'BatchNormalization':
+            return inputs[0] * weights[0] + weights[1]
+        if kind == 'MaxPooling1D':
+            return _max_pool1d(inputs[0], spec['pool_size'], spec['strides'], spec['padding'])
+        if kind == 'LSTM':
+            return _lstm(inputs[0], *weights, spec)
+        if kind == 'GRU':
+            return _gru(inputs[0], *weights, spec)
+        if kind == 'Multiply':
+            out = inputs[0]
+            for other in inputs[1:]:
+                out = out * other
+            return out
+        if kind == 'GlobalAveragePooling1D':
+            return inputs[0].mean(axis=1)
+        if kind == 'Activation':
+            return ACTIVATIONS[spec['activation']](inputs[0])
+        return inputs[0]    # Dropout
+
+    def forward(self, x):
+        """
+        執行一批已標準化的窗口
+
+        Args:
+            x: (N, sequence_length, feature_dim) float32
+
+        Returns:
+            (N, 類別數) 輸出
+        """
+        values = {}
+        for position, spec in enumerate(self.layers):
+            kind = spec['type']
+            if kind == 'InputLayer':
+                values[spec['name']] = x
+                continue
+
+            out = self.apply_layer(spec, [values[name] for name in spec['inputs']])
+            values[spec['name']] = out.astype(np.float32, copy=False)
+
+            for name in spec['inputs']:
+                if self._last_use.get(name) == position and name not in self.outputs:
+                    del values[name]
+
+        return values[self.outputs[0]]
+
+    def predict(self, windows, scaled=False):
+        """
+        批次推理
+
+        Args:
+            windows: (N, T, C) 或單個 (T, C) 窗口
+            scaled: 窗口是否已標準化 (否則使用導出的標準化參數)
+
+        Returns:
+            (N, 類別數) 概率
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim == 2:
+            windows = windows[None]
+        if not scaled:
+            if self.mean is None:
+                raise ValueError("導出的模型不包含標準化參數，請傳入已標準化的窗口")
+            windows = (windows - self.mean) / self.scale
+
+        return np.concatenate([self.forward(windows[i:i + self.chunk_size])
+                               for i in range(0, len(windows), self.chunk_size)])
+
+    def predict_batch(self, windows, check_quality=True):
+        """
+        批次預測帕金森等級 (返回格式與 ParkinsonCNNLSTMModel.predict_batch 相同)
+        """
+        windows = np.asarray(windows, dtype=np.float32)
+        if windows.ndim == 2:
+            windows = windows[None]
+        probabilities = self.predict(windows)
+
+        flags = np.zeros(len(windows), dtype=np.uint8)
+        quality_ok = np.ones(len(windows), dtype=bool)
+        if check_quality:
+            # 分塊檢查，避免整批窗口的float64副本
+            for i in range(0, len(windows), self.chunk_size):
+                bad_fraction, flags[i:i + self.chunk_size] = \
+                    self.quality_checker.check_windows(windows[i:i + self.chunk_size])
+                quality_ok[i:i + self.chunk_size] = ((bad_fraction <= self.quality_checker.max_bad_fraction)
+                                                     & (flags[i:i + self.chunk_size] == 0))
+
+        return {
+            'predicted_level': np.argmax(probabilities, axis=1) + 1,
+            'confidence': probabilities.max(axis=1),
+            'probabilities': probabilities,
+            'quality_flags': flags,
+            'quality_ok': quality_ok
+        }
+
+    def predict_parkinson_level(self, sensor_data):
+        """
+        預測單個窗口的帕金森等級 (返回格式與 ParkinsonCNNLSTMModel 相同)
+
+        Args:
+            sensor_data: 原始傳感器數據 (sequence_length, feature_dim)
+        """
+        results = self.predict_batch(np.asarray(sensor_data)[None])
+        return {
+            'predicted_level': int(results['predicted_level'][0]),
+            'confidence': float(results['confidence'][0]),
+            'all_probabilities': results['probabilities'][0].tolist(),
+            'quality_flags': describe_flags(results['quality_flags'][0]),
+            'quality_ok': bool(results['quality_ok'][0])
+        }
@@ -8,6 +8,7 @@ import json
 import os
 from datetime import datetime
 from speech_feature_extractor import LightweightSpeechFeatureExtractor
+from linear_engine import LinearModelEngine
 
 class OptimizedSpeechParkinsonClassifier:
     """
@@ -84,15 +85,32 @@ class OptimizedSpeechParkinsonClassifier:
         
         return np.array(X), np.array(y)
     
-    def train_optimized_model(self, epochs=300, learning_rate=0.005):
+    def train_optimized_model(self, epochs=300, learning_rate=0.005, optimizer='lbfgs', l2=1e-4):
         """
         训练优化的分类模型
+        
+        Args:
+            epochs: 最大训练轮数
+            learning_rate: adam/gd 的学习率
+            optimizer: 'lbfgs'、'adam' 或 'gd' (见 LinearModelEngine)
+            l2: L2正则化系数
         """
         print("[INFO] 训练基于真实数据优化的语音分类器...")
         
         # 生成优化的训练数据
         X, y = self.create_realistic_synthetic_data(1500)
         
+        return self.train(X, y, epochs, learning_rate, optimizer, l2)
+    
+    def train(self, X, y, epochs=300, learning_rate=0.005, optimizer='lbfgs', l2=1e-4):
+        """
+        在给定特征上训练分类模型
+        
+        Args:
+            X: 特征矩阵 (n_samples, 8)
+            y: 标签向量 (n_samples,) - 0: 健康, 1: 帕金森
+            其他参数同 train_optimized_model
+        """
         X = np.array(X, dtype=np.float32)
         y = np.array(y, dtype=np.float32)
         
@@ -101,45 +119,17 @@ class OptimizedSpeechParkinsonClassifier:
         self.scaler_std = np.std(X, axis=0) + 1e-8
         X_normalized = (X - self.scaler_mean) / self.scaler_std
         
-        # 初始化参数
-        n_features = X.shape[1]
-        self.weights = np.random.normal(0, 0.1, n_features)
-        self.bias = 0.0
-        
-        # 训练循环
-        best_accuracy = 0
-        for epoch in range(epochs):
-            # 前向传播
-            z = np.dot(X_normalized, self.weights) + self.bias
-            predictions = 1 / (1 + np.exp(-np.clip(z, -500, 500)))  # 防止溢出
-            
-            # 计算损失
-            loss = -np.mean(y * np.log(predictions + 1e-8) + 
-                          (1 - y) * np.log(1 - predictions + 1e-8))
-            
-            # 反向传播
-            dz = predictions - y
-            dw = np.dot(X_normalized.T, dz) / len(y)
-            db = np.mean(dz)
-            
-            # 更新参数
-            self.weights -= learning_rate * dw
-            self.bias -= learning_rate * db
-            
-            # 计算准确率
-            if epoch % 50 == 0:
-                pred_labels = (predictions > 0.5).astype(int)
-                accuracy = np.mean(pred_labels == y)
-                
-                if accuracy > best_accuracy:
-                    best_accuracy = accuracy
-                
-                print(f"Epoch {epoch}: Loss={loss:.4f}, Accuracy={accuracy:.4f}, Best={best_accuracy:.4f}")
+        # 逻辑回归 (共用训练引擎)
+        engine = LinearModelEngine(loss='logistic', optimizer=optimizer, l2=l2,
+                                   learning_rate=learning_rate, max_epochs=epochs)
+        engine.fit(X_normalized, y)
         
+        self.weights = engine.weights
+        self.bias = engine.bias
         self.is_trained = True
         
         # 最终评估
-        final_predictions = (predictions > 0.5).astype(int)
+        final_predictions = engine.predict(X_normalized)
         final_accuracy = np.mean(final_predictions == y)
         print(f"[SUCCESS] 优化训练完成! 最终准确率: {final_accuracy:.4f}")
         
@@ -0,0 +1,373 @@
+"""
+模型剪枝
+以Keras回調和權重掩碼實現漸進式幅度剪枝和濾波器/單元級結構化剪枝，
+並在量化前按結構化剪枝的結果物理縮小各層，使TFLite文件和張量區真正變小
+"""
+
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras import layers
+
+# 結構化剪枝支持的層 (激活函數在0處須為0，剪掉的通道輸出恆為0)
+STRUCTURED_TYPES = (layers.Conv1D, layers.Dense, layers.LSTM)
+
+
+def polynomial_sparsity(step, initial_sparsity, final_sparsity, begin_step, end_step, power=3):
+    """
+    漸進剪枝的稀疏度計劃: 從 initial 以多項式衰減增長到 final
+    (開始時剪得快，接近目標時放慢，給網絡恢復的時間)
+    """
+    if step <= begin_step:
+        return initial_sparsity if step == begin_step else 0.0
+    if step >= end_step:
+        return final_sparsity
+    progress = (step - begin_step) / max(1, end_step - begin_step)
+    return final_sparsity + (initial_sparsity - final_sparsity) * (1 - progress) ** power
+
+
+def _inputs(layer):
+    """層的輸入張量列表"""
+    return layer.input if isinstance(layer.input, (list, tuple)) else [layer.input]
+
+
+def _producers(layer):
+    """產生該層輸入的層"""
+    return [tensor._keras_history.operation for tensor in _inputs(layer)]
+
+
+def _consumers(model):
+    """每個層的下游層 (按層名)"""
+    consumers = {layer.name: [] for layer in model.layers}
+    for layer in model.layers:
+        if isinstance(layer, layers.InputLayer):
+            continue
+        for producer in _producers(layer):
+            consumers[producer.name].append(layer)
+    return consumers
+
+
+def _kernels(layer):
+    """參與幅度剪枝的權重 (卷積核、全連接和循環權重，不含偏置和BN參數)"""
+    if isinstance(layer, (layers.LSTM, layers.GRU)):
+        return [layer.cell.kernel, layer.cell.recurrent_kernel]
+    if isinstance(layer, (layers.Conv1D, layers.Dense)):
+        return [layer.kernel]
+    return []
+
+
+def _lstm_columns(units, keep):
+    """LSTM 單元對應的四個門 (i, f, c, o) 的權重列"""
+    keep = np.asarray(keep)
+    return np.concatenate([gate * units + keep for gate in range(4)])
+
+
+def _output_layers(model):
+    """產生模型輸出的層 (不做結構化剪枝)"""
+    return {tensor._keras_history.operation.name for tensor in model.outputs}
+
+
+def sparsity_summary(model):
+    """
+    統計各層可剪枝權重的零值比例
+
+    Returns:
+        dict: 層名 -> {'params', 'zeros', 'sparsity'}，以及 'total'
+    """
+    summary = {}
+    total_params = total_zeros = 0
+    for layer in model.layers:
+        kernels = _kernels(layer)
+        if not kernels:
+            continue
+        params = sum(int(np.prod(k.shape)) for k in kernels)
+        zeros = sum(int(np.sum(np.asarray(k.numpy()) == 0)) for k in kernels)
+        summary[layer.name] = {'params': params, 'zeros': zeros, 'sparsity': zeros / params}
+        total_params += params
+        total_zeros += zeros
+    summary['total'] = {'params': total_params, 'zeros': total_zeros,
+                        'sparsity': total_zeros / max(1, total_params)}
+    return summary
+
+
+class MagnitudePruningCallback(keras.callbacks.Callback):
+    """
+    漸進式幅度剪枝
+
+    每 frequency 步按 polynomial_sparsity 計劃把每層絕對值最小的權重掩為0，
+    每個訓練步結束後重新應用掩碼，防止優化器 (如Adam的動量) 把剪掉的權重恢復。
+    被剪掉的權重不會再恢復 (掩碼只增不減)。
+    """
+
+    def __init__(self, target_sparsity=0.5, begin_step=0, end_step=1000, frequency=100,
+                 initial_sparsity=0.0, layer_names=None):
+        """
+        Args:
+            target_sparsity: 最終稀疏度 (每層零值比例)
+            begin_step: 開始剪枝的訓練步
+            end_step: 達到最終稀疏度的訓練步
+            frequency: 更新掩碼的步數間隔
+            initial_sparsity: begin_step 時的稀疏度
+            layer_names: 只剪枝這些層 (None 表示全部 Conv1D/Dense/LSTM/GRU)
+        """
+        super().__init__()
+        self.target_sparsity = target_sparsity
+        self.begin_step = begin_step
+        self.end_step = end_step
+        self.frequency = frequency
+        self.initial_sparsity = initial_sparsity
+        self.layer_names = layer_names
+        self.step = 0
+        self.masks = {}
+
+    def on_train_begin(self, logs=None):
+        for layer in self.model.layers:
+            if self.layer_names is not None and layer.name not in self.layer_names:
+                continue
+            for kernel in _kernels(layer):
+                if id(kernel) not in self.masks:
+                    self.masks[id(kernel)] = (kernel, np.ones(kernel.shape, dtype=np.float32))
+        self._apply()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.begin_step <= self.step <= self.end_step and (
+                (self.step - self.begin_step) % self.frequency == 0 or self.step == self.end_step):
+            self._update_masks(polynomial_sparsity(self.step, self.initial_sparsity, self.target_sparsity,
+                                                   self.begin_step, self.end_step))
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._apply()
+        self.step += 1
+
+    def _update_masks(self, sparsity):
+        """按當前稀疏度剪掉每個權重張量中絕對值最小的元素"""
+        for key, (kernel, mask) in self.masks.items():
+            num_pruned = int(sparsity * mask.size)
+            if num_pruned <= 0:
+                continue
+            # 已剪掉的權重視為0，排在最前面
+            magnitude = (np.abs(kernel.numpy()) * mask).ravel()
+            pruned = np.argpartition(magnitude, num_pruned - 1)[:num_pruned]
+            new_mask = mask.ravel().copy()
+            new_mask[pruned] = 0.0
+            self.masks[key] = (kernel, new_mask.reshape(mask.shape))
+
+    def _apply(self):
+        """把掩碼應用到權重"""
+        for kernel, mask in self.masks.values():
+            kernel.assign(kernel * mask)
+
+
+class StructuredPruningCallback(keras.callbacks.Callback):
+    """
+    濾波器/單元級結構化剪枝
+
+    Conv1D 的濾波器、Dense 和 LSTM 的單元按重要性 (卷積核/門權重的L2範數，
+    後接BatchNormalization時乘以|gamma|) 逐步剪掉。剪掉的通道其核、偏置和後接BN的
+    gamma/beta 均掩為0，LSTM 單元的四個門的輸入和循環權重及偏置均掩為0，
+    因此該通道的輸出恆為0，strip_pruned 物理移除後模型輸出不變。
+    模型的輸出層和單元數為1的層不參與剪枝。
+    """
+
+    def __init__(self, target_fraction=0.5, begin_step=0, end_step=1000, frequency=100,
+                 min_channels=4, layer_names=None):
+        """
+        Args:
+            target_fraction: 每層最終剪掉的通道比例
+            begin_step: 開始剪枝的訓練步
+            end_step: 達到最終比例的訓練步
+            frequency: 更新掩碼的步數間隔
+            min_channels: 每層至少保留的通道數
+            layer_names: 只剪枝這些層 (None 表示全部支持的層)
+        """
+        super().__init__()
+        self.target_fraction = target_fraction
+        self.begin_step = begin_step
+        self.end_step = end_step
+        self.frequency = frequency
+        self.min_channels = min_channels
+        self.layer_names = layer_names
+        self.step = 0
+        self.targets = {}       # 層名 -> (層, 後接的BN層)
+        self.alive = {}         # 層名 -> 保留通道的布爾數組
+
+    @property
+    def keep(self):
+        """每個剪枝層保留的通道索引 (傳給 strip_pruned)"""
+        return {name: np.flatnonzero(alive) for name, alive in self.alive.items()}
+
+    def on_train_begin(self, logs=None):
+        if self.targets:
+            self._apply()
+            return
+
+        consumers = _consumers(self.model)
+        outputs = _output_layers(self.model)
+        for layer in self.model.layers:
+            if not isinstance(layer, STRUCTURED_TYPES) or layer.name in outputs:
+                continue
+            if self.layer_names is not None and layer.name not in self.layer_names:
+                continue
+            channels = self._channels(layer)
+            if channels <= max(1, self.min_channels):
+                continue
+            norms = [c for c in consumers[layer.name] if isinstance(c, layers.BatchNormalization)]
+            self.targets[layer.name] = (layer, norms)
+            self.alive[layer.name] = np.ones(channels, dtype=bool)
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.begin_step <= self.step <= self.end_step and (
+                (self.step - self.begin_step) % self.frequency == 0 or self.step == self.end_step):
+            self._update_masks(polynomial_sparsity(self.step, 0.0, self.target_fraction,
+                                                   self.begin_step, self.end_step))
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._apply()
+        self.step += 1
+
+    @staticmethod
+    def _channels(layer):
+        return layer.units if isinstance(layer, (layers.Dense, layers.LSTM)) else layer.filters
+
+    def _importance(self, layer, norms):
+        """每個通道的重要性"""
+        if isinstance(layer, layers.LSTM):
+            units = layer.units
+            weights = np.concatenate([layer.cell.kernel.numpy(), layer.cell.recurrent_kernel.numpy()])
+            gates = weights.reshape(weights.shape[0], 4, units)
+            return np.sqrt(np.sum(gates ** 2, axis=(0, 1)))
+
+        kernel = layer.kernel.numpy()
+        importance = np.sqrt(np.sum(kernel.reshape(-1, kernel.shape[-1]) ** 2, axis=0))
+        for norm in norms:
+            if norm.gamma is not None:
+                importance = importance * np.abs(norm.gamma.numpy())
+        return importance
+
+    def _update_masks(self, fraction):
+        """每層剪到目標比例: 在仍保留的通道中剪掉重要性最低的"""
+        for name, (layer, norms) in self.targets.items():
+            alive = self.alive[name]
+            target_alive = max(self.min_channels, int(round(len(alive) * (1 - fraction))))
+            excess = int(alive.sum()) - target_alive
+            if excess <= 0:
+                continue
+            importance = np.where(alive, self._importance(layer, norms), np.inf)
+            alive[np.argsort(importance, kind='stable')[:excess]] = False
+
+    def _apply(self):
+        """把通道掩碼應用到權重"""
+        for name, (layer, norms) in self.targets.items():
+            alive = self.alive[name]
+            if alive.all():
+                continue
+            mask = alive.astype(np.float32)
+
+            if isinstance(layer, layers.LSTM):
+                gate_mask = np.tile(mask, 4)
+                cell = layer.cell
+                cell.kernel.assign(cell.kernel * gate_mask)
+                cell.recurrent_kernel.assign(cell.recurrent_kernel * gate_mask)
+                if cell.use_bias:
+                    cell.bias.assign(cell.bias * gate_mask)
+            else:
+                layer.kernel.assign(layer.kernel * mask)
+                if layer.use_bias:
+                    layer.bias.assign(layer.bias * mask)
+
+            for norm in norms:
+                if norm.gamma is not None:
+                    norm.gamma.assign(norm.gamma * mask)
+                if norm.beta is not None:
+                    norm.beta.assign(norm.beta * mask)
+
+
+def _slice_weights(layer, weights, in_keep, out_keep):
+    """按輸入通道和輸出通道的保留索引切片一個層的權重"""
+    all_in = slice(None) if in_keep is None else in_keep
+
+    if isinstance(layer, layers.Conv1D):
+        out = slice(None) if out_keep is None else out_keep
+        sliced = [weights[0][:, all_in][:, :, out]]
+        return sliced + [w[out] for w in weights[1:]]
+
+    if isinstance(layer, layers.Dense):
+        out = slice(None) if out_keep is None else out_keep
+        sliced = [weights[0][all_in][:, out]]
+        return sliced + [w[out] for w in weights[1:]]
+
+    if isinstance(layer, layers.LSTM):
+        units = layer.units
+        rows = slice(None) if out_keep is None else out_keep
+        cols = slice(None) if out_keep is None else _lstm_columns(units, out_keep)
+        sliced = [weights[0][all_in][:, cols], weights[1][rows][:, cols]]
+        return sliced + [w[cols] for w in weights[2:]]
+
+    if isinstance(layer, layers.GRU):
+        # GRU 只切片輸入核的行 (單元不做結構化剪枝)
+        return [weights[0][all_in]] + weights[1:]
+
+    if isinstance(layer, layers.BatchNormalization):
+        return [w[all_in] for w in weights]
+
+    if weights and in_keep is not None:
+        raise ValueError(f"不支持剪枝 {layer.__class__.__name__} 層的輸入: {layer.name}")
+    return weights
+
+
+def strip_pruned(model, keep):
+    """
+    按結構化剪枝的保留通道物理縮小模型
+
+    以修改後的配置 (filters/units) 重建模型，並把保留通道的權重複製過去，
+    下游層的輸入維度 (卷積核、全連接核、LSTM輸入核和BN參數) 相應切片。
+
+    Args:
+        model: 經過 StructuredPruningCallback 訓練的模型
+        keep: 層名 -> 保留的通道索引 (StructuredPruningCallback.keep)
+
+    Returns:
+        縮小後的新模型 (未編譯)
+    """
+    keep = {name: np.asarray(index) for name, index in keep.items()
+            if len(index) < StructuredPruningCallback._channels(model.get_layer(name))}
+
+    config = model.get_config()
+    for layer_config in config['layers']:
+        # 輸入形狀隨上游層改變，讓各層在重建時按新的輸入重新構建
+        layer_config.pop('build_config', None)
+        name = layer_config['config']['name']
+        if name in keep:
+            key = 'filters' if 'filters' in layer_config['config'] else 'units'
+            layer_config['config'][key] = int(len(keep[name]))
+    pruned = keras.Model.from_config(config)
+
+    # 每個層輸出的保留通道 (None 表示全部)
+    output_keep = {}
+    for layer in model.layers:
+        if isinstance(layer, layers.InputLayer):
+            output_keep[layer.name] = None
+            continue
+
+        producers = _producers(layer)
+        kept = [(producer, output_keep[producer.name]) for producer in producers
+                if output_keep[producer.name] is not None]
+        in_keep = kept[0][1] if kept else None
+        if isinstance(layer, STRUCTURED_TYPES):
+            output_keep[layer.name] = keep.get(layer.name)
+        elif isinstance(layer, layers.RNN):
+            # 未剪枝的循環層 (GRU 等) 輸出全部單元
+            output_keep[layer.name] = None
+        elif in_keep is None:
+            output_keep[layer.name] = None
+        else:
+            # 逐元素、池化、Dropout 和 BN 等層保持通道不變；改變通道數的層無法沿用保留索引
+            if kept[0][0].output.shape[-1] != layer.output.shape[-1]:
+                raise ValueError(f"無法確定剪枝後 {layer.name} ({layer.__class__.__name__}) 的輸出通道")
+            output_keep[layer.name] = in_keep
+
+        weights = layer.get_weights()
+        if weights:
+            pruned.get_layer(layer.name).set_weights(
+                _slice_weights(layer, weights, in_keep, output_keep[layer.name]))
+
+    return pruned
@@ -0,0 +1,131 @@
+"""
+增量訓練的複習緩衝區
+按等級分別以水庫抽樣保留歷史窗口，微調時與新數據混合重放，避免模型遺忘舊分佈
+"""
+
+import os
+import numpy as np
+
+
+class RehearsalBuffer:
+    """
+    按等級分桶的水庫抽樣緩衝區
+
+    每個等級保留至多 capacity // num_classes 個原始 (未標準化) 窗口，
+    每個窗口被保留的概率與它是第幾個被看到的無關，因此緩衝區始終是
+    已見過數據的均勻樣本，且各等級數量均衡。
+    """
+
+    def __init__(self, capacity=5000, num_classes=5, seed=42):
+        """
+        初始化緩衝區
+
+        Args:
+            capacity: 總容量 (窗口數)
+            num_classes: 等級數量
+            seed: 隨機種子
+        """
+        self.capacity = capacity
+        self.num_classes = num_classes
+        self.per_class = max(1, capacity // num_classes)
+        self.rng = np.random.default_rng(seed)
+        self.windows = None                                   # (num_classes, per_class, T, C)
+        self.filled = np.zeros(num_classes, dtype=np.int64)   # 每個等級已保存的窗口數
+        self.seen = np.zeros(num_classes, dtype=np.int64)     # 每個等級已看到的窗口數
+
+    def __len__(self):
+        return int(self.filled.sum())
+
+    def add(self, X, y):
+        """
+        以水庫抽樣加入一批窗口
+
+        Args:
+            X: 原始窗口 (N, T, C)
+            y: 標籤 (0 到 num_classes-1)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.int64)
+        if self.windows is None:
+            self.windows = np.zeros((self.num_classes, self.per_class) + X.shape[1:], dtype=np.float32)
+
+        for level in range(self.num_classes):
+            items = np.flatnonzero(y == level)
+            if len(items) == 0:
+                continue
+
+            # 第k個新窗口在該等級數據流中的位置
+            positions = self.seen[level] + np.arange(len(items))
+            # 水庫未滿時直接寫入，否則以 per_class / (位置+1) 的概率替換隨機槽位
+            slots = np.where(positions < self.per_class, positions,
+                             self.rng.integers(0, positions + 1))
+            accepted = slots < self.per_class
+
+            # 同一槽位被多次選中時以最後一次為準 (與逐個處理的順序語義一致)
+            slots, items = slots[accepted][::-1], items[accepted][::-1]
+            slots, first = np.unique(slots, return_index=True)
+            self.windows[level, slots] = X[items[first]]
+
+            self.seen[level] += len(positions)
+            self.filled[level] = min(self.per_class, self.seen[level])
+
+    def data(self):
+        """返回緩衝區中的全部窗口和標籤"""
+        if self.windows is None:
+            return np.zeros((0,), dtype=np.float32), np.zeros(0, dtype=np.int64)
+        X = np.concatenate([self.windows[level, :self.filled[level]] for level in range(self.num_classes)])
+        y = np.repeat(np.arange(self.num_classes, dtype=np.int64), self.filled)
+        return X, y
+
+    def sample(self, num_samples):
+        """
+        不放回地抽取重放窗口 (數量不超過緩衝區大小)
+
+        Returns:
+            (X, y)
+        """
+        X, y = self.data()
+        if len(y) == 0:
+            return X, y
+        index = self.rng.choice(len(y), size=min(num_samples, len(y)), replace=False)
+        return X[index], y[index]
+
+    def get_state(self):
+        """返回可序列化的緩衝區狀態 (窗口、標籤、已見數量和容量)"""
+        X, y = self.data()
+        return {'X': X, 'y': y, 'seen': self.seen.copy(), 'capacity': self.capacity}
+
+    @classmethod
+    def from_state(cls, state, seed=42):
+        """
+        從 get_state 的狀態恢復緩衝區
+
+        Args:
+            state: get_state 返回的字典 (數組可以是列表)
+            seed: 之後抽樣使用的隨機種子
+        """
+        seen = np.asarray(state['seen'], dtype=np.int64)
+        buffer = cls(capacity=int(state['capacity']), num_classes=len(seen), seed=seed)
+        y = np.asarray(state['y'], dtype=np.int64)
+        if len(y):
+            buffer.add(np.asarray(state['X'], dtype=np.float32), y)
+        # 恢復真實的已見數量，使之後的替換概率保持正確
+        buffer.seen = seen
+        return buffer
+
+    def save(self, path):
+        """保存緩衝區"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, **self.get_state())
+
+    @classmethod
+    def load(cls, path, seed=42):
+        """
+        加載緩衝區
+
+        Args:
+            path: save 保存的 .npz 文件
+            seed: 之後抽樣使用的隨機種子
+        """
+        with np.load(path) as f:
+            return cls.from_state({key: f[key] for key in f.files}, seed=seed)
@@ -0,0 +1,238 @@
+"""
+會話數據存儲
+將會話JSON轉換為內存映射的特徵文件和會話目錄，支援超出內存的語料訓練；
+入庫時記錄每個會話和樣本的質量檢查結果，訓練和量化校準可按質量篩選
+"""
+
+import json
+import os
+import numpy as np
+
+try:
+    from .data_pipeline import load_session_file, build_window_index, window_positions
+    from .data_quality import DataQualityChecker
+except ImportError:
+    from data_pipeline import load_session_file, build_window_index, window_positions
+    from data_quality import DataQualityChecker
+
+FEATURES_FILE = "features.f32"
+FLAGS_FILE = "sample_flags.u8"
+CATALOG_FILE = "catalog.json"
+
+
+class SessionStore:
+    """
+    內存映射的會話存儲
+
+    所有會話的特徵按順序拼接在一個float32二進制文件中，每個樣本的質量位掩碼
+    保存在平行的uint8文件中，catalog.json 記錄每個會話的患者、等級、起始行、
+    長度和質量摘要。
+    """
+
+    def __init__(self, store_dir="data/store", feature_dim=9):
+        """
+        初始化會話存儲
+
+        Args:
+            store_dir: 存儲目錄
+            feature_dim: 特徵維度
+        """
+        self.store_dir = store_dir
+        self.feature_dim = feature_dim
+        self.catalog = None
+        self.features = None
+        self.sample_flags = None
+
+    @property
+    def features_path(self):
+        return os.path.join(self.store_dir, FEATURES_FILE)
+
+    @property
+    def flags_path(self):
+        return os.path.join(self.store_dir, FLAGS_FILE)
+
+    @property
+    def catalog_path(self):
+        return os.path.join(self.store_dir, CATALOG_FILE)
+
+    def exists(self):
+        """存儲是否已建立"""
+        return os.path.exists(self.features_path) and os.path.exists(self.catalog_path)
+
+    def build_from_json(self, data_dir="data", quality_checker=None):
+        """
+        從會話JSON目錄建立存儲 (逐個會話寫入，不在內存中保留整個語料)
+
+        Args:
+            data_dir: 會話JSON目錄
+            quality_checker: DataQualityChecker，None使用默認閾值
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        checker = quality_checker or DataQualityChecker()
+
+        sessions_meta = []
+        offset = 0
+
+        with open(self.features_path, 'wb') as f, open(self.flags_path, 'wb') as flags_file:
+            for filename in sorted(os.listdir(data_dir)):
+                if not filename.endswith('.json'):
+                    continue
+
+                # 一次只解析一個會話
+                try:
+                    session = load_session_file(os.path.join(data_dir, filename))
+                except Exception as e:
+                    print(f"讀取文件 {filename} 失敗: {e}")
+                    continue
+
+                if session is None:
+                    continue
+
+                features = np.ascontiguousarray(session['features'], dtype=np.float32)
+                features.tofile(f)
+
+                # 入庫質量檢查
+                flags, quality = checker.check_session(features, session['timestamps'])
+                flags.tofile(flags_file)
+
+                sessions_meta.append({
+                    'session_id': session['session_id'],
+                    'patient_id': session['patient_id'],
+                    'parkinson_level': session['parkinson_level'],
+                    'offset': offset,
+                    'length': len(features),
+                    'quality': quality
+                })
+                offset += len(features)
+
+        # 跨會話的單位漂移檢查
+        checker.check_unit_drift([s['quality'] for s in sessions_meta])
+
+        self.catalog = {
+            'feature_dim': self.feature_dim,
+            'num_samples': offset,
+            'sessions': sessions_meta
+        }
+        self.save_catalog()
+
+        num_bad = sum(not s['quality']['quality_ok'] for s in sessions_meta)
+        print(f"會話存儲已建立: {self.store_dir} ({len(sessions_meta)} 個會話, {offset} 個樣本, "
+              f"{num_bad} 個會話未通過質量檢查)")
+        return self.open()
+
+    def save_catalog(self):
+        """保存會話目錄"""
+        with open(self.catalog_path, 'w', encoding='utf-8') as f:
+            json.dump(self.catalog, f, indent=2, ensure_ascii=False)
+
+    def open(self):
+        """以只讀內存映射方式打開存儲"""
+        with open(self.catalog_path, 'r', encoding='utf-8') as f:
+            self.catalog = json.load(f)
+
+        self.feature_dim = self.catalog['feature_dim']
+        num_samples = self.catalog['num_samples']
+
+        if num_samples > 0:
+            self.features = np.memmap(self.features_path, dtype=np.float32, mode='r',
+                                      shape=(num_samples, self.feature_dim))
+        else:
+            self.features = np.zeros((0, self.feature_dim), dtype=np.float32)
+
+        if num_samples > 0 and os.path.exists(self.flags_path):
+            self.sample_flags = np.memmap(self.flags_path, dtype=np.uint8, mode='r',
+                                          shape=(num_samples,))
+        else:
+            self.sample_flags = None
+
+        return self
+
+    def labeled_sessions(self, quality_ok_only=False):
+        """
+        返回帶標籤的會話目錄項
+
+        Args:
+            quality_ok_only: 只返回通過質量檢查的會話
+        """
+        sessions = [s for s in self.catalog['sessions'] if s['parkinson_level'] is not None]
+        if quality_ok_only:
+            sessions = [s for s in sessions if s.get('quality', {}).get('quality_ok', True)]
+        return sessions
+
+    def session_features(self, session):
+        """讀取單個會話的特徵 (內存映射視圖)"""
+        return self.features[session['offset']:session['offset'] + session['length']]
+
+    def fit_scaler(self, scaler, chunk_size=65536, quality_ok_only=False):
+        """
+        單次串流擬合標準化器 (StandardScaler.partial_fit)
+
+        Args:
+            scaler: sklearn StandardScaler
+            chunk_size: 每次讀入的樣本數
+            quality_ok_only: 只使用通過質量檢查的會話
+        """
+        for session in self.labeled_sessions(quality_ok_only):
+            features = self.session_features(session)
+            for start in range(0, len(features), chunk_size):
+                scaler.partial_fit(np.asarray(features[start:start + chunk_size]))
+
+        return scaler
+
+    def window_index(self, sequence_length, hop=1, quality_ok_only=False,
+                     max_bad_fraction=None, exclude_flags=0):
+        """
+        建立窗口索引 (起始行直接指向內存映射文件)
+
+        Args:
+            sequence_length: 窗口長度
+            hop: 窗口步長
+            quality_ok_only: 只使用通過質量檢查的會話
+            max_bad_fraction: 窗口內異常樣本比例上限 (None表示不篩選)
+            exclude_flags: 排除含有這些質量標記的窗口 (位掩碼)
+
+        Returns:
+            dict: starts, labels (0-4), window_session (labeled_sessions 中的序號), patient_ids，
+            local_index, session_windows，有樣本標記時另含 bad_fraction 和 window_flags
+        """
+        sessions = self.labeled_sessions(quality_ok_only)
+        if not sessions:
+            raise ValueError("存儲中沒有帶標籤的會話數據")
+
+        lengths = [s['length'] for s in sessions]
+        starts, window_session = build_window_index(lengths, sequence_length, hop)
+
+        # build_window_index 假設會話緊密相連，這裡換算為存儲中的實際偏移
+        local_offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        store_offsets = np.array([s['offset'] for s in sessions], dtype=np.int64)
+        starts = starts - local_offsets[window_session] + store_offsets[window_session]
+
+        session_labels = np.array([int(s['parkinson_level']) - 1 for s in sessions], dtype=np.int64)
+        patient_ids = np.array([str(s['patient_id']) for s in sessions])
+        local_index, session_windows = window_positions(window_session)
+
+        windows = {
+            'starts': starts,
+            'labels': session_labels[window_session],
+            'window_session': window_session,
+            'patient_ids': patient_ids[window_session],
+            'local_index': local_index,
+            'session_windows': session_windows
+        }
+
+        if self.sample_flags is not None:
+            bad_fraction, window_flags = DataQualityChecker.window_scores(
+                self.sample_flags, starts, sequence_length
+            )
+            windows['bad_fraction'] = bad_fraction
+            windows['window_flags'] = window_flags
+
+            keep = np.ones(len(starts), dtype=bool)
+            if max_bad_fraction is not None:
+                keep &= bad_fraction <= max_bad_fraction
+            if exclude_flags:
+                keep &= (window_flags & exclude_flags) == 0
+            if not keep.all():
+                windows = {key: value[keep] for key, value in windows.items()}
+
+        return windows
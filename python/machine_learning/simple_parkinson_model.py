@@ -8,107 +8,103 @@ import json
 import os
 from datetime import datetime
 
+try:
+    from .synthetic_data import SyntheticSensorGenerator
+    from .linear_engine import LinearModelEngine
+    from .rehearsal_buffer import RehearsalBuffer
+except ImportError:
+    from synthetic_data import SyntheticSensorGenerator
+    from linear_engine import LinearModelEngine
+    from rehearsal_buffer import RehearsalBuffer
+
 class SimpleParkinsonModel:
     """簡化的帕金森症分析模型（不依賴TensorFlow）"""
     
-    def __init__(self):
+    def __init__(self, replay_capacity=500, seed=42):
+        """
+        Args:
+            replay_capacity: partial_fit 複習緩衝區的容量 (特徵向量數)
+            seed: 複習緩衝區的隨機種子
+        """
         self.weights = None
         self.bias = None
         self.scaler_mean = None
         self.scaler_std = None
         self.is_trained = False
         
-    def create_synthetic_data(self, num_samples=1000):
-        """創建合成的帕金森症訓練數據"""
+        # 增量學習狀態: 特徵的運行計數/均值/平方差和 (Chan合併公式) 和複習緩衝區
+        self.feature_count = 0
+        self.feature_mean = None
+        self.feature_m2 = None
+        self.replay_buffer = RehearsalBuffer(capacity=replay_capacity, num_classes=5, seed=seed)
+        self.update_count = 0
+        
+    def create_synthetic_data(self, num_samples=1000, seed=None):
+        """
+        創建合成的帕金森症訓練數據 (向量化生成)
+        
+        Args:
+            num_samples: 樣本數量
+            seed: 隨機種子，None表示不固定
+        """
         print("[INFO] 生成合成帕金森症數據...")
         
-        X = []
-        y = []
-        
-        for level in range(5):  # 5個等級 (0-4)
-            for _ in range(num_samples // 5):
-                # 生成50個時間點，9維特徵的序列
-                sequence = []
-                
-                for t in range(50):
-                    # 基礎特徵值隨帕金森等級變化
-                    base_tremor = level * 0.2 + 0.1
-                    base_stiffness = level * 0.15 + 0.05
-                    base_coordination = (4 - level) * 0.2 + 0.1
-                    
-                    # 手指數據 (5維)
-                    fingers = []
-                    for f in range(5):
-                        finger_value = (
-                            base_stiffness + 
-                            np.random.normal(0, 0.1) +
-                            base_tremor * np.sin(t * 0.5 + f)  # 震顫模擬
-                        )
-                        fingers.append(max(0, min(1, finger_value)))
-                    
-                    # EMG數據 (1維)
-                    emg = base_stiffness + np.random.normal(0, 0.05)
-                    emg = max(0, min(1, emg))
-                    
-                    # IMU數據 (3維) - 協調性和震顫
-                    imu = []
-                    for axis in range(3):
-                        imu_value = (
-                            base_coordination +
-                            base_tremor * np.cos(t * 0.3 + axis) +
-                            np.random.normal(0, 0.08)
-                        )
-                        imu.append(max(-1, min(1, imu_value)))
-                    
-                    # 合併為9維特徵向量
-                    feature_vector = fingers + [emg] + imu
-                    sequence.append(feature_vector)
-                
-                X.append(sequence)
-                y.append(level)
-        
-        X = np.array(X, dtype=np.float32)
-        y = np.array(y, dtype=np.int32)
+        generator = SyntheticSensorGenerator(profile='sensor', seed=seed)
+        X, y = generator.generate(num_samples)
         
         print(f"[SUCCESS] 生成數據完成: {X.shape}")
         return X, y
     
     def extract_features(self, sequences):
-        """從序列中提取統計特徵"""
-        features = []
+        """
+        從序列中提取統計特徵 (整批向量化計算)
         
-        for seq in sequences:
-            seq = np.array(seq)
-            
-            # 統計特徵
-            feat = []
-            feat.extend(np.mean(seq, axis=0))      # 均值 (9維)
-            feat.extend(np.std(seq, axis=0))       # 標準差 (9維)
-            feat.extend(np.max(seq, axis=0))       # 最大值 (9維)
-            feat.extend(np.min(seq, axis=0))       # 最小值 (9維)
-            
-            # 時間域特徵
-            for i in range(9):
-                channel_data = seq[:, i]
-                # 零交叉率
-                zero_crossings = np.sum(np.diff(np.sign(channel_data)) != 0)
-                feat.append(zero_crossings / len(channel_data))
-                
-                # 變化率
-                if len(channel_data) > 1:
-                    change_rate = np.mean(np.abs(np.diff(channel_data)))
-                    feat.append(change_rate)
-                else:
-                    feat.append(0)
-            
-            features.append(feat)
+        每個序列54維: 均值、標準差、最大值、最小值 (各9維)，
+        以及每個通道交替排列的零交叉率和變化率 (18維)
+        """
+        X = np.asarray(sequences)
+        if X.ndim == 2:
+            X = X[None]
+        T = X.shape[1]
+        
+        # 統計特徵
+        stats = [X.mean(axis=1), X.std(axis=1), X.max(axis=1), X.min(axis=1)]
         
-        return np.array(features, dtype=np.float32)
+        # 時間域特徵: 零交叉率和變化率
+        zero_crossings = np.sum(np.diff(np.sign(X), axis=1) != 0, axis=1) / T
+        if T > 1:
+            change_rate = np.mean(np.abs(np.diff(X, axis=1)), axis=1)
+        else:
+            change_rate = np.zeros_like(zero_crossings)
+        temporal = np.stack([zero_crossings, change_rate], axis=2).reshape(len(X), -1)
+        
+        return np.concatenate(stats + [temporal], axis=1).astype(np.float32)
     
-    def train(self, X, y):
-        """訓練簡化模型"""
+    def train(self, X, y, augmenter=None, augment_copies=1, optimizer='lbfgs', l2=1e-4,
+              learning_rate=0.01, max_epochs=200):
+        """
+        訓練簡化模型
+        
+        Args:
+            X: 序列數據 (N, 50, 9)
+            y: 標籤 (0-4)
+            augmenter: 可選的 TimeSeriesAugmenter，訓練前對序列批次增強
+            augment_copies: 每個樣本附加的增強副本數
+            optimizer: 'lbfgs'、'adam' 或 'gd' (見 LinearModelEngine)
+            l2: L2正則化係數
+            learning_rate: adam/gd 的學習率
+            max_epochs: 最大訓練輪數
+        """
         print("[INFO] 訓練簡化帕金森症模型...")
         
+        if augmenter is not None and augment_copies > 0:
+            X = np.asarray(X, dtype=np.float32)
+            y = np.asarray(y)
+            augmented = [augmenter.augment_numpy(X) for _ in range(augment_copies)]
+            X = np.concatenate([X] + augmented, axis=0)
+            y = np.concatenate([y] * (augment_copies + 1), axis=0)
+            print(f"數據增強後樣本數: {len(X)}")
+        
         # 提取特徵
         features = self.extract_features(X)
         print(f"特徵維度: {features.shape}")
@@ -117,58 +113,109 @@ class SimpleParkinsonModel:
         self.scaler_mean = np.mean(features, axis=0)
         self.scaler_std = np.std(features, axis=0) + 1e-8
         
-        features_normalized = (features - self.scaler_mean) / self.scaler_std
-        
-        # 簡單的線性分類器（多分類）
-        num_features = features.shape[1]
-        num_classes = 5
+        # 以全部訓練數據初始化增量狀態，之後可以直接 partial_fit
+        self.feature_count = len(features)
+        self.feature_mean = self.scaler_mean.astype(np.float64)
+        self.feature_m2 = np.var(features, axis=0).astype(np.float64) * len(features)
+        self.replay_buffer.add(features, y)
         
-        # 初始化權重
-        self.weights = np.random.normal(0, 0.1, (num_features, num_classes))
-        self.bias = np.zeros(num_classes)
+        features_normalized = (features - self.scaler_mean) / self.scaler_std
         
-        # 簡單梯度下降訓練
-        learning_rate = 0.01
-        epochs = 100
-        
-        for epoch in range(epochs):
-            # 前向傳播
-            logits = np.dot(features_normalized, self.weights) + self.bias
-            
-            # Softmax
-            exp_logits = np.exp(logits - np.max(logits, axis=1, keepdims=True))
-            probabilities = exp_logits / np.sum(exp_logits, axis=1, keepdims=True)
-            
-            # 計算損失
-            loss = -np.mean(np.log(probabilities[np.arange(len(y)), y] + 1e-8))
-            
-            # 反向傳播
-            y_one_hot = np.eye(num_classes)[y]
-            d_logits = (probabilities - y_one_hot) / len(y)
-            
-            d_weights = np.dot(features_normalized.T, d_logits)
-            d_bias = np.mean(d_logits, axis=0)
-            
-            # 更新參數
-            self.weights -= learning_rate * d_weights
-            self.bias -= learning_rate * d_bias
-            
-            if epoch % 20 == 0:
-                # 計算準確率
-                predictions = np.argmax(probabilities, axis=1)
-                accuracy = np.mean(predictions == y)
-                print(f"Epoch {epoch}: Loss={loss:.4f}, Accuracy={accuracy:.4f}")
+        # Softmax線性分類器 (共用訓練引擎)
+        engine = LinearModelEngine(loss='softmax', optimizer=optimizer, l2=l2,
+                                   learning_rate=learning_rate, max_epochs=max_epochs)
+        engine.fit(features_normalized, y, num_classes=5)
         
+        self.weights = engine.weights
+        self.bias = engine.bias
         self.is_trained = True
         print("[SUCCESS] 模型訓練完成!")
         
         # 最終評估
-        final_predictions = np.argmax(probabilities, axis=1)
+        final_predictions = engine.predict(features_normalized)
         final_accuracy = np.mean(final_predictions == y)
         print(f"最終訓練準確率: {final_accuracy:.4f}")
         
         return final_accuracy
     
+    def _update_feature_stats(self, features):
+        """
+        合併一批特徵的均值和方差，並調整權重使已有的決策函數不變
+        
+        z = (x-μ)/σ·W + b = (x-μ')/σ'·W' + b'，其中 W' = (σ'/σ)W，b' = b + ((μ'-μ)/σ)·W
+        """
+        features = features.astype(np.float64)
+        n_new = len(features)
+        batch_mean = features.mean(axis=0)
+        batch_m2 = ((features - batch_mean) ** 2).sum(axis=0)
+        
+        if self.feature_count == 0:
+            self.feature_count, self.feature_mean, self.feature_m2 = n_new, batch_mean, batch_m2
+        else:
+            total = self.feature_count + n_new
+            delta = batch_mean - self.feature_mean
+            self.feature_mean = self.feature_mean + delta * n_new / total
+            self.feature_m2 = self.feature_m2 + batch_m2 + delta ** 2 * self.feature_count * n_new / total
+            self.feature_count = total
+        
+        new_mean = self.feature_mean
+        new_std = np.sqrt(self.feature_m2 / self.feature_count) + 1e-8
+        if self.weights is not None:
+            self.bias = self.bias + ((new_mean - self.scaler_mean) / self.scaler_std) @ self.weights
+            self.weights = self.weights * (new_std / self.scaler_std)[:, None]
+        self.scaler_mean, self.scaler_std = new_mean, new_std
+    
+    def partial_fit(self, sequences, labels, learning_rate=0.05, steps=5, replay_size=None, l2=1e-4):
+        """
+        增量更新 (用於網關上的個人化，每次更新只處理新序列和少量重放樣本)
+        
+        先以新數據更新特徵的運行均值/方差 (同時變換權重使舊的決策函數不變)，
+        再在新樣本和複習緩衝區的重放樣本上做若干步softmax SGD，最後把新樣本
+        以水庫抽樣加入緩衝區。
+        
+        Args:
+            sequences: 新序列 (N, 50, 9)
+            labels: 標籤 (0-4)
+            learning_rate: SGD學習率
+            steps: 每次調用的梯度步數
+            replay_size: 重放樣本數 (None表示與新樣本數相同)
+            l2: L2正則化係數
+        
+        Returns:
+            本次更新後在新樣本上的準確率
+        """
+        features = self.extract_features(sequences)
+        labels = np.asarray(labels, dtype=np.int64)
+        
+        self._update_feature_stats(features)
+        if self.weights is None:
+            self.weights = np.zeros((features.shape[1], 5))
+            self.bias = np.zeros(5)
+        
+        X_replay, y_replay = self.replay_buffer.sample(len(labels) if replay_size is None else replay_size)
+        if len(y_replay):
+            X_batch = np.concatenate([features, X_replay])
+            y_batch = np.concatenate([labels, y_replay])
+        else:
+            X_batch, y_batch = features, labels
+        
+        X_batch = (X_batch - self.scaler_mean) / self.scaler_std
+        Y = np.eye(5)[y_batch]
+        for _ in range(steps):
+            # Softmax交叉熵對logits的梯度
+            logits = X_batch @ self.weights + self.bias
+            exp_logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+            grad = (exp_logits / exp_logits.sum(axis=1, keepdims=True) - Y) / len(y_batch)
+            self.weights -= learning_rate * (X_batch.T @ grad + l2 * self.weights)
+            self.bias -= learning_rate * grad.sum(axis=0)
+        
+        self.replay_buffer.add(features, labels)
+        self.update_count += 1
+        self.is_trained = True
+        
+        logits = ((features - self.scaler_mean) / self.scaler_std) @ self.weights + self.bias
+        return float(np.mean(np.argmax(logits, axis=1) == labels))
+    
     def predict(self, sequence):
         """預測單個序列"""
         if not self.is_trained:
@@ -207,6 +254,14 @@ class SimpleParkinsonModel:
             'bias': self.bias.tolist(),
             'scaler_mean': self.scaler_mean.tolist(),
             'scaler_std': self.scaler_std.tolist(),
+            'incremental_state': {
+                'feature_count': int(self.feature_count),
+                'feature_mean': self.feature_mean.tolist() if self.feature_mean is not None else None,
+                'feature_m2': self.feature_m2.tolist() if self.feature_m2 is not None else None,
+                'update_count': self.update_count,
+                'replay_buffer': {key: np.asarray(value).tolist()
+                                  for key, value in self.replay_buffer.get_state().items()}
+            },
             'metadata': {
                 'model_type': 'simple_linear_classifier',
                 'input_shape': [50, 9],
@@ -235,6 +290,21 @@ class SimpleParkinsonModel:
             self.scaler_std = np.array(model_data['scaler_std'])
             self.is_trained = True
             
+            # 增量狀態
+            state = model_data.get('incremental_state')
+            if state and state['feature_count']:
+                self.feature_count = state['feature_count']
+                self.feature_mean = np.array(state['feature_mean'])
+                self.feature_m2 = np.array(state['feature_m2'])
+                self.update_count = state['update_count']
+                self.replay_buffer = RehearsalBuffer.from_state(state['replay_buffer'])
+            else:
+                # 舊版模型文件: 把保存的標準化參數視為一個緩衝區容量的樣本統計，
+                # 避免第一次 partial_fit 只用幾個樣本的方差替換它
+                self.feature_count = self.replay_buffer.capacity
+                self.feature_mean = self.scaler_mean.astype(np.float64)
+                self.feature_m2 = (self.scaler_std - 1e-8) ** 2 * self.feature_count
+            
             print(f"[SUCCESS] 模型已加載: {filepath}")
             return True
             
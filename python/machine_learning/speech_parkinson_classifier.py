@@ -8,6 +8,7 @@ import json
 import os
 from datetime import datetime
 from speech_feature_extractor import LightweightSpeechFeatureExtractor, create_synthetic_speech_data
+from linear_engine import LinearModelEngine, grid_search
 
 class SpeechParkinsonClassifier:
     """
@@ -23,13 +24,17 @@ class SpeechParkinsonClassifier:
         self.is_trained = False
         self.feature_extractor = LightweightSpeechFeatureExtractor()
         
-    def train(self, X, y, epochs=200, learning_rate=0.01):
+    def train(self, X, y, epochs=200, learning_rate=0.01, optimizer='lbfgs', l2=1e-4):
         """
         训练二分类模型
         
         Args:
             X: 特征矩阵 (n_samples, 8)
             y: 标签向量 (n_samples,) - 0: 健康, 1: 帕金森
+            epochs: 最大训练轮数
+            learning_rate: adam/gd 的学习率
+            optimizer: 'lbfgs'、'adam' 或 'gd' (见 LinearModelEngine)
+            l2: L2正则化系数
         """
         print("[INFO] 训练语音帕金森分类器...")
         
@@ -41,45 +46,61 @@ class SpeechParkinsonClassifier:
         self.scaler_std = np.std(X, axis=0) + 1e-8
         X_normalized = (X - self.scaler_mean) / self.scaler_std
         
-        # 初始化参数
-        n_features = X.shape[1]
-        self.weights = np.random.normal(0, 0.1, n_features)
-        self.bias = 0.0
-        
-        # 训练循环
-        for epoch in range(epochs):
-            # 前向传播
-            z = np.dot(X_normalized, self.weights) + self.bias
-            predictions = 1 / (1 + np.exp(-z))  # Sigmoid
-            
-            # 计算损失
-            loss = -np.mean(y * np.log(predictions + 1e-8) + 
-                          (1 - y) * np.log(1 - predictions + 1e-8))
-            
-            # 反向传播
-            dz = predictions - y
-            dw = np.dot(X_normalized.T, dz) / len(y)
-            db = np.mean(dz)
-            
-            # 更新参数
-            self.weights -= learning_rate * dw
-            self.bias -= learning_rate * db
-            
-            # 计算准确率
-            if epoch % 50 == 0:
-                pred_labels = (predictions > 0.5).astype(int)
-                accuracy = np.mean(pred_labels == y)
-                print(f"Epoch {epoch}: Loss={loss:.4f}, Accuracy={accuracy:.4f}")
+        # 逻辑回归 (共用训练引擎)
+        engine = LinearModelEngine(loss='logistic', optimizer=optimizer, l2=l2,
+                                   learning_rate=learning_rate, max_epochs=epochs)
+        engine.fit(X_normalized, y)
         
+        self.weights = engine.weights
+        self.bias = engine.bias
         self.is_trained = True
         
         # 最终评估
-        final_predictions = (predictions > 0.5).astype(int)
+        final_predictions = engine.predict(X_normalized)
         final_accuracy = np.mean(final_predictions == y)
         print(f"[SUCCESS] 训练完成! 最终准确率: {final_accuracy:.4f}")
         
         return final_accuracy
     
+    def train_grid(self, X, y, learning_rates=(0.001, 0.003, 0.01, 0.03, 0.1),
+                   l2_values=(1e-5, 1e-4, 1e-3, 1e-2), epochs=200, cv_folds=5):
+        """
+        批次超参数网格训练，按交叉验证损失选出最佳学习率和正则化系数
+        
+        Args:
+            X: 特征矩阵 (n_samples, 8)
+            y: 标签向量 (n_samples,) - 0: 健康, 1: 帕金森
+            learning_rates: 学习率候选
+            l2_values: L2正则化系数候选
+            epochs: 训练轮数
+            cv_folds: 交叉验证折数
+            
+        Returns:
+            grid_search 的结果字典
+        """
+        print("[INFO] 网格训练语音帕金森分类器...")
+        
+        X = np.array(X, dtype=np.float32)
+        y = np.array(y, dtype=np.float32)
+        
+        # 特征标准化
+        self.scaler_mean = np.mean(X, axis=0)
+        self.scaler_std = np.std(X, axis=0) + 1e-8
+        X_normalized = (X - self.scaler_mean) / self.scaler_std
+        
+        result = grid_search(X_normalized, y, learning_rates, l2_values, loss='logistic',
+                             optimizer='adam', epochs=epochs, cv_folds=cv_folds)
+        
+        self.weights = result['weights']
+        self.bias = result['bias']
+        self.is_trained = True
+        
+        z = np.dot(X_normalized, self.weights) + self.bias
+        final_accuracy = np.mean((z > 0).astype(int) == y)
+        print(f"[SUCCESS] 网格训练完成! 最终准确率: {final_accuracy:.4f}")
+        
+        return result
+    
     def predict(self, features):
         """
         预测单个样本
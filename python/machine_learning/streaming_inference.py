@@ -0,0 +1,389 @@
+"""
+CNN-LSTM 流式推理
+實時採集時相鄰窗口重疊 sequence_length - 1 個樣本，逐窗口推理會重複計算全部卷積和
+LSTM 時間步。這裡把 NumpyInferenceEngine 的層圖改為逐樣本執行: 卷積和池化層只保留
+感受野大小的環形緩衝區，LSTM/GRU 跨步長攜帶狀態，全局平均池化維護滑動和，
+每個樣本的計算量與窗口長度無關
+"""
+
+import copy
+import time
+import numpy as np
+
+try:
+    from .numpy_engine import NumpyInferenceEngine, _lstm_cell, _gru_cell, _gru_biases, ACTIVATIONS
+except ImportError:
+    from numpy_engine import NumpyInferenceEngine, _lstm_cell, _gru_cell, _gru_biases, ACTIVATIONS
+
+# 逐時間步獨立計算、不需要狀態的層
+STEPWISE_LAYERS = ('BatchNormalization', 'Dropout', 'Dense', 'Multiply', 'Activation')
+
+
+def _output_length(length, span, strides, padding):
+    """整窗推理時卷積/池化層的輸出長度 (與 _conv1d、_max_pool1d 相同)"""
+    if padding == 'valid':
+        return (length - span) // strides + 1
+    return -(-length // strides)
+
+
+def _left_padding(length, span, strides, padding):
+    """整窗推理時卷積/池化層的左側填充"""
+    if padding == 'valid':
+        return 0
+    if padding == 'causal':
+        return span - 1
+    out_length = _output_length(length, span, strides, padding)
+    return max((out_length - 1) * strides + span - length, 0) // 2
+
+
+class _WindowStream:
+    """
+    卷積/池化層的流式狀態
+
+    緩衝區保存最近 span 個輸入時間步 (初始為填充值，對應數據流開頭的填充)。
+    輸出 j 覆蓋輸入 j*strides - left 到 j*strides - left + span - 1，因此在輸入
+    j*strides + right 到達時計算，right = span - 1 - left 即該層的延遲。
+    """
+
+    def __init__(self, span, strides, left, padding, channels, pad_value):
+        self.strides = strides
+        self.right = span - 1 - left
+        # 'same' 填充在窗口右端補 right 個填充值；'valid'/'causal' 右端沒有填充
+        self.tail_steps = self.right if padding == 'same' else 0
+        self.pad_value = pad_value
+        self.buffer = np.full((span, channels), pad_value, dtype=np.float32)
+        self.count = 0
+
+    def _compute(self):
+        raise NotImplementedError
+
+    def push(self, x):
+        """輸入一個時間步 (1, C)，返回輸出時間步或 None"""
+        self.buffer = np.concatenate((self.buffer[1:], x))
+        self.count += 1
+        position = self.count - 1 - self.right
+        if position < 0 or position % self.strides:
+            return None
+        return self._compute()
+
+    def peek(self, steps):
+        """
+        在狀態副本上追加上游的臨時時間步並補齊右端填充，返回 (輸出時間步列表, None)；
+        用於把數據流當作在最新樣本處結束的窗口計算，不改變狀態
+        """
+        clone = copy.copy(self)
+        outputs = [clone.push(x) for x in steps]
+        pad = np.full((1, self.buffer.shape[1]), self.pad_value, dtype=np.float32)
+        outputs += [clone.push(pad) for _ in range(self.tail_steps)]
+        return [out for out in outputs if out is not None], None
+
+
+class _ConvStream(_WindowStream):
+    def __init__(self, spec, weights, length):
+        kernel, self.bias = weights
+        self.kernel = kernel
+        self.dilation = spec['dilation_rate']
+        self.activation = ACTIVATIONS[spec['activation']]
+        span = (kernel.shape[0] - 1) * self.dilation + 1
+        left = _left_padding(length, span, spec['strides'], spec['padding'])
+        super().__init__(span, spec['strides'], left, spec['padding'], kernel.shape[1], 0.0)
+
+    def _compute(self):
+        taps = self.buffer[::self.dilation]
+        out = np.tensordot(taps, self.kernel, axes=([0, 1], [0, 1])) + self.bias
+        return self.activation(out[None].astype(np.float32, copy=False))
+
+
+class _PoolStream(_WindowStream):
+    def __init__(self, spec, channels, length):
+        span = spec['pool_size']
+        left = _left_padding(length, span, spec['strides'], spec['padding'])
+        super().__init__(span, spec['strides'], left, spec['padding'], channels, -np.inf)
+
+    def _compute(self):
+        return self.buffer.max(axis=0, keepdims=True)
+
+
+class _RecurrentStream:
+    """LSTM/GRU 的流式狀態: 隱藏狀態跨步長攜帶，不在每個窗口開頭清零"""
+
+    def __init__(self, spec, weights):
+        self.spec = spec
+        kernel, self.recurrent_kernel, bias = weights
+        self.kernel = kernel
+        if spec['type'] == 'GRU':
+            self.bias, self.recurrent_bias = _gru_biases(bias, spec)
+        else:
+            self.bias, self.recurrent_bias = bias, None
+        self.h = np.zeros((1, spec['units']), dtype=np.float32)
+        self.c = np.zeros_like(self.h)
+
+    @property
+    def value(self):
+        return self.h
+
+    def push(self, x):
+        projected = x @ self.kernel + self.bias
+        if self.spec['type'] == 'LSTM':
+            self.h, self.c = _lstm_cell(projected, self.h, self.c, self.recurrent_kernel, self.spec)
+        else:
+            self.h = _gru_cell(projected, self.h, self.recurrent_kernel, self.recurrent_bias, self.spec)
+        return self.h if self.spec['return_sequences'] else None
+
+    def peek(self, steps):
+        clone = copy.copy(self)
+        outputs = [clone.push(x) for x in steps]
+        return [out for out in outputs if out is not None], clone.value
+
+
+class _RunningMean:
+    """全局平均池化的流式狀態: 最近 length 個時間步的環形緩衝區和滑動和"""
+
+    def __init__(self, channels, length):
+        self.length = length
+        self.buffer = np.zeros((length, channels), dtype=np.float32)
+        self.total = np.zeros((1, channels), dtype=np.float64)
+        self.position = 0
+
+    @property
+    def value(self):
+        return (self.total / self.length).astype(np.float32)
+
+    def push(self, x):
+        self.total += x.astype(np.float64) - self.buffer[self.position]
+        self.buffer[self.position] = x[0]
+        self.position = (self.position + 1) % self.length
+        return None
+
+    def peek(self, steps):
+        # 追加的時間步替換最舊的 len(steps) 個時間步，不複製緩衝區
+        total = self.total.copy()
+        for i, x in enumerate(steps):
+            total += x.astype(np.float64) - self.buffer[(self.position + i) % self.length]
+        return [], (total / self.length).astype(np.float32)
+
+
+class StreamingInference:
+    """
+    逐樣本流式推理
+
+    每個新樣本只推進各層的一個時間步 (池化後的層按步長降頻)。預測時在狀態副本上
+    補齊 'same' 卷積的右端填充，結果對應以最新樣本結尾的窗口，沒有額外延遲。
+    與整窗推理的差別在於窗口左端: LSTM/GRU 的狀態和卷積的歷史來自窗口之前的數據
+    而不是零，池化的相位以數據流開頭對齊。數據流的第一個窗口與整窗推理一致，
+    之後的偏差用 validate 在實際會話上檢查。
+    """
+
+    def __init__(self, engine, hop=1, scaled=False):
+        """
+        初始化流式推理
+
+        Args:
+            engine: NumpyInferenceEngine 或其 .npz 模型路徑
+            hop: 每隔多少個樣本輸出一次預測
+            scaled: 樣本是否已標準化 (否則使用導出的標準化參數)
+        """
+        if isinstance(engine, str):
+            engine = NumpyInferenceEngine(engine)
+        if not scaled and engine.mean is None:
+            raise ValueError("導出的模型不包含標準化參數，請傳入已標準化的樣本")
+
+        self.engine = engine
+        self.hop = max(1, hop)
+        self.scaled = scaled
+        self.sequence_length = engine.sequence_length
+        self.feature_dim = engine.feature_dim
+        self._plan()
+        self.reset()
+
+    def _plan(self):
+        """把層圖分為逐樣本執行的時序部分和每次預測執行一次的靜態部分"""
+        lengths, channels = {}, {}
+        self._sequence, self._static = [], []
+        for spec in self.engine.layers:
+            kind, name = spec['type'], spec['name']
+            if kind == 'InputLayer':
+                lengths[name], channels[name] = self.sequence_length, self.feature_dim
+                continue
+
+            in_lengths = [lengths[n] for n in spec['inputs']]
+            if all(length is None for length in in_lengths):
+                lengths[name] = None
+                self._static.append(spec)
+                continue
+            if any(length is None for length in in_lengths) or len(set(in_lengths)) > 1:
+                raise ValueError(f"流式推理不支持時間長度不同的輸入: {name}")
+
+            length = in_lengths[0]
+            weights = self.engine._weights(spec)
+            if kind == 'Conv1D':
+                span = (weights[0].shape[0] - 1) * spec['dilation_rate'] + 1
+                lengths[name] = _output_length(length, span, spec['strides'], spec['padding'])
+                channels[name] = weights[0].shape[2]
+            elif kind == 'MaxPooling1D':
+                lengths[name] = _output_length(length, spec['pool_size'], spec['strides'], spec['padding'])
+                channels[name] = channels[spec['inputs'][0]]
+            elif kind in ('LSTM', 'GRU'):
+                if spec['go_backwards']:
+                    raise ValueError(f"流式推理不支持反向的循環層: {name}")
+                lengths[name] = length if spec['return_sequences'] else None
+                channels[name] = spec['units']
+            elif kind == 'GlobalAveragePooling1D':
+                lengths[name] = None
+                channels[name] = channels[spec['inputs'][0]]
+            elif kind in STEPWISE_LAYERS:
+                lengths[name] = length
+                channels[name] = weights[0].shape[-1] if kind == 'Dense' else channels[spec['inputs'][0]]
+            else:
+                raise ValueError(f"流式推理不支持的層: {name} ({kind})")
+            self._sequence.append((spec, length))
+        self._channels = channels
+
+    def reset(self):
+        """清空所有緩衝區和循環狀態 (開始新的數據流)"""
+        self.states = {}
+        for spec, length in self._sequence:
+            name, kind = spec['name'], spec['type']
+            if kind == 'Conv1D':
+                self.states[name] = _ConvStream(spec, self.engine._weights(spec), length)
+            elif kind == 'MaxPooling1D':
+                self.states[name] = _PoolStream(spec, self._channels[spec['inputs'][0]], length)
+            elif kind in ('LSTM', 'GRU'):
+                self.states[name] = _RecurrentStream(spec, self.engine._weights(spec))
+            elif kind == 'GlobalAveragePooling1D':
+                self.states[name] = _RunningMean(self._channels[name], length)
+        self.samples_seen = 0
+
+    def _step_layer(self, spec, inputs):
+        """逐時間步的層"""
+        return self.engine.apply_layer(spec, inputs).astype(np.float32, copy=False)
+
+    def _advance(self, x):
+        """把一個已標準化的樣本 (1, feature_dim) 推進時序部分"""
+        steps = {self.engine.layers[0]['name']: x}
+        for spec, _ in self._sequence:
+            if any(n not in steps for n in spec['inputs']):
+                continue
+            inputs = [steps[n] for n in spec['inputs']]
+            state = self.states.get(spec['name'])
+            out = state.push(inputs[0]) if state is not None else self._step_layer(spec, inputs)
+            if out is not None:
+                steps[spec['name']] = out
+
+    def predict(self):
+        """
+        以最新樣本結尾的窗口的預測概率 (類別數,)
+
+        只在狀態副本上計算右端填充的幾個時間步和靜態部分，代價與窗口長度無關
+        """
+        pending = {self.engine.layers[0]['name']: []}
+        values = {}
+        for spec, _ in self._sequence:
+            name = spec['name']
+            inputs = [pending[n] for n in spec['inputs']]
+            state = self.states.get(name)
+            if state is None:
+                pending[name] = [self._step_layer(spec, list(step)) for step in zip(*inputs)]
+            else:
+                pending[name], value = state.peek(inputs[0])
+                if value is not None:
+                    values[name] = value
+
+        for spec in self._static:
+            values[spec['name']] = self._step_layer(spec, [values[n] for n in spec['inputs']])
+        return values[self.engine.outputs[0]][0]
+
+    def update(self, sample):
+        """
+        輸入一個原始樣本
+
+        Args:
+            sample: (feature_dim,) 傳感器樣本
+
+        Returns:
+            每 hop 個樣本 (收滿第一個窗口之後) 返回預測結果字典，否則返回 None
+        """
+        x = np.asarray(sample, dtype=np.float32).reshape(1, self.feature_dim)
+        if not self.scaled:
+            x = (x - self.engine.mean) / self.engine.scale
+        self._advance(x)
+        self.samples_seen += 1
+
+        ready = self.samples_seen - self.sequence_length
+        if ready < 0 or ready % self.hop:
+            return None
+        probabilities = self.predict()
+        return {
+            'sample_index': self.samples_seen - 1,
+            'predicted_level': int(np.argmax(probabilities)) + 1,
+            'confidence': float(np.max(probabilities)),
+            'all_probabilities': probabilities.tolist()
+        }
+
+    def process(self, samples):
+        """逐樣本處理一段數據 (樣本數, feature_dim)，返回期間輸出的預測結果列表"""
+        results = []
+        for sample in np.asarray(samples, dtype=np.float32):
+            result = self.update(sample)
+            if result is not None:
+                results.append(result)
+        return results
+
+    def validate(self, session, tolerance=0.05, max_timed_windows=50):
+        """
+        在會話上與整窗推理比較
+
+        從頭流式處理會話，在每個輸出點用 engine.predict 重新計算以同一樣本結尾的
+        完整窗口，比較兩者的概率和等級，並比較每個樣本的流式代價與逐窗口推理的代價。
+
+        Args:
+            session: 原始會話數據 (樣本數, feature_dim)
+            tolerance: 概率最大絕對誤差的容許值
+            max_timed_windows: 計時逐窗口推理時使用的窗口數
+
+        Returns:
+            dict: num_windows、max_abs_diff、mean_abs_diff、level_agreement、within_tolerance
+                  (最大誤差不超過容許值)、fraction_within_tolerance、stream_ms_per_sample、
+                  window_ms_per_prediction
+        """
+        session = np.asarray(session, dtype=np.float32)
+        if len(session) < self.sequence_length:
+            raise ValueError(f"會話長度不足 {self.sequence_length} 個樣本")
+
+        self.reset()
+        start = time.perf_counter()
+        results = self.process(session)
+        stream_time = time.perf_counter() - start
+
+        ends = np.array([r['sample_index'] for r in results])
+        windows = np.lib.stride_tricks.sliding_window_view(session, self.sequence_length, axis=0)
+        windows = windows.transpose(0, 2, 1)[ends - self.sequence_length + 1]
+        streamed = np.array([r['all_probabilities'] for r in results], dtype=np.float32)
+        full = self.engine.predict(windows, scaled=self.scaled)
+
+        start = time.perf_counter()
+        timed = windows[:max_timed_windows]
+        for window in timed:
+            self.engine.predict(window, scaled=self.scaled)
+        window_time = (time.perf_counter() - start) / max(len(timed), 1)
+
+        diff = np.abs(streamed - full)
+        window_diff = diff.max(axis=1)
+        summary = {
+            'num_windows': int(len(results)),
+            'max_abs_diff': float(diff.max()),
+            'mean_abs_diff': float(diff.mean()),
+            'level_agreement': float(np.mean(np.argmax(streamed, axis=1) == np.argmax(full, axis=1))),
+            'within_tolerance': bool(window_diff.max() <= tolerance),
+            'fraction_within_tolerance': float(np.mean(window_diff <= tolerance)),
+            'stream_ms_per_sample': stream_time / len(session) * 1000,
+            'window_ms_per_prediction': window_time * 1000
+        }
+
+        print(f"流式與整窗推理比較 ({summary['num_windows']} 個窗口):")
+        print(f"  概率最大誤差 {summary['max_abs_diff']:.4f}，平均誤差 {summary['mean_abs_diff']:.5f}，"
+              f"等級一致率 {summary['level_agreement']:.2%}")
+        print(f"  誤差不超過 {tolerance} 的窗口 {summary['fraction_within_tolerance']:.2%}")
+        print(f"  流式每樣本 {summary['stream_ms_per_sample']:.3f} ms，"
+              f"整窗每次預測 {summary['window_ms_per_prediction']:.3f} ms")
+        return summary
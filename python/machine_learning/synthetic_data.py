@@ -0,0 +1,268 @@
+"""
+合成傳感器數據生成
+以向量化方式生成 (N, T, C) 的震顫/僵硬/協調性信號，可按分片並行寫入磁碟，
+用於各個處理階段在1千到1千萬窗口規模下的確定性壓力測試
+"""
+
+import json
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+PROFILES = ('sensor', 'demo')
+
+
+class SyntheticSensorGenerator:
+    """
+    帶種子的合成傳感器數據生成器
+
+    sensor: 原 SimpleParkinsonModel.create_synthetic_data 的語義，
+            手指=僵硬+震顫正弦，EMG=僵硬，IMU=協調性+震顫餘弦
+    demo:   原 create_demo_model.generate_synthetic_data 的語義，
+            等級相關的基線+高頻震顫噪音+低頻協調性波動
+
+    每個分片使用 (seed, 分片序號) 派生的獨立隨機流，因此同一分片的內容與
+    進程數和生成順序無關。
+    """
+
+    def __init__(self, sequence_length=50, feature_dim=9, profile='sensor', seed=42):
+        """
+        初始化生成器
+
+        Args:
+            sequence_length: 每個窗口的時間點數
+            feature_dim: 特徵維度 (5個手指 + EMG + 3軸IMU)
+            profile: 信號模型 ('sensor' 或 'demo')
+            seed: 隨機種子，None表示不固定
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"未知的信號模型: {profile}")
+        if feature_dim != 9:
+            raise ValueError("合成數據的特徵順序固定為 5個手指 + EMG + 3軸IMU")
+
+        self.sequence_length = sequence_length
+        self.feature_dim = feature_dim
+        self.profile = profile
+        self.seed = seed
+
+    def _rng(self, shard_index=None):
+        """返回隨機數生成器 (分片使用獨立派生的隨機流)"""
+        if self.seed is None:
+            return np.random.default_rng()
+        if shard_index is None:
+            return np.random.default_rng(self.seed)
+        return np.random.default_rng([self.seed, shard_index])
+
+    def generate(self, num_samples=1000, rng=None):
+        """
+        生成一批合成窗口 (每個等級 num_samples // 5 個，按等級順序排列)
+
+        Args:
+            num_samples: 窗口總數
+            rng: 可選的 numpy Generator
+
+        Returns:
+            (X, y): X 為 (N, T, 9) float32，y 為 0-4 的int32標籤
+        """
+        rng = rng if rng is not None else self._rng()
+        y = np.repeat(np.arange(5, dtype=np.int32), num_samples // 5)
+
+        if self.profile == 'sensor':
+            X = self._sensor_signals(y, rng)
+        else:
+            X = self._demo_signals(y, rng)
+
+        return X, y
+
+    def _sensor_signals(self, y, rng):
+        """震顫/僵硬/協調性模型"""
+        N, T = len(y), self.sequence_length
+        level = y.astype(np.float32)[:, None, None]
+        t = np.arange(T, dtype=np.float32)[None, :, None]
+
+        tremor = level * 0.2 + 0.1
+        stiffness = level * 0.15 + 0.05
+        coordination = (4 - level) * 0.2 + 0.1
+
+        # 全程使用float32，大批次時內存減半
+        X = np.empty((N, T, 9), dtype=np.float32)
+
+        finger_phase = np.arange(5, dtype=np.float32)[None, None, :]
+        fingers = stiffness + 0.1 * rng.standard_normal((N, T, 5), dtype=np.float32) + tremor * np.sin(t * 0.5 + finger_phase)
+        X[:, :, 0:5] = np.clip(fingers, 0, 1)
+
+        emg = stiffness + 0.05 * rng.standard_normal((N, T, 1), dtype=np.float32)
+        X[:, :, 5:6] = np.clip(emg, 0, 1)
+
+        axis_phase = np.arange(3, dtype=np.float32)[None, None, :]
+        imu = coordination + tremor * np.cos(t * 0.3 + axis_phase) + 0.08 * rng.standard_normal((N, T, 3), dtype=np.float32)
+        X[:, :, 6:9] = np.clip(imu, -1, 1)
+
+        return X
+
+    def _demo_signals(self, y, rng):
+        """演示模型的等級基線+震顫+協調性波動模型"""
+        N, T = len(y), self.sequence_length
+        level = y.astype(np.float32)[:, None, None]
+
+        # 等級0-4的基線均值和標準差
+        base_mean = (level + 1) * 0.2
+        base_std = 0.1 + level * 0.05
+        base = base_mean + base_std * rng.standard_normal((N, T, 9), dtype=np.float32)
+
+        tremor = level * 0.1 * rng.standard_normal((N, T, 9), dtype=np.float32)
+        coordination = np.sin(np.linspace(0, 4 * np.pi, T, dtype=np.float32))[None, :, None] * (level * 0.05)
+
+        return np.clip(base + tremor + coordination, 0, 1).astype(np.float32)
+
+    def generate_shard(self, shard_index, shard_size):
+        """生成單個分片 (內容只由種子和分片序號決定)"""
+        return self.generate(shard_size, rng=self._rng(shard_index))
+
+    def write_shards(self, output_dir, num_windows, shard_size=100000, num_workers=None,
+                     file_format='npy', windows_per_session=20, sample_rate=100.0):
+        """
+        並行生成並寫入分片
+
+        Args:
+            output_dir: 輸出目錄
+            num_windows: 窗口總數 (按5的倍數向下取整)
+            shard_size: 每個分片的窗口數
+            num_workers: 進程數，None使用CPU核心數，1表示在當前進程中生成
+            file_format: 'npy' 寫入可內存映射的 X/y 數組；'json' 寫入與數據收集器相同格式的會話文件
+            windows_per_session: json格式下每個會話包含的窗口數
+            sample_rate: json格式下時間戳的採樣率 (Hz)
+
+        Returns:
+            manifest 字典 (同時寫入 output_dir/manifest.json)
+        """
+        if file_format not in ('npy', 'json'):
+            raise ValueError(f"未知的文件格式: {file_format}")
+
+        os.makedirs(output_dir, exist_ok=True)
+        shard_size = max(5, shard_size - shard_size % 5)
+        num_windows -= num_windows % 5
+
+        tasks = []
+        for shard_index, start in enumerate(range(0, num_windows, shard_size)):
+            size = min(shard_size, num_windows - start)
+            tasks.append((self.sequence_length, self.feature_dim, self.profile, self.seed,
+                          output_dir, shard_index, size, file_format, windows_per_session, sample_rate))
+
+        start_time = time.perf_counter()
+        if num_workers == 1 or len(tasks) <= 1:
+            shards = [_write_shard(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                shards = list(executor.map(_write_shard, tasks))
+        elapsed = time.perf_counter() - start_time
+
+        manifest = {
+            'profile': self.profile,
+            'seed': self.seed,
+            'sequence_length': self.sequence_length,
+            'feature_dim': self.feature_dim,
+            'num_windows': num_windows,
+            'file_format': file_format,
+            'shards': shards
+        }
+        with open(os.path.join(output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+        print(f"已生成 {num_windows} 個窗口 ({len(shards)} 個分片) 至 {output_dir}，"
+              f"耗時 {elapsed:.2f} 秒 ({num_windows / max(elapsed, 1e-9):.0f} 窗口/秒)")
+        return manifest
+
+
+def _write_shard(task):
+    """在工作進程中生成並寫入一個分片"""
+    (sequence_length, feature_dim, profile, seed, output_dir,
+     shard_index, size, file_format, windows_per_session, sample_rate) = task
+
+    generator = SyntheticSensorGenerator(sequence_length, feature_dim, profile, seed)
+    X, y = generator.generate_shard(shard_index, size)
+
+    if file_format == 'npy':
+        x_path = os.path.join(output_dir, f"shard_{shard_index:05d}_X.npy")
+        y_path = os.path.join(output_dir, f"shard_{shard_index:05d}_y.npy")
+        np.save(x_path, X)
+        np.save(y_path, y)
+        return {'shard_index': shard_index, 'num_windows': int(size),
+                'files': [os.path.basename(x_path), os.path.basename(y_path)]}
+
+    # json: 同等級的連續窗口拼接為一個會話
+    files = []
+    for level in range(5):
+        level_windows = X[y == level]
+        for session_index, start in enumerate(range(0, len(level_windows), windows_per_session)):
+            samples = level_windows[start:start + windows_per_session].reshape(-1, feature_dim)
+            timestamps = np.arange(len(samples)) / sample_rate
+            # 每5個會話歸屬同一個合成患者，便於按患者分組
+            patient_id = f"SYN{shard_index:05d}_{level}_{session_index // 5:04d}"
+
+            data_points = [
+                {
+                    'timestamp': float(timestamp),
+                    'fingers': row[0:5].tolist(),
+                    'emg': float(row[5]),
+                    'imu': row[6:9].tolist()
+                }
+                for timestamp, row in zip(timestamps, samples.astype(np.float64))
+            ]
+            session = {
+                'patient_id': patient_id,
+                'parkinson_level': level + 1,
+                'start_time': 0.0,
+                'data': data_points
+            }
+
+            filename = f"synthetic_{shard_index:05d}_{level}_{session_index:04d}.json"
+            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+                json.dump(session, f)
+            files.append(filename)
+
+    return {'shard_index': shard_index, 'num_windows': int(size), 'files': files}
+
+
+def iter_shards(output_dir, mmap=True):
+    """
+    依次讀取 npy 分片
+
+    Args:
+        output_dir: write_shards 的輸出目錄
+        mmap: 是否以內存映射方式讀取
+
+    Yields:
+        (X, y)
+    """
+    with open(os.path.join(output_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest['file_format'] != 'npy':
+        raise ValueError("只有npy格式的分片可以直接讀取")
+
+    mmap_mode = 'r' if mmap else None
+    for shard in manifest['shards']:
+        x_file, y_file = shard['files']
+        yield (np.load(os.path.join(output_dir, x_file), mmap_mode=mmap_mode),
+               np.load(os.path.join(output_dir, y_file), mmap_mode=mmap_mode))
+
+
+def main():
+    """測試不同規模下的生成速度"""
+    generator = SyntheticSensorGenerator(seed=42)
+
+    print("向量化生成速度:")
+    for num_samples in [1000, 10000, 100000]:
+        start_time = time.perf_counter()
+        X, y = generator.generate(num_samples)
+        elapsed = time.perf_counter() - start_time
+        print(f"  {num_samples:>7} 個窗口: {elapsed * 1000:8.1f} ms  {X.shape}")
+
+    # 分片寫入 (確定性: 相同種子和分片大小得到相同文件)
+    generator.write_shards("data/synthetic", 100000, shard_size=20000)
+
+
+if __name__ == "__main__":
+    main()